@@ -1,5 +1,6 @@
 import base64
 import gzip
+import hashlib
 import json
 import logging
 import re
@@ -7,11 +8,18 @@ from collections import defaultdict
 from dataclasses import dataclass
 from typing import List, Any, Union, Optional, Tuple, Mapping, Iterator, Set, Iterable
 
-from publish.unittestresults import Numeric, UnitTestCaseResults, UnitTestRunResults, \
-    UnitTestRunDeltaResults, UnitTestRunResultsOrDeltaResults, ParseError
+from publish.unittestresults import Numeric, UnitTestCase, UnitTestCaseResults, UnitTestRunResults, \
+    UnitTestRunDeltaResults, UnitTestRunResultsOrDeltaResults, ParseError, FrozenSlots, get_test_name, \
+    write_varint, read_varints
 
 logger = logging.getLogger('publish')
 digest_prefix = '[test-results]:data:application/gzip;base64,'
+# version 2 of the digest adds the ids of all tests and of skipped tests
+digest_version = 2
+# GitHub limits the summary of a check run to this many characters
+max_summary_length = 65535
+# lower bound of the number of digest characters that the id of a test takes
+min_digest_test_id_length = 9
 digit_space = '  '
 punctuation_space = ' '
 
@@ -33,6 +41,33 @@ fail_on_modes = [
     fail_on_mode_failures
 ]
 
+mode_publish = 'publish'
+mode_prepare = 'prepare'
+mode_merge = 'merge'
+modes = [
+    mode_publish,
+    mode_prepare,
+    mode_merge
+]
+
+test_list_encoding_plain = 'plain'
+test_list_encoding_front_coded = 'front-coded'
+test_list_encoding_gzip = 'gzip'
+test_list_encoding_delta = 'delta'
+test_list_encodings = [
+    test_list_encoding_plain,
+    test_list_encoding_front_coded,
+    test_list_encoding_gzip,
+    test_list_encoding_delta
+]
+# titles of test list annotations end with the marker of their encoding, plain lists have none
+test_list_encoding_markers = {
+    test_list_encoding_plain: '',
+    test_list_encoding_front_coded: ' [front-coded]',
+    test_list_encoding_gzip: ' [gzip]',
+    test_list_encoding_delta: ' [delta]'
+}
+
 hide_comments_mode_off = 'off'
 hide_comments_mode_all_but_latest = 'all but latest'
 hide_comments_mode_orphaned = 'orphaned commits'
@@ -66,6 +101,14 @@ class CaseMessages(defaultdict):
         )
 
 
+def get_test_id(test_name: str) -> int:
+    """
+    Returns a stable 64-bit id of the given test name as returned by get_test_name.
+    Ids are the same across runs and Python processes, unlike hash(test_name).
+    """
+    return int.from_bytes(hashlib.blake2b(test_name.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
 class SomeTestChanges:
     def __init__(self,
                  all_tests_before: Optional[List[str]],
@@ -76,6 +119,36 @@ class SomeTestChanges:
         self._all_tests_current = set(all_tests_current) if all_tests_current is not None else None
         self._skipped_tests_before = set(skipped_tests_before) if skipped_tests_before is not None else None
         self._skipped_tests_current = set(skipped_tests_current) if skipped_tests_current is not None else None
+        # number of tests of the earlier commit whose names are not known
+        self._unknown_tests_before = 0
+
+    @staticmethod
+    def from_test_ids(all_test_ids_before: Optional[Set[int]],
+                      all_tests_current: Optional[List[str]],
+                      skipped_test_ids_before: Optional[Set[int]],
+                      skipped_tests_current: Optional[List[str]]) -> 'SomeTestChanges':
+        """
+        Compares ids of tests of the earlier commit, as read from its digest, with test lists of the current commit.
+        Ids are resolved to names of current tests, names of tests that exist only in the earlier commit
+        are not known, see has_names.
+        """
+        # only current tests are hashed, set operations then run on their names
+        names = {get_test_id(test): test for tests in [all_tests_current or [], skipped_tests_current or []] for test in tests}
+
+        def to_names(test_ids: Optional[Set[int]]) -> Optional[List[str]]:
+            if test_ids is None:
+                return None
+            return [names[test_id] for test_id in test_ids if test_id in names]
+
+        changes = SomeTestChanges(to_names(all_test_ids_before), all_tests_current,
+                                  to_names(skipped_test_ids_before), skipped_tests_current)
+        if all_test_ids_before is not None:
+            changes._unknown_tests_before = len(all_test_ids_before) - len(changes._all_tests_before)
+        return changes
+
+    def has_names(self) -> bool:
+        """Returns True if the names of all tests of the earlier commit are known, otherwise removed tests are not provided."""
+        return self._unknown_tests_before == 0
 
     def adds(self) -> Optional[Set[str]]:
         if self._all_tests_before is None or self._all_tests_current is None:
@@ -320,9 +393,55 @@ def ungest_string(string: str) -> str:
     return str(gzip.decompress(base64.decodebytes(bytes(string, 'utf8'))), 'utf8')
 
 
-def get_digest_from_stats(stats: UnitTestRunResults) -> str:
+def get_test_ids_digest(test_ids: List[int]) -> str:
+    """Returns the given sorted test ids, as base64 encoded varints of the differences between consecutive ids."""
+    data = bytearray()
+    previous = 0
+    for test_id in test_ids:
+        write_varint(data, test_id - previous)
+        previous = test_id
+    return str(base64.b64encode(bytes(data)), 'ascii')
+
+
+def get_test_ids_from_test_ids_digest(digest: str) -> List[int]:
+    test_ids = []
+    test_id = 0
+    for delta in read_varints(base64.b64decode(digest)):
+        test_id += delta
+        test_ids.append(test_id)
+    return test_ids
+
+
+def get_subset_digest(test_ids: List[int], subset: Set[int]) -> str:
+    """Returns the subset of the given test ids, as base64 encoded bitmap over those test ids."""
+    bitmap = bytearray((len(test_ids) + 7) // 8)
+    for index, test_id in enumerate(test_ids):
+        if test_id in subset:
+            bitmap[index // 8] |= 1 << (index % 8)
+    return str(base64.b64encode(bytes(bitmap)), 'ascii')
+
+
+def get_subset_from_subset_digest(test_ids: List[int], digest: str) -> Set[int]:
+    bitmap = base64.b64decode(digest)
+    return {test_id for index, test_id in enumerate(test_ids) if bitmap[index // 8] & (1 << (index % 8))}
+
+
+def get_digest_from_stats(stats: UnitTestRunResults,
+                          all_tests: Optional[List[str]] = None,
+                          skipped_tests: Optional[List[str]] = None) -> str:
+    """
+    Provides the digest of the given stats. Given both test lists, the digest is of version 2
+    and carries the ids of those tests, which readers of version 1 ignore. Skipped tests are
+    expected to be among all tests, they are stored as one bit per test.
+    """
     d = stats.to_dict()
     del d['errors']  # we don't need errors in the digest
+    if all_tests is not None and skipped_tests is not None:
+        skipped_test_ids = {get_test_id(test) for test in skipped_tests}
+        test_ids = sorted({get_test_id(test) for test in all_tests}.union(skipped_test_ids))
+        d['version'] = digest_version
+        d['test_ids'] = get_test_ids_digest(test_ids)
+        d['skipped_tests'] = get_subset_digest(test_ids, skipped_test_ids)
     return digest_string(json.dumps(d))
 
 
@@ -330,6 +449,15 @@ def get_stats_from_digest(digest: str) -> UnitTestRunResults:
     return UnitTestRunResults.from_dict(json.loads(ungest_string(digest)))
 
 
+def get_test_ids_from_digest(digest: str) -> Tuple[Optional[Set[int]], Optional[Set[int]]]:
+    """Provides the ids of all tests and of skipped tests of a version 2 digest, None for earlier versions."""
+    d = json.loads(ungest_string(digest))
+    if d.get('version', 1) < 2:
+        return None, None
+    test_ids = get_test_ids_from_test_ids_digest(d['test_ids'])
+    return set(test_ids), get_subset_from_subset_digest(test_ids, d['skipped_tests'])
+
+
 def get_short_summary(stats: UnitTestRunResults) -> str:
     """Provides a single-line summary for the given stats."""
     perrors = len(stats.errors)
@@ -563,35 +691,83 @@ def get_long_summary_md(stats: UnitTestRunResultsOrDeltaResults,
     )
 
 
+def get_partitions_md(partitions: Optional[Mapping[str, UnitTestRunResults]]) -> str:
+    """Provides a Markdown table of the stats of each partition."""
+    if not partitions:
+        return ''
+    rows = ['|partition|tests|:heavy_check_mark:|:zzz:|:x:|:fire:|runs|:stopwatch:|',
+            '|:--|--:|--:|--:|--:|--:|--:|--:|']
+    rows.extend([f'|{partition.replace("|", "&#124;")}|{stats.tests}|{stats.tests_succ}|{stats.tests_skip}|'
+                 f'{stats.tests_fail}|{stats.tests_error}|{stats.runs}|{as_stat_duration(stats.duration)}|'
+                 for partition, stats in partitions.items()])
+    return '\n{}\n'.format('\n'.join(rows))
+
+
+def get_degradations_md(degradations: Optional[List[str]]) -> str:
+    if not degradations:
+        return ''
+    degradations = degradations[0:-2] + [' and '.join(degradations[-2:])]
+    return f'\n:warning: Memory usage came close to the limit, so this run {", ".join(degradations)}.\n'
+
+
 def get_long_summary_with_digest_md(stats: UnitTestRunResultsOrDeltaResults,
-                                    digest_stats: Optional[UnitTestRunResults] = None) -> str:
+                                    digest_stats: Optional[UnitTestRunResults] = None,
+                                    degradations: Optional[List[str]] = None,
+                                    partitions: Optional[Mapping[str, UnitTestRunResults]] = None,
+                                    all_tests: Optional[List[str]] = None,
+                                    skipped_tests: Optional[List[str]] = None) -> str:
     """
     Provides the summary of stats with digest of digest_stats if given, otherwise
     digest of stats. In that case, stats must be UnitTestRunResults.
+    The digest carries the ids of the given tests if those fit into the summary.
 
     :param stats: stats to summarize
     :param digest_stats: stats to digest
+    :param degradations: cheaper modes applied to save memory, mentioned in the summary
+    :param partitions: stats per partition, added to the summary as a table
+    :param all_tests: names of all tests, their ids are added to the digest
+    :param skipped_tests: names of skipped tests, their ids are added to the digest
     :return: summary with digest
     """
     if digest_stats is None and isinstance(stats, UnitTestRunDeltaResults):
         raise ValueError('stats must be UnitTestRunResults when no digest_stats is given')
-    summary = get_long_summary_md(stats)
-    digest = get_digest_from_stats(stats if digest_stats is None else digest_stats)
+    summary = get_long_summary_md(stats) + get_partitions_md(partitions) + get_degradations_md(degradations)
+    digest_stats = stats if digest_stats is None else digest_stats
+    with_test_ids = all_tests is not None and skipped_tests is not None
+    # tests are only hashed and encoded if their ids could fit into the summary
+    if with_test_ids and len(summary) + 1 + len(digest_prefix) + len(all_tests) * min_digest_test_id_length > max_summary_length:
+        logger.info(f'ids of {len(all_tests)} tests exceed the size of the summary, the digest provides stats only')
+        with_test_ids = False
+    digest = get_digest_from_stats(digest_stats, all_tests, skipped_tests) if with_test_ids else None
+    if digest is not None and len(summary) + 1 + len(digest_prefix) + len(digest) > max_summary_length:
+        logger.info('ids of tests exceed the size of the summary, the digest provides stats only')
+        digest = None
+    if digest is None:
+        digest = get_digest_from_stats(digest_stats)
     return f'{summary}\n{digest_prefix}{digest}'
 
 
+def get_case_message(case: UnitTestCase) -> Optional[str]:
+    return case.message if case.result == 'skipped' else case.content
+
+
 def get_case_messages(case_results: UnitTestCaseResults) -> CaseMessages:
     messages = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
     for key in case_results:
         for state in case_results[key]:
             for case in case_results[key][state]:
-                message = case.message if case.result == 'skipped' else case.content
-                messages[key][state][message].append(case)
+                # the parsers intern messages, so equal messages are mostly identical
+                # and dict lookups do not need to compare them character by character
+                messages[key][state][get_case_message(case)].append(case)
     return CaseMessages(messages)
 
 
 @dataclass(frozen=True)
-class Annotation:
+class Annotation(FrozenSlots):
+    # there is one annotation per failing test, slots save the per-instance __dict__
+    __slots__ = ('path', 'start_line', 'end_line', 'start_column', 'end_column',
+                 'annotation_level', 'message', 'title', 'raw_details')
+
     path: str
     start_line: int
     end_line: int
@@ -603,7 +779,7 @@ class Annotation:
     raw_details: Optional[str]
 
     def to_dict(self) -> Mapping[str, Any]:
-        dictionary = self.__dict__.copy()
+        dictionary = {field: getattr(self, field) for field in self.__slots__}
         dictionary['message'] = abbreviate_bytes(dictionary['message'], 64000)
         dictionary['title'] = abbreviate(dictionary['title'], 255)
         dictionary['raw_details'] = abbreviate(dictionary['raw_details'], 64000)
@@ -618,6 +794,59 @@ class Annotation:
         return dictionary
 
 
+@dataclass(frozen=True)
+class CaseAnnotationGroup(FrozenSlots):
+    """
+    The cases of a test that are annotated together: all cases with the same state,
+    or the cases with the same state and message if individual runs are reported.
+    """
+    __slots__ = ('case', 'state', 'message', 'same_cases', 'all_cases', 'result_files')
+
+    # first case of the group
+    case: UnitTestCase
+    state: str
+    message: Optional[str]
+    same_cases: int
+    all_cases: int
+    # sorted result files of the cases of the group
+    result_files: List[str]
+
+
+def get_case_annotation_index(case_results: UnitTestCaseResults,
+                              report_individual_runs: bool) -> List[CaseAnnotationGroup]:
+    """
+    Provides the groups of cases that get_case_annotations annotates, in one pass over the tests.
+    Only cases of states other than success and skipped are grouped, cases of tests that only pass
+    or skip are not looked at, so this is linear in the number of tests and failing cases.
+    """
+    groups = []
+    for key, states in case_results.items():
+        annotated_states = [state for state, cases in states.items() if cases and state not in ['success', 'skipped']]
+        if not annotated_states:
+            continue
+
+        all_cases = sum([len(cases) for cases in states.values()])
+        for state in annotated_states:
+            cases = states[state]
+            if report_individual_runs:
+                cases_per_message = defaultdict(list)
+                for case in cases:
+                    cases_per_message[get_case_message(case)].append(case)
+            else:
+                cases_per_message = {get_case_message(cases[0]): cases}
+
+            for message, message_cases in cases_per_message.items():
+                groups.append(CaseAnnotationGroup(
+                    case=message_cases[0],
+                    state=state,
+                    message=message,
+                    same_cases=len(message_cases),
+                    all_cases=all_cases,
+                    result_files=sorted([case.result_file for case in message_cases if case.result_file])
+                ))
+    return groups
+
+
 def get_case_annotation(messages: CaseMessages,
                         key: Tuple[Optional[str], Optional[str], Optional[str]],
                         state: str,
@@ -638,6 +867,27 @@ def get_case_annotation(messages: CaseMessages,
                                        for m in messages[key][state]
                                        for c in messages[key][state][m]])
                          if case.result_file]
+    return get_case_group_annotation(CaseAnnotationGroup(
+        case=case,
+        state=state,
+        message=message,
+        same_cases=same_cases,
+        all_cases=all_cases,
+        result_files=sorted(same_result_files)
+    ))
+
+
+def get_case_annotation_level(case: UnitTestCase) -> str:
+    return (
+        'warning' if case.result == 'failure' else
+        'failure' if case.result == 'error' else  # failure is used for test errors
+        'notice'
+    )
+
+
+def get_case_group_annotation(group: CaseAnnotationGroup) -> Annotation:
+    case = group.case
+    state = group.state
     test_file = case.test_file
     line = case.line or 0
     test_name = case.test_name if case.test_name else 'Unknown test'
@@ -648,43 +898,138 @@ def get_case_annotation(messages: CaseMessages,
         'failed' if state == 'failure' else \
         'with error' if state == 'error' else \
         'skipped'
-    if all_cases > 1:
-        if same_cases == all_cases:
-            title = f'All {all_cases} runs {title_state}: {title}'
+    if group.all_cases > 1:
+        if group.same_cases == group.all_cases:
+            title = f'All {group.all_cases} runs {title_state}: {title}'
         else:
-            title = f'{same_cases} out of {all_cases} runs {title_state}: {title}'
+            title = f'{group.same_cases} out of {group.all_cases} runs {title_state}: {title}'
     else:
         title = f'{title} {title_state}'
 
-    level = (
-        'warning' if case.result == 'failure' else
-        'failure' if case.result == 'error' else  # failure is used for test errors
-        'notice'
-    )
-
     return Annotation(
         path=test_file or class_name or '/',
         start_line=line,
         end_line=line,
         start_column=None,
         end_column=None,
-        annotation_level=level,
-        message='\n'.join(sorted(same_result_files)),
+        annotation_level=get_case_annotation_level(case),
+        message='\n'.join(group.result_files),
+        title=title,
+        raw_details=group.message
+    )
+
+
+# parts of messages that differ between otherwise identical failures, in the order they are normalized
+case_fingerprint_patterns = [
+    # temporary paths, e.g. /tmp/pytest-of-runner/pytest-3/test0 or C:\Users\runner\AppData\Local\Temp\tmp5x2
+    (re.compile(r'(/tmp/|/var/folders/|/private/var/folders/|[A-Za-z]:\\(?:[^\s\\]+\\)*Temp\\)[^\s:\'"]*'), '<temp>'),
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<uuid>'),
+    (re.compile(r'\b0x[0-9a-fA-F]+\b'), '<address>'),
+    (re.compile(r'\d+'), '<number>'),
+]
+
+
+def get_case_fingerprint(state: str, message: Optional[str]) -> str:
+    """Returns a hash of the state and the message, which does not depend on numbers, addresses, UUIDs and temporary paths."""
+    normalized = message or ''
+    for pattern, replacement in case_fingerprint_patterns:
+        normalized = pattern.sub(replacement, normalized)
+    return hashlib.sha256(f'{state}\n{normalized}'.encode('utf8')).hexdigest()
+
+
+def get_case_cluster_annotation_level(case: UnitTestCase) -> str:
+    return 'failure' if case.result == 'error' else 'warning'
+
+
+def get_case_cluster_annotation(groups: List[CaseAnnotationGroup]) -> Annotation:
+    """Provides a single annotation for the given groups of cases, which have the same fingerprint."""
+    case = groups[0].case
+    tests = sorted({get_test_name(group.case.test_file, group.case.class_name, group.case.test_name) for group in groups})
+    label = 'test' if len(tests) == 1 else 'tests'
+    title = f'{len(tests)} {label} with similar errors' if case.result == 'error' else \
+        f'{len(tests)} {label} failed with similar messages'
+    return Annotation(
+        path='.github',
+        start_line=0,
+        end_line=0,
+        start_column=None,
+        end_column=None,
+        annotation_level=get_case_cluster_annotation_level(case),
+        message='\n'.join(tests),
         title=title,
-        raw_details=message
+        raw_details=groups[0].message
     )
 
 
 def get_case_annotations(case_results: UnitTestCaseResults,
-                         report_individual_runs: bool) -> List[Annotation]:
-    messages = get_case_messages(case_results)
-    return [
-        get_case_annotation(messages, key, state, message, report_individual_runs)
-        for key in messages
-        for state in messages[key] if state not in ['success', 'skipped']
-        for message in (messages[key][state] if report_individual_runs else
-                        [list(messages[key][state].keys())[0]])
-    ]
+                         report_individual_runs: bool,
+                         cluster_threshold: Optional[int] = None) -> List[Annotation]:
+    """
+    Provides annotations for failing cases. Groups of cases with the same fingerprint are annotated
+    with a single annotation when there are at least cluster_threshold of them.
+    """
+    return list(iterate_case_annotations(case_results, report_individual_runs, cluster_threshold))
+
+
+class CaseAnnotations:
+    """
+    The annotations of get_case_annotations, each built only once it is needed.
+    How many annotations there are and their levels are known without building any annotation.
+    """
+
+    def __init__(self,
+                 case_results: UnitTestCaseResults,
+                 report_individual_runs: bool,
+                 cluster_threshold: Optional[int] = None):
+        groups = get_case_annotation_index(case_results, report_individual_runs)
+        # a group, or the groups of a cluster, per annotation
+        self._annotated: List[Union[CaseAnnotationGroup, List[CaseAnnotationGroup]]] = groups
+        if cluster_threshold is None:
+            return
+
+        # the parsers intern messages, so most messages are fingerprinted only once
+        fingerprints_per_message = dict()
+        clusters = defaultdict(list)
+        for group in groups:
+            message_key = (group.state, group.message)
+            if message_key not in fingerprints_per_message:
+                fingerprints_per_message[message_key] = get_case_fingerprint(group.state, group.message)
+            clusters[fingerprints_per_message[message_key]].append(group)
+
+        # a cluster is annotated where its first group would have been annotated
+        self._annotated = []
+        for group in groups:
+            cluster = clusters[fingerprints_per_message[(group.state, group.message)]]
+            if len(cluster) < cluster_threshold:
+                self._annotated.append(group)
+            elif cluster[0] is group:
+                self._annotated.append(cluster)
+
+    def __len__(self) -> int:
+        return len(self._annotated)
+
+    def __getitem__(self, index: int) -> Annotation:
+        annotated = self._annotated[index]
+        if isinstance(annotated, list):
+            return get_case_cluster_annotation(annotated)
+        return get_case_group_annotation(annotated)
+
+    def __iter__(self) -> Iterator[Annotation]:
+        return (self[index] for index in range(len(self)))
+
+    def get_annotation_level(self, index: int) -> str:
+        """Returns the level of the annotation at the given index, without building the annotation."""
+        annotated = self._annotated[index]
+        if isinstance(annotated, list):
+            return get_case_cluster_annotation_level(annotated[0].case)
+        return get_case_annotation_level(annotated.case)
+
+
+def iterate_case_annotations(case_results: UnitTestCaseResults,
+                             report_individual_runs: bool,
+                             cluster_threshold: Optional[int] = None) -> Iterator[Annotation]:
+    """Provides the annotations of get_case_annotations one at a time, each built only once it is needed."""
+    return iter(CaseAnnotations(case_results, report_individual_runs, cluster_threshold))
 
 
 def get_error_annotation(error: ParseError) -> Annotation:
@@ -705,68 +1050,76 @@ def get_error_annotations(parse_errors: List[ParseError]) -> List[Annotation]:
     return [get_error_annotation(error) for error in parse_errors]
 
 
-def get_test_name(file_name: Optional[str],
-                  class_name: Optional[str],
-                  test_name: Optional[str]) -> str:
-    if not test_name:
-        test_name = 'Unknown test'
-
-    name = []
-    token = ' ‑ '  # U+2011 non-breaking hyphen
-    for part in [file_name, class_name, test_name]:
-        if part:
-            name.append(part.replace(token, ' ‐ '))  # U+2010 breaking hyphen
-
-    return token.join(name)
-
-
 def get_all_tests_list(cases: UnitTestCaseResults) -> List[str]:
+    """Returns the names of all tests, sorted."""
     if not cases:
         return []
-    return [get_test_name(file_name, class_name, test_name)
-            for (file_name, class_name, test_name) in cases.keys()]
+    tests = [get_test_name(file_name, class_name, test_name)
+             for (file_name, class_name, test_name) in cases.keys()]
+    # case results from get_test_results are sorted by test name already
+    return tests if cases.is_sorted else sorted(tests)
 
 
 def get_skipped_tests_list(cases: UnitTestCaseResults) -> List[str]:
+    """Returns the names of tests that are skipped only, sorted."""
     if not cases:
         return []
-    return [get_test_name(file_name, class_name, test_name)
-            for (file_name, class_name, test_name), result in cases.items()
-            if 'skipped' in result and len(result) == 1]
+    tests = [get_test_name(file_name, class_name, test_name)
+             for (file_name, class_name, test_name), result in cases.items()
+             if 'skipped' in result and len(result) == 1]
+    return tests if cases.is_sorted else sorted(tests)
 
 
-def get_all_tests_list_annotation(cases: UnitTestCaseResults, max_chunk_size: int = 64000) -> List[Annotation]:
-    return get_test_list_annotation(get_all_tests_list(cases), 'test', max_chunk_size)
+def get_all_tests_list_annotation(cases: UnitTestCaseResults,
+                                  max_chunk_size: int = 64000,
+                                  encoding: str = test_list_encoding_plain) -> List[Annotation]:
+    return get_test_list_annotation(get_all_tests_list(cases), 'test', max_chunk_size, encoding)
 
 
-def get_skipped_tests_list_annotation(cases: UnitTestCaseResults, max_chunk_size: int = 64000) -> List[Annotation]:
-    return get_test_list_annotation(get_skipped_tests_list(cases), 'skipped test', max_chunk_size)
+def get_skipped_tests_list_annotation(cases: UnitTestCaseResults,
+                                      max_chunk_size: int = 64000,
+                                      encoding: str = test_list_encoding_plain) -> List[Annotation]:
+    return get_test_list_annotation(get_skipped_tests_list(cases), 'skipped test', max_chunk_size, encoding)
 
 
-def get_test_list_annotation(tests: List[str], label: str, max_chunk_size: int = 64000) -> List[Annotation]:
+def get_test_list_annotation(tests: List[str],
+                             label: str,
+                             max_chunk_size: int = 64000,
+                             encoding: str = test_list_encoding_plain) -> List[Annotation]:
+    """Provides annotations that list the given tests, which are expected to be sorted."""
     if len(tests) == 0:
         return []
 
     # the max_chunk_size must not be larger than the abbreviate_bytes limit in Annotation.to_dict
-    test_chunks = chunk_test_list(sorted(tests), '\n', max_chunk_size)
+    if encoding == test_list_encoding_gzip:
+        gzip_chunks = chunk_gzip_test_list(tests, '\n', max_chunk_size)
+        test_chunks = [chunk for chunk, _ in gzip_chunks]
+        raw_details = [details for _, details in gzip_chunks]
+    else:
+        if encoding == test_list_encoding_front_coded:
+            test_chunks = chunk_front_coded_test_list(tests, '\n', max_chunk_size)
+        else:
+            test_chunks = chunk_test_list(tests, '\n', max_chunk_size)
+        raw_details = ['\n'.join(chunk) for chunk in test_chunks]
+    marker = test_list_encoding_markers[encoding]
 
     if len(test_chunks) == 1:
         if len(tests) == 1:
-            title = f'{len(tests)} {label} found'
+            title = f'{len(tests)} {label} found{marker}'
             message = f'There is 1 {label}, see "Raw output" for the name of the {label}.'
         else:
-            title = f'{len(tests)} {label}s found'
+            title = f'{len(tests)} {label}s found{marker}'
             message = f'There are {len(tests)} {label}s, see "Raw output" for the full list of {label}s.'
 
-        return [create_tests_list_annotation(title=title, message=message, raw_details='\n'.join(test_chunks[0]))]
+        return [create_tests_list_annotation(title=title, message=message, raw_details=raw_details[0])]
 
     first = 1
     annotations = []
-    for chunk in test_chunks:
+    for chunk, details in zip(test_chunks, raw_details):
         last = first + len(chunk) - 1
-        title = f'{len(tests)} {label}s found (test {first} to {last})'
+        title = f'{len(tests)} {label}s found (test {first} to {last}){marker}'
         message = f'There are {len(tests)} {label}s, see "Raw output" for the list of {label}s {first} to {last}.'
-        annotation = create_tests_list_annotation(title=title, message=message, raw_details='\n'.join(chunk))
+        annotation = create_tests_list_annotation(title=title, message=message, raw_details=details)
         annotations.append(annotation)
         first = last + 1
 
@@ -796,6 +1149,203 @@ def chunk_test_list(tests: List[str], delimiter: str, max_chunk_size: int) -> Li
     return chunks
 
 
+def get_front_coded_test(previous: Optional[str], test: str) -> str:
+    """
+    Encodes the test as the number of leading characters shared with the previous test and the remaining suffix.
+    Test names may contain line breaks, e.g. parameters of pytest tests, so those are escaped in the suffix.
+    """
+    prefix = 0
+    if previous is not None:
+        # binary search for the longest common prefix, comparing slices is much faster than comparing characters
+        length = min(len(previous), len(test))
+        while prefix < length:
+            middle = (prefix + length + 1) // 2
+            if previous[:middle] == test[:middle]:
+                prefix = middle
+            else:
+                length = middle - 1
+    suffix = test[prefix:].replace('\\', '\\\\').replace('\n', '\\n').replace('\r', '\\r')
+    return f'{prefix} {suffix}'
+
+
+def front_code_test_list(tests: List[str]) -> List[str]:
+    """Front-codes the given tests, which are expected to be sorted. Provides one line per test."""
+    return [get_front_coded_test(previous, test)
+            for previous, test in zip([None] + tests[:-1], tests)]
+
+
+def chunk_front_coded_test_list(tests: List[str], delimiter: str, max_chunk_size: int) -> List[List[str]]:
+    """
+    Front-codes the given tests and splits them into chunks of lines. The first test of each chunk
+    shares no prefix, so that each chunk can be decoded on its own.
+    """
+    chunks = []
+    chunk = []
+    size = 0
+    previous = None
+    for test in tests:
+        line = get_front_coded_test(previous, test)
+        line_size = len(f'{line}{delimiter}'.encode('utf8'))
+        if chunk and size + line_size >= max_chunk_size:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+            line = get_front_coded_test(None, test)
+            line_size = len(f'{line}{delimiter}'.encode('utf8'))
+
+        chunk.append(line)
+        size = size + line_size
+        previous = test
+
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+front_coded_escapes = re.compile(r'\\(.)')
+front_coded_escaped = {'n': '\n', 'r': '\r', '\\': '\\'}
+
+
+def decode_front_coded_test_list(lines: List[str]) -> Optional[List[str]]:
+    """
+    Decodes the lines of front_code_test_list or of a chunk of chunk_front_coded_test_list.
+    Returns None if any line cannot be decoded, as all later tests would be decoded wrongly.
+    """
+    tests = []
+    previous = ''
+    for line in lines:
+        prefix, _, suffix = line.partition(' ')
+        if not prefix.isdecimal() or int(prefix) > len(previous):
+            return None
+        if '\\' in suffix:
+            suffix = front_coded_escapes.sub(lambda match: front_coded_escaped.get(match.group(1), match.group(0)), suffix)
+        test = previous[:int(prefix)] + suffix
+        tests.append(test)
+        previous = test
+    return tests
+
+
+def chunk_gzip_test_list(tests: List[str], delimiter: str, max_chunk_size: int) -> List[Tuple[List[str], str]]:
+    """
+    Splits the given tests into chunks whose gzip compressed and base64 encoded lines
+    are smaller than max_chunk_size. Provides the tests of each chunk with their encoded lines.
+    The number of tests per chunk is estimated from the compression ratio of the previous chunk,
+    chunks that turn out too large are estimated again with the ratio observed for that chunk.
+    """
+    sizes = [len(f'{test}{delimiter}'.encode('utf8')) for test in tests]
+
+    chunks = []
+    # number of uncompressed bytes that are expected to fit into one chunk
+    budget = max_chunk_size * 4
+    start = 0
+    while start < len(tests):
+        size = sizes[start]
+        end = start + 1
+        while end < len(tests) and size + sizes[end] < budget:
+            size = size + sizes[end]
+            end = end + 1
+
+        details = digest_string(delimiter.join(tests[start:end]))
+        if len(details) >= max_chunk_size and end - start > 1:
+            # shrink the budget strictly, so this terminates with a chunk of a single test at the latest
+            budget = min(size - 1, size * max_chunk_size * 95 // (100 * len(details)))
+            continue
+
+        chunks.append((tests[start:end], details))
+        start = end
+        budget = max(budget, size * max_chunk_size * 95 // (100 * len(details)))
+
+    return chunks
+
+
+def decode_gzip_test_list(details: str) -> List[str]:
+    """Decodes the lines of a chunk of chunk_gzip_test_list."""
+    return ungest_string(details).split('\n')
+
+
+@dataclass(frozen=True)
+class DeltaTestList:
+    """Changes of a test list relative to the test list of the check run with the reference id."""
+    reference_id: int
+    # sha256 hash of the sorted test list that results from applying the changes to the reference test list
+    hash: str
+    # '-test' for removed tests and '+test' for added tests
+    changes: List[str]
+
+    def apply(self, reference: List[str]) -> Optional[List[str]]:
+        """Applies the changes to the given reference test list, provides None if the result does not have the expected hash."""
+        tests = set(reference)
+        for change in self.changes:
+            if change.startswith('-'):
+                tests.discard(change[1:])
+            elif change.startswith('+'):
+                tests.add(change[1:])
+        tests = sorted(tests)
+        return tests if get_test_list_hash(tests) == self.hash else None
+
+
+def get_test_list_hash(tests: List[str]) -> str:
+    return hashlib.sha256('\n'.join(sorted(tests)).encode('utf8')).hexdigest()
+
+
+def get_test_list_changes(tests: List[str], reference: List[str]) -> List[str]:
+    """Returns the tests removed from the reference as '-test' and the added tests as '+test', sorted by test."""
+    tests = set(tests)
+    reference = set(reference)
+    return sorted([f'-{test}' for test in reference.difference(tests)] +
+                  [f'+{test}' for test in tests.difference(reference)],
+                  key=lambda change: change[1:])
+
+
+def get_test_list_delta_annotation(tests: List[str],
+                                   reference: List[str],
+                                   reference_id: int,
+                                   label: str,
+                                   max_chunk_size: int = 64000) -> Optional[List[Annotation]]:
+    """
+    Provides annotations that list the changes of the given tests relative to the reference tests,
+    which are those of the check run with the reference id. The first line of each annotation
+    holds the reference id and the hash of the given tests. Provides None if there are not
+    fewer changes than tests, the tests should then be listed in full.
+    """
+    if len(tests) == 0:
+        return []
+
+    changes = get_test_list_changes(tests, reference)
+    if len(changes) >= len(tests):
+        return None
+
+    header = f'{reference_id} {get_test_list_hash(tests)}'
+    # the header and its delimiter take away from each chunk, no changes still need an annotation with the header
+    change_chunks = chunk_test_list(changes, '\n', max_chunk_size - len(header) - 1) or [[]]
+    tests_label = f'{label}s' if len(tests) > 1 else label
+    marker = test_list_encoding_markers[test_list_encoding_delta]
+
+    if len(change_chunks) == 1:
+        title = f'{len(tests)} {tests_label} found{marker}'
+        message = f'See "Raw output" for the changes to the {label}s of check run {reference_id}.'
+        return [create_tests_list_annotation(title=title, message=message, raw_details='\n'.join([header] + changes))]
+
+    first = 1
+    annotations = []
+    for chunk in change_chunks:
+        last = first + len(chunk) - 1
+        title = f'{len(tests)} {tests_label} found (changes {first} to {last}){marker}'
+        message = f'See "Raw output" for the changes {first} to {last} to the {label}s of check run {reference_id}.'
+        annotation = create_tests_list_annotation(title=title, message=message, raw_details='\n'.join([header] + chunk))
+        annotations.append(annotation)
+        first = last + 1
+
+    return annotations
+
+
+def decode_test_list_delta(details: str) -> DeltaTestList:
+    """Decodes the raw details of an annotation of get_test_list_delta_annotation."""
+    lines = details.split('\n')
+    reference_id, hash = lines[0].split(' ')
+    return DeltaTestList(reference_id=int(reference_id), hash=hash, changes=lines[1:])
+
+
 def create_tests_list_annotation(title: str, message: str, raw_details: Optional[str]) -> Annotation:
     return Annotation(
         path='.github',
@@ -808,3 +1358,104 @@ def create_tests_list_annotation(title: str, message: str, raw_details: Optional
         title=title,
         raw_details=raw_details
     )
+
+
+def get_annotations_within_limit(error_annotations: Iterable[Annotation],
+                                 case_annotations: Iterable[Annotation],
+                                 test_list_annotation_groups: Iterable[List[Annotation]],
+                                 max_annotations: Optional[int]) -> Iterator[Annotation]:
+    """
+    Provides at most max_annotations annotations. If there are more, annotations are taken in the order
+    parse errors, test errors, test failures and test lists, and a final notice tells about the omitted
+    annotations. Test lists are taken only with all their annotations.
+
+    Without max_annotations, annotations are passed through one at a time. Otherwise, the annotations
+    to take are picked from the levels of CaseAnnotations, and only taken case annotations are built,
+    each once it is needed. Test lists are built first only if all case annotations fit.
+    """
+    if max_annotations is None:
+        yield from error_annotations
+        yield from case_annotations
+        for annotations in test_list_annotation_groups:
+            yield from annotations
+        return
+
+    error_annotations = list(error_annotations)
+    if isinstance(case_annotations, CaseAnnotations):
+        levels = [case_annotations.get_annotation_level(index) for index in range(len(case_annotations))]
+    else:
+        case_annotations = list(case_annotations)
+        levels = [annotation.annotation_level for annotation in case_annotations]
+    kinds = ['test error' if level == 'failure' else 'test failure' for level in levels]
+
+    total = len(error_annotations) + len(case_annotations)
+    if total <= max_annotations:
+        # whether all annotations fit is known only once the test lists are known
+        test_list_annotation_groups = list(test_list_annotation_groups)
+        total += sum([len(group) for group in test_list_annotation_groups])
+        if total <= max_annotations:
+            yield from error_annotations
+            yield from case_annotations
+            for annotations in test_list_annotation_groups:
+                yield from annotations
+            return
+    if max_annotations == 0:
+        return
+
+    # one annotation is needed for the notice about omitted annotations
+    available = max_annotations - 1
+    counts = {'parse error': len(error_annotations),
+              'test error': kinds.count('test error'),
+              'test failure': kinds.count('test failure')}
+    taken = dict()
+    omitted = []
+    for kind in ['parse error', 'test error', 'test failure']:
+        taken[kind] = min(counts[kind], available - sum(taken.values()))
+        if taken[kind] < counts[kind]:
+            omitted.append(f'{counts[kind] - taken[kind]} {kind}{"s" if counts[kind] - taken[kind] > 1 else ""}')
+
+    yield from error_annotations[:taken['parse error']]
+    for kind in ['test error', 'test failure']:
+        indices = (index for index, index_kind in enumerate(kinds) if index_kind == kind)
+        for _, index in zip(range(taken[kind]), indices):
+            yield case_annotations[index]
+
+    room = available - sum(taken.values())
+    omitted_test_lists = 0
+    for group in test_list_annotation_groups:
+        if len(group) <= room:
+            yield from group
+            room -= len(group)
+        else:
+            omitted_test_lists += 1
+    if omitted_test_lists:
+        omitted.append(f'{omitted_test_lists} test list{"s" if omitted_test_lists > 1 else ""}')
+
+    yield Annotation(
+        path='.github',
+        start_line=0,
+        end_line=0,
+        start_column=None,
+        end_column=None,
+        annotation_level='notice',
+        message=f'Not annotated: {", ".join(omitted)}.',
+        title=f'Annotations limited to {max_annotations}',
+        raw_details=None
+    )
+
+
+def get_annotation_batches(annotations: Iterable[Annotation], batch_size: int = 50) -> Iterator[List[Mapping[str, Any]]]:
+    """
+    Serializes the annotations into batches of at most batch_size, as they are needed.
+    Provides a single empty batch if there are no annotations.
+    """
+    batch = []
+    batches = 0
+    for annotation in annotations:
+        batch.append(annotation.to_dict())
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+            batches += 1
+    if batch or batches == 0:
+        yield batch
@@ -0,0 +1,340 @@
+import json
+import os
+from typing import Optional, Iterable, Union, Any, List, Dict, Tuple, Callable, Set
+
+from publish.unittestresults import ParsedUnitTestResults, UnitTestCase, UnitTestCaseFilter, ResultFileError, \
+    ParseLimits, default_parse_limits, Interner, parse_files_case_by_case
+
+json_lines_extensions = ['.json', '.jsonl', '.ndjson']
+
+# most severe state first
+pytest_states = ['error', 'failure', 'skipped', 'success']
+
+
+def is_json_file(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() == '.json'
+
+
+def is_json_lines_file(path: str) -> bool:
+    """
+    Returns whether the given file is a JSON lines file of go test -json or pytest --report-log.
+    Files with extension .json are also used for all sorts of other JSON documents,
+    so their first line has to be an event of either tool.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in json_lines_extensions:
+        return False
+    return extension != '.json' or is_json_lines_event(get_first_line(path))
+
+
+def get_first_line(path: str, max_length: int = 64 * 1024) -> Optional[str]:
+    """Returns the first non-empty line of the given file, cut at max_length, or None if there is none or the file cannot be read."""
+    try:
+        with open(path, 'rt', encoding='utf-8') as r:
+            # a JSON document may well be a single huge line
+            line = r.readline(max_length)
+            while line and not line.strip():
+                line = r.readline(max_length)
+            return line.strip() or None
+    except (OSError, ValueError):
+        return None
+
+
+def is_json_lines_event(line: Optional[str]) -> bool:
+    """Returns whether the given line is an event of go test -json or pytest --report-log."""
+    if not line or not line.startswith('{'):
+        return False
+    try:
+        event = json.loads(line)
+    except ValueError:
+        return False
+    return isinstance(event, dict) and ('$report_type' in event or 'Action' in event)
+
+
+class JsonLinesError(ResultFileError):
+    pass
+
+
+class GoTestEvents:
+    """
+    Folds events of `go test -json` (test2json) into UnitTestCase instances.
+    Only tests and packages that have started but not finished yet are held in memory.
+    A package that fails without a failing test is reported as an error case of that package.
+
+    https://golang.org/cmd/test2json/
+    """
+
+    def __init__(self,
+                 result_file: str,
+                 emit: Callable[[UnitTestCase], None],
+                 case_filter: Optional[UnitTestCaseFilter] = None,
+                 intern: Optional[Interner] = None):
+        self._result_file = result_file
+        self._emit = emit
+        self._case_filter = case_filter
+        self._intern = intern if intern is not None else Interner()
+        # output of tests in flight, keyed by (package, test)
+        self._in_flight: Dict[Tuple[str, str], List[str]] = dict()
+        # output of packages in flight, and packages in flight with a failed test
+        self._package_output: Dict[str, List[str]] = dict()
+        self._failed_packages: Set[str] = set()
+        self.suites = 0
+        self.suite_time = 0.0
+
+    def add(self, event: Dict[str, Any]) -> None:
+        action = event.get('Action')
+        package = event.get('Package')
+        test = event.get('Test')
+
+        if test is None:
+            # package-level events, a package is a suite
+            if action == 'output':
+                self._package_output.setdefault(package, []).append(event.get('Output') or '')
+            elif action in ['pass', 'fail', 'skip']:
+                self.suites += 1
+                self.suite_time += event.get('Elapsed') or 0
+                output = self._package_output.pop(package, [])
+                failed_test = package in self._failed_packages or \
+                    any([test_package == package for test_package, _ in self._in_flight])
+                self._failed_packages.discard(package)
+                # a package fails without a failing test when it does not build, or panics in init or TestMain
+                if action == 'fail' and not failed_test and \
+                        (self._case_filter is None or self._case_filter.matches(package, 'Package failed')):
+                    self._emit(UnitTestCase(
+                        result_file=self._result_file,
+                        test_file=None,
+                        line=None,
+                        class_name=self._intern(package),
+                        test_name='Package failed',
+                        result='error',
+                        message=None,
+                        content=self._intern(''.join(output)) if output else None,
+                        time=event.get('Elapsed')
+                    ))
+            return
+
+        if action == 'fail':
+            # tests that are filtered out fail their package too
+            self._failed_packages.add(package)
+        if self._case_filter is not None and not self._case_filter.matches(package, test):
+            return
+
+        key = (package, test)
+        if action == 'run':
+            self._in_flight[key] = []
+        elif action == 'output':
+            output = self._in_flight.get(key)
+            if output is not None:
+                output.append(event.get('Output') or '')
+        elif action in ['pass', 'fail', 'skip']:
+            output = self._in_flight.pop(key, [])
+            result = 'success' if action == 'pass' else 'failure' if action == 'fail' else 'skipped'
+            content = ''.join(output) if action != 'pass' and output else None
+            self._emit(UnitTestCase(
+                result_file=self._result_file,
+                test_file=None,
+                line=None,
+                class_name=self._intern(package),
+                test_name=test,
+                result=result,
+                message=None,
+                content=self._intern(content),
+                time=event.get('Elapsed')
+            ))
+
+    def close(self) -> None:
+        # tests that never finished, e.g. because the test binary crashed or timed out
+        for (package, test), output in self._in_flight.items():
+            self._emit(UnitTestCase(
+                result_file=self._result_file,
+                test_file=None,
+                line=None,
+                class_name=self._intern(package),
+                test_name=test,
+                result='error',
+                message='Test did not finish',
+                content=self._intern(''.join(output)) if output else None,
+                time=None
+            ))
+        self._in_flight.clear()
+        self._package_output.clear()
+        self._failed_packages.clear()
+
+
+def get_pytest_longrepr_text(longrepr: Any) -> Optional[str]:
+    if longrepr is None:
+        return None
+    if isinstance(longrepr, str):
+        return longrepr
+    if isinstance(longrepr, list):
+        # skipped tests provide (path, lineno, reason)
+        return str(longrepr[-1]) if longrepr else None
+    if isinstance(longrepr, dict):
+        lines = [line
+                 for entry in longrepr.get('reprtraceback', {}).get('reprentries', [])
+                 for line in (entry.get('data', {}).get('lines') or [])]
+        crash = longrepr.get('reprcrash') or {}
+        if crash:
+            lines.append(f'{crash.get("path")}:{crash.get("lineno")}: {crash.get("message")}')
+        return '\n'.join(lines) if lines else None
+    return str(longrepr)
+
+
+def get_pytest_longrepr_message(longrepr: Any) -> Optional[str]:
+    if isinstance(longrepr, dict):
+        return (longrepr.get('reprcrash') or {}).get('message')
+    if isinstance(longrepr, list):
+        return str(longrepr[-1]) if longrepr else None
+    return None
+
+
+class PytestReportLogEvents:
+    """
+    Folds TestReport events of pytest `--report-log` into UnitTestCase instances.
+    A test reports its setup, call and teardown phases, the most severe phase
+    determines the result. Only tests whose teardown has not been seen yet
+    are held in memory.
+
+    https://github.com/pytest-dev/pytest-reportlog
+    """
+
+    def __init__(self,
+                 result_file: str,
+                 emit: Callable[[UnitTestCase], None],
+                 case_filter: Optional[UnitTestCaseFilter] = None,
+                 intern: Optional[Interner] = None):
+        self._result_file = result_file
+        self._emit = emit
+        self._case_filter = case_filter
+        self._intern = intern if intern is not None else Interner()
+        # reports of tests in flight, keyed by nodeid
+        self._in_flight: Dict[str, List[Dict[str, Any]]] = dict()
+        self._files = set()
+        self.suite_time = 0.0
+
+    @property
+    def suites(self) -> int:
+        return len(self._files)
+
+    @staticmethod
+    def get_result(report: Dict[str, Any]) -> str:
+        outcome = report.get('outcome')
+        if outcome == 'passed':
+            return 'success'
+        if outcome == 'skipped':
+            return 'skipped'
+        # a failure outside the call phase is an error, like pytest's junitxml does
+        return 'failure' if report.get('when') == 'call' else 'error'
+
+    def add(self, event: Dict[str, Any]) -> None:
+        if event.get('$report_type') != 'TestReport':
+            return
+
+        nodeid = event.get('nodeid')
+        if self._case_filter is not None and nodeid not in self._in_flight and \
+                not self._case_filter.matches(*self.get_names(nodeid)):
+            return
+
+        reports = self._in_flight.setdefault(nodeid, [])
+        reports.append(event)
+        if event.get('when') == 'teardown':
+            del self._in_flight[nodeid]
+            self._emit_reports(nodeid, reports)
+
+    @staticmethod
+    def get_names(nodeid: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Turns nodeid 'path/to/test_file.py::Class::test' into class name 'path.to.test_file.Class'
+        and test name 'test', like pytest's junitxml does.
+        """
+        parts = nodeid.split('::')
+        module = parts[0][:-3] if parts[0].endswith('.py') else parts[0]
+        class_name = '.'.join([module.replace('/', '.')] + parts[1:-1]) or None
+        test_name = parts[-1] if len(parts) > 1 else None
+        return class_name, test_name
+
+    def _emit_reports(self, nodeid: str, reports: List[Dict[str, Any]]) -> None:
+        results = [(self.get_result(report), report) for report in reports]
+        result, report = min(results, key=lambda r: pytest_states.index(r[0]))
+
+        location = report.get('location') or [None, None, None]
+        test_file = location[0]
+        line = location[1] + 1 if isinstance(location[1], int) else None
+
+        class_name, test_name = self.get_names(nodeid)
+
+        time = sum([report.get('duration') or 0 for report in reports])
+        self.suite_time += time
+        if test_file:
+            self._files.add(test_file)
+
+        longrepr = report.get('longrepr') if result != 'success' else None
+        self._emit(UnitTestCase(
+            result_file=self._result_file,
+            test_file=self._intern(test_file),
+            line=line,
+            class_name=self._intern(class_name),
+            test_name=test_name,
+            result=result,
+            message=self._intern(get_pytest_longrepr_message(longrepr)),
+            content=self._intern(get_pytest_longrepr_text(longrepr)),
+            time=time
+        ))
+
+    def close(self) -> None:
+        # tests without teardown, e.g. when the test session crashed
+        for nodeid, reports in self._in_flight.items():
+            self._emit_reports(nodeid, reports)
+        self._in_flight.clear()
+
+
+def parse_json_lines_file(path: str,
+                          emit: Callable[[UnitTestCase], None],
+                          case_filter: Optional[UnitTestCaseFilter] = None,
+                          intern: Optional[Interner] = None) -> Tuple[int, Optional[float]]:
+    """
+    Streams the JSON lines in the given file, emits UnitTestCase instances as soon as tests finish.
+    Returns the number of suites and their time, or None if the time of the cases is to be used.
+    """
+    events: Optional[Union[GoTestEvents, PytestReportLogEvents]] = None
+    with open(path, 'rt', encoding='utf-8') as r:
+        for number, line in enumerate(r, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError as e:
+                raise JsonLinesError(f'File is not a valid JSON lines file:\n{e}', number)
+            if not isinstance(event, dict):
+                continue
+            if events is None:
+                if '$report_type' in event:
+                    events = PytestReportLogEvents(path, emit, case_filter, intern)
+                elif 'Action' in event:
+                    events = GoTestEvents(path, emit, case_filter, intern)
+                else:
+                    continue
+            events.add(event)
+
+    if events is None:
+        raise JsonLinesError('File does not contain go test or pytest report-log events.')
+    events.close()
+    # suite times include filtered-out tests, the time of the cases is used instead
+    return events.suites, events.suite_time if case_filter is None else None
+
+
+def parse_json_lines_files(files: Iterable[str],
+                           case_filter: Optional[UnitTestCaseFilter] = None,
+                           limits: ParseLimits = default_parse_limits,
+                           intern: Optional[Interner] = None,
+                           emit: Optional[Callable[[UnitTestCase], None]] = None,
+                           rollback: Optional[Callable[[str], None]] = None) -> ParsedUnitTestResults:
+    """
+    Parses JSON lines files and returns aggregated statistics as a ParsedUnitTestResults.
+    With emit, test cases are passed to emit as they are read rather than returned,
+    and rollback is called with files that turn out to be invalid after some of their cases have been emitted.
+    """
+    if intern is None:
+        intern = Interner()
+    return parse_files_case_by_case(files, lambda path, emit: parse_json_lines_file(path, emit, case_filter, intern), limits, emit, rollback)
@@ -1,11 +1,14 @@
 import os
-from collections import defaultdict
+from collections import defaultdict, Counter
 from html import unescape
-from typing import Optional, Iterable, Union, Any, List
+from typing import Optional, Iterable, Union, Any, List, Dict, Callable
+from xml.etree.ElementTree import ElementTree, TreeBuilder, ParseError as XmlParseError
+from xml.parsers import expat
 
 from junitparser import Element, JUnitXml, TestCase, TestSuite
 
-from publish.unittestresults import ParsedUnitTestResults, UnitTestCase, ParseError
+from publish.unittestresults import ParsedUnitTestResults, UnitTestCase, ParseError, UnitTestCaseFilter, \
+    ParseLimits, ParseLimitError, default_parse_limits, Interner
 
 
 def get_results(results: Union[Element, List[Element]]) -> List[Element]:
@@ -72,8 +75,92 @@ def get_content(results: Union[Element, List[Element]]) -> str:
     return unescape(content) if content is not None else None
 
 
-def parse_junit_xml_files(files: Iterable[str]) -> ParsedUnitTestResults:
-    """Parses junit xml files and returns aggregated statistics as a ParsedUnitTestResults."""
+def parse_xml_file(path: str, limits: ParseLimits = default_parse_limits) -> ElementTree:
+    """
+    Parses the given XML file like xml.etree.ElementTree.parse does, while enforcing the given limits.
+    Element depth, entity declarations, text and attribute values after entity expansion and test cases are counted
+    while the file is read, so a file that breaks a limit is rejected before it is fully read.
+    """
+    builder = TreeBuilder()
+    max_text_size = limits.get_max_text_size(path)
+    parser = expat.ParserCreate(None, '}')
+    parser.buffer_text = True
+    depth = 0
+    entities = 0
+    text_size = 0
+    cases = 0
+
+    def fixname(name: str) -> str:
+        # expat gives namespaced names as 'uri}local', etree expects '{uri}local'
+        return '{' + name if '}' in name else name
+
+    def count_text(size: int) -> None:
+        nonlocal text_size
+        text_size += size
+        if text_size > max_text_size:
+            raise ParseLimitError(f'File exceeds limit of {max_text_size} characters of text.')
+
+    def start(tag: str, attrs: Dict[str, str]) -> None:
+        nonlocal depth, cases
+        depth += 1
+        if depth > limits.max_depth:
+            raise ParseLimitError(f'File exceeds limit of {limits.max_depth} nested elements.')
+        if tag == 'testcase':
+            cases += 1
+            limits.check_cases(cases)
+        # entities are expanded in attribute values too, e.g. in failure messages
+        count_text(sum([len(value) for value in attrs.values()]))
+        builder.start(fixname(tag), {fixname(key): value for key, value in attrs.items()})
+
+    def end(tag: str) -> None:
+        nonlocal depth
+        depth -= 1
+        builder.end(fixname(tag))
+
+    def data(text: str) -> None:
+        count_text(len(text))
+        builder.data(text)
+
+    def entity_decl(*args) -> None:
+        nonlocal entities
+        entities += 1
+        if entities > limits.max_entities:
+            raise ParseLimitError(f'File exceeds limit of {limits.max_entities} entity declarations.')
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+    parser.EntityDeclHandler = entity_decl
+
+    with open(path, 'rb') as r:
+        try:
+            parser.ParseFile(r)
+        except expat.ExpatError as e:
+            # raise the same error as xml.etree.ElementTree.parse
+            error = XmlParseError(f'{expat.ErrorString(e.code)}: line {e.lineno}, column {e.offset}')
+            error.code = e.code
+            error.position = (e.lineno, e.offset)
+            raise error from None
+
+    return ElementTree(builder.close())
+
+
+def parse_junit_xml_files(files: Iterable[str],
+                          case_filter: Optional[UnitTestCaseFilter] = None,
+                          limits: ParseLimits = default_parse_limits,
+                          intern: Optional[Interner] = None,
+                          emit: Optional[Callable[[UnitTestCase], None]] = None) -> ParsedUnitTestResults:
+    """
+    Parses junit xml files and returns aggregated statistics as a ParsedUnitTestResults.
+    With a case_filter, only matching test cases are turned into UnitTestCase instances,
+    and test state counts and time are taken from those cases rather than from the suites.
+    Equal strings of test cases are stored once, by the given intern or a new Interner.
+    With emit, test cases are passed to emit file by file rather than returned,
+    so only the document of one file is held in memory at a time.
+    """
+    if intern is None:
+        intern = Interner()
+
     def parse(path: str) -> Union[str, Any]:
         if not os.path.exists(path):
             return FileNotFoundError(f'File does not exist.')
@@ -81,28 +168,11 @@ def parse_junit_xml_files(files: Iterable[str]) -> ParsedUnitTestResults:
             return Exception(f'File is empty.')
 
         try:
-            return JUnitXml.fromfile(path)
+            limits.check_file_size(path)
+            return JUnitXml.fromfile(path, parse_func=lambda file: parse_xml_file(file, limits))
         except BaseException as e:
             return e
 
-    parsed_files = [(result_file, parse(result_file))
-                    for result_file in files]
-    junits = [(result_file, junit)
-              for result_file, junit in parsed_files
-              if not isinstance(junit, BaseException)]
-    errors = [ParseError.from_exception(result_file, exception)
-              for result_file, exception in parsed_files
-              if isinstance(exception, BaseException)]
-
-    suites = [(result_file, suite)
-              for result_file, junit in junits
-              for suite in (junit if junit._tag == "testsuites" else [junit])]
-    suite_tests = sum([suite.tests for result_file, suite in suites])
-    suite_skipped = sum([suite.skipped for result_file, suite in suites])
-    suite_failures = sum([suite.failures for result_file, suite in suites])
-    suite_errors = sum([suite.errors for result_file, suite in suites])
-    suite_time = int(sum([suite.time for result_file, suite in suites]))
-
     def int_opt(string: Optional[str]) -> Optional[int]:
         try:
             return int(string) if string else None
@@ -122,34 +192,80 @@ def parse_junit_xml_files(files: Iterable[str]) -> ParsedUnitTestResults:
                 for suite in suites
                 for case in get_cases(suite)] + cases
 
-    cases = [
-        UnitTestCase(
-            result_file=result_file,
-            test_file=case._elem.get('file'),
-            line=int_opt(case._elem.get('line')),
-            class_name=case.classname,
-            test_name=case.name,
-            result=get_result(results),
-            message=get_message(results),
-            content=get_content(results),
-            time=case.time
-        )
-        for result_file, suite in suites
-        for case in get_cases(suite)
-        if case.classname is not None or case.name is not None
-        for results in [get_results(case.result)]
-    ]
+    files = list(files)
+    cases: List[UnitTestCase] = []
+    errors: List[ParseError] = []
+    suites = 0
+    suite_tests = 0
+    suite_skipped = 0
+    suite_failures = 0
+    suite_errors = 0
+    suite_time = 0.0
+    # results and time of cases, which provide the test state counts and time with a case filter
+    case_results = Counter()
+    cases_time = 0.0
+
+    for result_file in files:
+        junit = parse(result_file)
+        if isinstance(junit, BaseException):
+            errors.append(ParseError.from_exception(result_file, junit))
+            continue
+
+        file_suites = junit if junit._tag == "testsuites" else [junit]
+        for suite in file_suites:
+            suites += 1
+            suite_tests += suite.tests
+            suite_skipped += suite.skipped
+            suite_failures += suite.failures
+            suite_errors += suite.errors
+            suite_time += suite.time
+
+        file_cases = [
+            UnitTestCase(
+                result_file=result_file,
+                test_file=intern(case._elem.get('file')),
+                line=int_opt(case._elem.get('line')),
+                class_name=intern(case.classname),
+                test_name=case.name,
+                result=get_result(results),
+                message=intern(get_message(results)),
+                content=intern(get_content(results)),
+                time=case.time
+            )
+            for suite in file_suites
+            for case in get_cases(suite)
+            if case.classname is not None or case.name is not None
+            if case_filter is None or case_filter.matches(case.classname, case.name)
+            for results in [get_results(case.result)]
+        ]
+
+        if case_filter is not None:
+            case_results.update([case.result for case in file_cases])
+            cases_time += sum([case.time or 0 for case in file_cases])
+        if emit is None:
+            cases.extend(file_cases)
+        else:
+            for case in file_cases:
+                emit(case)
+
+    if case_filter is not None:
+        # suite statistics include filtered-out cases, so test state counts and time come from cases
+        suite_tests = sum(case_results.values())
+        suite_skipped = case_results['skipped']
+        suite_failures = case_results['failure']
+        suite_errors = case_results['error']
+        suite_time = cases_time
 
     return ParsedUnitTestResults(
-        files=len(parsed_files),
+        files=len(files),
         errors=errors,
         # test state counts from suites
-        suites=len(suites),
+        suites=suites,
         suite_tests=suite_tests,
         suite_skipped=suite_skipped,
         suite_failures=suite_failures,
         suite_errors=suite_errors,
-        suite_time=suite_time,
+        suite_time=int(suite_time),
         # test cases
         cases=cases
     )
@@ -0,0 +1,248 @@
+import dataclasses
+import gzip
+import json
+from collections import Counter
+from typing import Optional, List, Dict, Tuple, Any, Iterable
+
+from publish.unittestresults import UnitTestResults, UnitTestCase, UnitTestCaseResults, ParseError, \
+    aggregate_states, sort_case_results
+
+partial_version = 1
+
+TestKey = Tuple[Optional[str], Optional[str], Optional[str]]
+
+# results of cases whose details are retained, other cases are only counted
+retained_results = ['failure', 'error']
+
+# statistics that are summed when partial results are merged
+summed_fields = ['files', 'suites', 'suite_tests', 'suite_skipped', 'suite_failures', 'suite_errors', 'suite_time',
+                 'cases', 'cases_skipped', 'cases_failures', 'cases_errors', 'cases_time']
+
+
+def get_case_sort_key(case: UnitTestCase) -> Tuple[Any, ...]:
+    return tuple([('' if value is None else str(value)) for value in case.__getstate__()])
+
+
+def get_error_sort_key(error: ParseError) -> Tuple[Any, ...]:
+    return error.file, error.line or 0, error.column or 0, error.message
+
+
+@dataclasses.dataclass(frozen=True)
+class PartialUnitTestResults:
+    """
+    Compact results of a subset of result files, e.g. of one shard of a matrix job.
+    Holds the statistics, the number of cases per test and result, and the cases
+    that failed or errored, so their annotations can be created after merging.
+
+    Partial results are merged with sums, concatenations and unions only, so merging
+    is associative and independent of the order of partial results. Like merge_parsed_results,
+    the suite time of merged results is the sum of the suite times of the partial results,
+    which are rounded down to seconds each.
+    """
+    files: int
+    errors: List[ParseError]
+    suites: int
+    suite_tests: int
+    suite_skipped: int
+    suite_failures: int
+    suite_errors: int
+    suite_time: int
+
+    cases: int
+    cases_skipped: int
+    cases_failures: int
+    cases_errors: int
+    cases_time: float
+
+    # number of cases per result of each test
+    tests: Dict[TestKey, Counter]
+    # cases of each test with results in retained_results
+    retained: Dict[TestKey, List[UnitTestCase]]
+
+    @staticmethod
+    def from_results(results: UnitTestResults) -> 'PartialUnitTestResults':
+        tests = dict()
+        retained = dict()
+        for key, states in results.case_results.items():
+            tests[key] = Counter({state: len(cases) for state, cases in states.items()})
+            cases = [case for state in retained_results for case in states.get(state, [])]
+            if cases:
+                retained[key] = cases
+
+        return PartialUnitTestResults(
+            files=results.files,
+            errors=results.errors,
+            suites=results.suites,
+            suite_tests=results.suite_tests,
+            suite_skipped=results.suite_skipped,
+            suite_failures=results.suite_failures,
+            suite_errors=results.suite_errors,
+            suite_time=results.suite_time,
+
+            cases=results.cases,
+            cases_skipped=results.cases_skipped,
+            cases_failures=results.cases_failures,
+            cases_errors=results.cases_errors,
+            cases_time=results.cases_time,
+
+            tests=tests,
+            retained=retained
+        )
+
+    def merge(self, other: 'PartialUnitTestResults') -> 'PartialUnitTestResults':
+        return merge_partial_results([self, other])
+
+    def to_results(self, commit: str) -> UnitTestResults:
+        """
+        Provides UnitTestResults of these partial results. Cases that are only counted are represented
+        by cases without result file, message, content and time. Errors, tests and cases are sorted,
+        so the results do not depend on the order in which partial results were merged.
+        """
+        case_results = UnitTestCaseResults()
+        test_states = Counter()
+        for key, counts in self.tests.items():
+            retained = sorted(self.retained.get(key, []), key=get_case_sort_key)
+            states = case_results[key]
+            for state in sorted(counts):
+                cases = [case for case in retained if case.result == state]
+                counted = UnitTestCase(result_file=None, test_file=key[0], line=None, class_name=key[1], test_name=key[2],
+                                       result=state, message=None, content=None, time=None)
+                states[state] = cases + [counted] * (counts[state] - len(cases))
+            test_states[aggregate_states(list(counts))] += 1
+
+        return UnitTestResults(
+            files=self.files,
+            errors=sorted(self.errors, key=get_error_sort_key),
+            suites=self.suites,
+            suite_tests=self.suite_tests,
+            suite_skipped=self.suite_skipped,
+            suite_failures=self.suite_failures,
+            suite_errors=self.suite_errors,
+            suite_time=self.suite_time,
+
+            commit=commit,
+
+            cases=self.cases,
+            cases_skipped=self.cases_skipped,
+            cases_failures=self.cases_failures,
+            cases_errors=self.cases_errors,
+            cases_time=self.cases_time,
+            case_results=sort_case_results(case_results),
+
+            tests=len(self.tests),
+            tests_skipped=test_states['skipped'],
+            tests_failures=test_states['failure'],
+            tests_errors=test_states['error']
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(
+            version=partial_version,
+            files=self.files,
+            errors=[list(error.__getstate__()) for error in self.errors],
+            suites=self.suites,
+            suite_tests=self.suite_tests,
+            suite_skipped=self.suite_skipped,
+            suite_failures=self.suite_failures,
+            suite_errors=self.suite_errors,
+            suite_time=self.suite_time,
+
+            cases=self.cases,
+            cases_skipped=self.cases_skipped,
+            cases_failures=self.cases_failures,
+            cases_errors=self.cases_errors,
+            cases_time=self.cases_time,
+
+            # JSON has no tuple keys, so tests are lists of key, counts and retained cases
+            tests=[list(key) + [dict(counts), [list(case.__getstate__()) for case in self.retained.get(key, [])]]
+                   for key, counts in self.tests.items()]
+        )
+
+    @staticmethod
+    def from_dict(values: Dict[str, Any]) -> 'PartialUnitTestResults':
+        if values.get('version') != partial_version:
+            raise ValueError(f'Unsupported version of partial results: {values.get("version")}')
+
+        tests = dict()
+        retained = dict()
+        for test_file, class_name, test_name, counts, cases in values.get('tests', []):
+            key = (test_file, class_name, test_name)
+            tests[key] = Counter(counts)
+            if cases:
+                retained[key] = [UnitTestCase(*case) for case in cases]
+
+        return PartialUnitTestResults(
+            files=values.get('files'),
+            errors=[ParseError(*error) for error in values.get('errors', [])],
+            suites=values.get('suites'),
+            suite_tests=values.get('suite_tests'),
+            suite_skipped=values.get('suite_skipped'),
+            suite_failures=values.get('suite_failures'),
+            suite_errors=values.get('suite_errors'),
+            suite_time=values.get('suite_time'),
+
+            cases=values.get('cases'),
+            cases_skipped=values.get('cases_skipped'),
+            cases_failures=values.get('cases_failures'),
+            cases_errors=values.get('cases_errors'),
+            cases_time=values.get('cases_time'),
+
+            tests=tests,
+            retained=retained
+        )
+
+
+empty_partial_results = PartialUnitTestResults(
+    files=0, errors=[], suites=0, suite_tests=0, suite_skipped=0, suite_failures=0, suite_errors=0, suite_time=0,
+    cases=0, cases_skipped=0, cases_failures=0, cases_errors=0, cases_time=0.0, tests=dict(), retained=dict()
+)
+
+
+def merge_partial_results(partials: Iterable[PartialUnitTestResults]) -> PartialUnitTestResults:
+    """
+    Merges the given partial results. Those are merged into one set of sums, lists and dicts,
+    which are frozen into a PartialUnitTestResults once all partial results have been merged,
+    so merging takes time linear in the size of the partial results. The given partial results are not modified.
+    """
+    sums = {field: getattr(empty_partial_results, field) for field in summed_fields}
+    errors: List[ParseError] = []
+    tests: Dict[TestKey, Counter] = dict()
+    retained: Dict[TestKey, List[UnitTestCase]] = dict()
+
+    for partial in partials:
+        for field in summed_fields:
+            sums[field] += getattr(partial, field)
+        errors.extend(partial.errors)
+        for key, counts in partial.tests.items():
+            tests.setdefault(key, Counter()).update(counts)
+        for key, cases in partial.retained.items():
+            retained.setdefault(key, []).extend(cases)
+
+    return PartialUnitTestResults(errors=errors, tests=tests, retained=retained, **sums)
+
+
+def write_partial_results_file(path: str, partial: PartialUnitTestResults) -> None:
+    """Writes the partial results as gzip compressed JSON."""
+    with gzip.open(path, 'wt', encoding='utf-8') as w:
+        json.dump(partial.to_dict(), w, ensure_ascii=False, separators=(',', ':'))
+
+
+def read_partial_results_file(path: str) -> PartialUnitTestResults:
+    with gzip.open(path, 'rt', encoding='utf-8') as r:
+        return PartialUnitTestResults.from_dict(json.load(r))
+
+
+def merge_partial_results_files(files: Iterable[str]) -> PartialUnitTestResults:
+    """
+    Reads and merges the given partial results files. Files that cannot be read are
+    counted as files with an error, like result files that cannot be parsed.
+    """
+    def read(path: str) -> PartialUnitTestResults:
+        try:
+            return read_partial_results_file(path)
+        except BaseException as e:
+            error = ParseError(file=path, message=f'File is not a valid partial results file: {e}', line=None, column=None)
+            return dataclasses.replace(empty_partial_results, files=1, errors=[error])
+
+    # files are read one at a time while merging
+    return merge_partial_results(read(path) for path in files)
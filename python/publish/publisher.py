@@ -1,6 +1,6 @@
 import re
 from dataclasses import dataclass
-from typing import List, Any, Optional, Tuple, Mapping
+from typing import List, Any, Optional, Tuple, Mapping, Set, Callable, Iterator
 
 from github import Github, GithubException
 from github.CheckRun import CheckRun
@@ -9,13 +9,16 @@ from github.PullRequest import PullRequest
 
 from publish import hide_comments_mode_orphaned, hide_comments_mode_all_but_latest, \
     comment_mode_off, comment_mode_create, comment_mode_update, \
-    get_stats_from_digest, digest_prefix, get_short_summary, get_long_summary_md, \
-    get_long_summary_with_digest_md, get_error_annotations, get_case_annotations, \
-    get_all_tests_list_annotation, get_skipped_tests_list_annotation, get_all_tests_list, \
+    get_stats_from_digest, get_test_ids_from_digest, digest_prefix, get_short_summary, get_long_summary_md, \
+    get_long_summary_with_digest_md, get_error_annotations, CaseAnnotations, get_annotations_within_limit, \
+    get_annotation_batches, get_all_tests_list_annotation, get_skipped_tests_list_annotation, get_all_tests_list, \
     get_skipped_tests_list, all_tests_list, skipped_tests_list, pull_request_build_mode_merge, \
-    Annotation, SomeTestChanges
+    Annotation, SomeTestChanges, test_list_encoding_plain, test_list_encoding_front_coded, test_list_encoding_gzip, \
+    test_list_encoding_delta, test_list_encoding_markers, decode_front_coded_test_list, decode_gzip_test_list, \
+    get_test_list_annotation, get_test_list_delta_annotation, decode_test_list_delta, DeltaTestList
 from publish import logger
 from publish.github_action import GithubAction
+from publish.resources import degradation_test_lists
 from publish.unittestresults import UnitTestCaseResults, UnitTestRunResults, get_stats_delta
 
 
@@ -41,14 +44,36 @@ class Settings:
     report_individual_runs: bool
     dedup_classes_by_file_name: bool
     check_run_annotation: List[str]
+    test_include: Optional[str]
+    test_exclude: Optional[str]
+    memory_budget: Optional[int]
+    memory_limit_fraction: float
+    json_file: Optional[str]
+    partition_by: Optional[str]
+    mode: str
+    partial_file: Optional[str]
+    test_list_encoding: str
+    annotation_cluster_threshold: Optional[int]
+    max_annotations: Optional[int]
+    max_result_file_size: Optional[int]
+    max_result_file_cases: Optional[int]
 
 
 class Publisher:
 
-    def __init__(self, settings: Settings, gh: Github, gha: GithubAction):
+    def __init__(self,
+                 settings: Settings,
+                 gh: Github,
+                 gha: GithubAction,
+                 degradations: Optional[List[str]] = None,
+                 partitions: Optional[Mapping[str, UnitTestRunResults]] = None):
         self._settings = settings
         self._gh = gh
         self._gha = gha
+        # cheaper modes applied to save memory, as recorded by publish.resources.ResourceMonitor
+        self._degradations = degradations or []
+        # stats per partition of result files, see Settings.partition_by
+        self._partitions = partitions
         self._repo = gh.get_repo(self._settings.repo)
         self._req = gh._Github__requester
 
@@ -141,8 +166,15 @@ class Publisher:
 
         return runs[0]
 
+    def get_check_run_by_id(self, check_run_id: int) -> Optional[CheckRun]:
+        try:
+            return self._repo.get_check_run(check_run_id)
+        except GithubException as e:
+            logger.warning(f'could not find check run {check_run_id}: {e}')
+            return None
+
     @staticmethod
-    def get_stats_from_check_run(check_run: CheckRun) -> Optional[UnitTestRunResults]:
+    def get_digest_from_check_run(check_run: CheckRun) -> Optional[str]:
         summary = check_run.output.summary
         if summary is None:
             return None
@@ -153,15 +185,34 @@ class Publisher:
         if pos:
             digest = summary[pos + len(digest_prefix):]
             logger.debug(f'digest: {digest}')
+            return digest
+
+    @staticmethod
+    def get_stats_from_check_run(check_run: CheckRun) -> Optional[UnitTestRunResults]:
+        digest = Publisher.get_digest_from_check_run(check_run)
+        if digest:
             stats = get_stats_from_digest(digest)
             logger.debug(f'stats: {stats}')
             return stats
 
+    @staticmethod
+    def get_test_ids_from_check_run(check_run: Optional[CheckRun]) -> Tuple[Optional[Set[int]], Optional[Set[int]]]:
+        digest = Publisher.get_digest_from_check_run(check_run) if check_run is not None else None
+        if not digest:
+            return None, None
+        return get_test_ids_from_digest(digest)
+
     @staticmethod
     def get_test_list_from_annotation(annotation: CheckRunAnnotation) -> Optional[List[str]]:
         if annotation is None or not annotation.raw_details:
             return None
-        return annotation.raw_details.split('\n')
+        title = annotation.title or ''
+        if title.endswith(test_list_encoding_markers[test_list_encoding_gzip]):
+            return decode_gzip_test_list(annotation.raw_details)
+        tests = annotation.raw_details.split('\n')
+        if title.endswith(test_list_encoding_markers[test_list_encoding_front_coded]):
+            return decode_front_coded_test_list(tests)
+        return tests
 
     def publish_check(self,
                       stats: UnitTestRunResults,
@@ -176,19 +227,28 @@ class Publisher:
         stats_with_delta = get_stats_delta(stats, before_stats, 'earlier') if before_stats is not None else stats
         logger.debug(f'stats with delta: {stats_with_delta}')
 
+        # annotations are built, truncated and serialized batch by batch,
+        # so the first batch is sent before later annotations exist
         error_annotations = get_error_annotations(stats.errors)
-        case_annotations = get_case_annotations(cases, self._settings.report_individual_runs)
-        file_list_annotations = self.get_test_list_annotations(cases)
-        all_annotations = error_annotations + case_annotations + file_list_annotations
-
-        # we can send only 50 annotations at once, so we split them into chunks of 50
+        case_annotations = CaseAnnotations(cases, self._settings.report_individual_runs,
+                                           self._settings.annotation_cluster_threshold)
+        test_list_annotation_groups = self.get_test_list_annotation_groups(cases)
+        all_annotations = get_annotations_within_limit(error_annotations, case_annotations,
+                                                       test_list_annotation_groups, self._settings.max_annotations)
+
+        # the digest carries the ids of the tests, so later runs can detect test changes without test list annotations
+        all_tests, skipped_tests = self.get_test_lists(cases)
+        title = get_short_summary(stats)
+        summary = get_long_summary_with_digest_md(stats_with_delta, stats, self._degradations, self._partitions,
+                                                  all_tests, skipped_tests)
+
+        # we can send only 50 annotations at once, so we send them in batches of 50
         check_run = None
-        all_annotations = [all_annotations[x:x+50] for x in range(0, len(all_annotations), 50)] or [[]]
-        for annotations in all_annotations:
+        for annotations in get_annotation_batches(all_annotations, 50):
             output = dict(
-                title=get_short_summary(stats),
-                summary=get_long_summary_with_digest_md(stats_with_delta, stats),
-                annotations=[annotation.to_dict() for annotation in annotations]
+                title=title,
+                summary=summary,
+                annotations=annotations
             )
 
             logger.info('creating check')
@@ -201,12 +261,49 @@ class Publisher:
         return check_run
 
     @staticmethod
-    def get_test_lists_from_check_run(check_run: Optional[CheckRun]) -> Tuple[Optional[List[str]], Optional[List[str]]]:
+    def get_test_lists_from_check_run(check_run: Optional[CheckRun],
+                                      get_check_run_by_id: Optional[Callable[[int], Optional[CheckRun]]] = None) \
+            -> Tuple[Optional[List[str]], Optional[List[str]]]:
+        """
+        Provides the all tests and skipped tests lists of the given check run. Delta test lists are resolved
+        against the test lists of the check run they refer to, if get_check_run_by_id is given.
+        """
         if check_run is None:
             return None, None
 
-        all_tests_title_regexp = re.compile(r'^\d+ test(s)? found( \(tests \d+ to \d+\))?$')
-        skipped_tests_title_regexp = re.compile(r'^\d+ skipped test(s)? found( \(tests \d+ to \d+\))?$')
+        annotations = list(check_run.get_annotations())
+        all_tests_list, skipped_tests_list, all_tests_delta, skipped_tests_delta = \
+            Publisher.get_test_lists_from_annotations(annotations)
+
+        delta = all_tests_delta or skipped_tests_delta
+        if delta is not None and get_check_run_by_id is not None:
+            # referenced check runs have full test lists, see get_test_list_reference
+            reference = get_check_run_by_id(delta.reference_id)
+            reference_all_tests, reference_skipped_tests = Publisher.get_test_lists_from_check_run(reference)
+            if reference is not None:
+                all_tests_list = Publisher.apply_test_list_delta(all_tests_delta, reference_all_tests) or all_tests_list
+                skipped_tests_list = Publisher.apply_test_list_delta(skipped_tests_delta, reference_skipped_tests) or skipped_tests_list
+
+        return all_tests_list or None, skipped_tests_list or None
+
+    @staticmethod
+    def apply_test_list_delta(delta: Optional[DeltaTestList], reference: Optional[List[str]]) -> Optional[List[str]]:
+        if delta is None:
+            return None
+        tests = delta.apply(reference or [])
+        if tests is None:
+            logger.warning(f'test list does not match its hash after applying changes to test list of check run {delta.reference_id}')
+        return tests
+
+    @staticmethod
+    def get_test_lists_from_annotations(annotations: List[CheckRunAnnotation]) \
+            -> Tuple[List[str], List[str], Optional[DeltaTestList], Optional[DeltaTestList]]:
+        # chunks of test lists have titles with '(test 1 to 10)', test lists that are not plain end with a marker
+        markers = '|'.join(re.escape(marker)
+                           for encoding, marker in test_list_encoding_markers.items()
+                           if marker and encoding != test_list_encoding_delta)
+        all_tests_title_regexp = re.compile(rf'^\d+ test(s)? found( \(tests? \d+ to \d+\))?({markers})?$')
+        skipped_tests_title_regexp = re.compile(rf'^\d+ skipped test(s)? found( \(tests? \d+ to \d+\))?({markers})?$')
 
         all_tests_message_regexp = re.compile(
             r'^(There is 1 test, see "Raw output" for the name of the test)|'
@@ -217,11 +314,23 @@ class Publisher:
             r'(There are \d+ skipped tests, see "Raw output" for the full list of skipped tests)|'
             r'(There are \d+ skipped tests, see "Raw output" for the list of skipped tests \d+ to \d+)\.$')
 
-        annotations = list(check_run.get_annotations())
         all_tests_list = Publisher.get_test_list_from_annotations(annotations, all_tests_title_regexp, all_tests_message_regexp)
         skipped_tests_list = Publisher.get_test_list_from_annotations(annotations, skipped_tests_title_regexp, skipped_tests_message_regexp)
 
-        return all_tests_list or None, skipped_tests_list or None
+        delta_marker = re.escape(test_list_encoding_markers[test_list_encoding_delta])
+        all_tests_delta_title_regexp = re.compile(rf'^\d+ tests? found( \(changes \d+ to \d+\))?{delta_marker}$')
+        skipped_tests_delta_title_regexp = re.compile(rf'^\d+ skipped tests? found( \(changes \d+ to \d+\))?{delta_marker}$')
+        all_tests_delta_message_regexp = re.compile(
+            r'^See "Raw output" for the changes( \d+ to \d+)? to the tests of check run \d+\.$')
+        skipped_tests_delta_message_regexp = re.compile(
+            r'^See "Raw output" for the changes( \d+ to \d+)? to the skipped tests of check run \d+\.$')
+
+        all_tests_delta = Publisher.get_test_list_delta_from_annotations(
+            annotations, all_tests_delta_title_regexp, all_tests_delta_message_regexp)
+        skipped_tests_delta = Publisher.get_test_list_delta_from_annotations(
+            annotations, skipped_tests_delta_title_regexp, skipped_tests_delta_message_regexp)
+
+        return all_tests_list, skipped_tests_list, all_tests_delta, skipped_tests_delta
 
     @staticmethod
     def get_test_list_from_annotations(annotations: List[CheckRunAnnotation],
@@ -236,18 +345,105 @@ class Publisher:
 
         test_lists = [Publisher.get_test_list_from_annotation(test_annotation)
                       for test_annotation in test_annotations]
+        if any(test_list is None for test_list in test_lists):
+            # a chunk that cannot be decoded leaves the test list incomplete, which is as good as no test list
+            logger.warning('test list annotation cannot be decoded, ignoring the test list')
+            return []
         test_list = [test
                      for test_list in test_lists
                      if test_list
                      for test in test_list]
         return test_list
 
+    @staticmethod
+    def get_test_list_delta_from_annotations(annotations: List[CheckRunAnnotation],
+                                             title_regexp, message_regexp) -> Optional[DeltaTestList]:
+        deltas = [decode_test_list_delta(annotation.raw_details)
+                  for annotation in annotations
+                  if annotation and annotation.title and annotation.message and annotation.raw_details and
+                  title_regexp.match(annotation.title) and message_regexp.match(annotation.message)]
+        if not deltas:
+            return None
+
+        # all chunks of a delta test list have the same reference and hash
+        if any(delta.reference_id != deltas[0].reference_id or delta.hash != deltas[0].hash for delta in deltas):
+            logger.warning('chunks of delta test list refer to different test lists')
+            return None
+        return DeltaTestList(reference_id=deltas[0].reference_id,
+                             hash=deltas[0].hash,
+                             changes=[change for delta in deltas for change in delta.changes])
+
+    def get_test_list_reference(self) -> Tuple[Optional[CheckRun], List[str], List[str]]:
+        """
+        Provides the check run that delta test lists refer to, with its test lists. This is the check run
+        of the base commit of the pull request, or of the earlier commit if there is no pull request.
+        When that check run has delta test lists itself, the check run they refer to is provided instead,
+        so readers never need to resolve more than one reference.
+        """
+        pull = self.get_pull(self._settings.commit)
+        base_commit_sha = self.get_base_commit_sha(pull) if pull is not None else self._settings.event.get('before')
+        logger.debug(f'test lists refer to base={base_commit_sha}')
+        reference = self.get_check_run(base_commit_sha)
+        if reference is None:
+            return None, [], []
+
+        all_tests, skipped_tests, all_tests_delta, skipped_tests_delta = \
+            self.get_test_lists_from_annotations(list(reference.get_annotations()))
+        delta = all_tests_delta or skipped_tests_delta
+        if delta is not None:
+            reference = self.get_check_run_by_id(delta.reference_id)
+            all_tests, skipped_tests = self.get_test_lists_from_check_run(reference)
+        return reference, all_tests or [], skipped_tests or []
+
     def get_test_list_annotations(self, cases: UnitTestCaseResults) -> List[Annotation]:
-        all_tests = get_all_tests_list_annotation(cases) \
+        return [annotation for annotations in self.get_test_list_annotation_groups(cases) for annotation in annotations]
+
+    def get_test_lists(self, cases: UnitTestCaseResults) -> Tuple[Optional[List[str]], Optional[List[str]]]:
+        """Provides the lists of all and of skipped tests, or None if test lists have been degraded."""
+        # test lists of degraded runs are incomplete, they would show tests as removed
+        if degradation_test_lists in self._degradations:
+            return None, None
+        return get_all_tests_list(cases), get_skipped_tests_list(cases)
+
+    def get_test_list_annotation_groups(self, cases: UnitTestCaseResults) -> Iterator[List[Annotation]]:
+        """
+        Provides the annotations of each test list, which are only useful to readers all together.
+        Test lists are built only once their annotations are needed.
+        """
+        if degradation_test_lists in self._degradations:
+            return
+        encoding = self._settings.test_list_encoding
+        if encoding == test_list_encoding_delta:
+            reference, reference_all_tests, reference_skipped_tests = self.get_test_list_reference()
+            if reference is not None:
+                yield from self.get_test_list_delta_annotation_groups(cases, reference.id, reference_all_tests, reference_skipped_tests)
+                return
+            logger.info('there is no check run that test lists can refer to, listing all tests')
+            encoding = test_list_encoding_plain
+        if skipped_tests_list in self._settings.check_run_annotation:
+            skipped_tests = get_skipped_tests_list_annotation(cases, encoding=encoding)
+            if skipped_tests:
+                yield skipped_tests
+        if all_tests_list in self._settings.check_run_annotation:
+            all_tests = get_all_tests_list_annotation(cases, encoding=encoding)
+            if all_tests:
+                yield all_tests
+
+    def get_test_list_delta_annotation_groups(self,
+                                              cases: UnitTestCaseResults,
+                                              reference_id: int,
+                                              reference_all_tests: List[str],
+                                              reference_skipped_tests: List[str]) -> List[List[Annotation]]:
+        # test lists with at least as many changes as tests are listed in full
+        all_tests = get_all_tests_list(cases)
+        all_tests = (get_test_list_delta_annotation(all_tests, reference_all_tests, reference_id, 'test') or
+                     get_test_list_annotation(all_tests, 'test')) \
             if all_tests_list in self._settings.check_run_annotation else []
-        skipped_tests = get_skipped_tests_list_annotation(cases) \
+        skipped_tests = get_skipped_tests_list(cases)
+        skipped_tests = (get_test_list_delta_annotation(skipped_tests, reference_skipped_tests, reference_id, 'skipped test') or
+                         get_test_list_annotation(skipped_tests, 'skipped test')) \
             if skipped_tests_list in self._settings.check_run_annotation else []
-        return [annotation for annotation in skipped_tests + all_tests if annotation]
+        return [annotations for annotations in [skipped_tests, all_tests] if annotations]
 
     def publish_comment(self,
                         title: str,
@@ -265,10 +461,16 @@ class Publisher:
         stats_with_delta = get_stats_delta(stats, base_stats, 'base') if base_stats is not None else stats
         logger.debug(f'stats with delta: {stats_with_delta}')
 
-        # gather test lists from check run and cases
-        before_all_tests, before_skipped_tests = self.get_test_lists_from_check_run(base_check_run)
-        all_tests, skipped_tests = get_all_tests_list(cases), get_skipped_tests_list(cases)
-        test_changes = SomeTestChanges(before_all_tests, all_tests, before_skipped_tests, skipped_tests)
+        all_tests, skipped_tests = self.get_test_lists(cases)
+
+        # compare with ids of tests in the digest of the base check run, paging through its test list annotations
+        # is only needed when the digest has no ids, or to get the names of removed tests
+        before_all_test_ids, before_skipped_test_ids = self.get_test_ids_from_check_run(base_check_run)
+        test_changes = SomeTestChanges.from_test_ids(before_all_test_ids, all_tests, before_skipped_test_ids, skipped_tests) \
+            if before_all_test_ids is not None else None
+        if test_changes is None or not test_changes.has_names():
+            before_all_tests, before_skipped_tests = self.get_test_lists_from_check_run(base_check_run, self.get_check_run_by_id)
+            test_changes = SomeTestChanges(before_all_tests, all_tests, before_skipped_tests, skipped_tests)
 
         details_url = check_run.html_url if check_run else None
         summary = get_long_summary_md(stats_with_delta, details_url, test_changes, self._settings.test_changes_limit)
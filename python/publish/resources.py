@@ -0,0 +1,87 @@
+import logging
+import os
+from typing import Optional, List, Callable
+
+logger = logging.getLogger('publish')
+
+# cgroup v2 and v1 files that hold the memory limit of the container
+cgroup_memory_limit_files = ['/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes']
+
+# cheaper modes switched to when memory usage approaches the limit, in the order they apply
+degradation_failure_content = 'dropped failure details'
+degradation_case_results = 'stopped collecting test cases'
+degradation_test_lists = 'skipped test list annotations'
+
+
+def get_rss() -> Optional[int]:
+    """Returns the resident set size of this process in bytes, or None if it cannot be read."""
+    try:
+        with open('/proc/self/statm', 'rt') as r:
+            pages = int(r.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_memory_limit() -> Optional[int]:
+    """
+    Returns the memory limit of this process in bytes, which is the cgroup memory limit
+    if there is one, but no more than the physical memory. Returns None if neither is known.
+    """
+    limits = []
+    for path in cgroup_memory_limit_files:
+        try:
+            with open(path, 'rt') as r:
+                limit = r.read().strip()
+        except OSError:
+            continue
+        # cgroup v2 says 'max' when unlimited, v1 gives a huge number, which the physical memory caps
+        if limit.isdigit():
+            limits.append(int(limit))
+        break
+    try:
+        limits.append(os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE'))
+    except (OSError, ValueError, AttributeError):
+        pass
+    return min(limits) if limits else None
+
+
+class ResourceMonitor:
+    """
+    Samples the memory usage of this process and compares it with a fraction of the memory limit.
+    Once the threshold has been exceeded, the monitor stays exceeded, so the cheaper modes that
+    callers switched to are not reverted. Those record their degradations with the monitor.
+    """
+
+    def __init__(self,
+                 limit: Optional[int],
+                 fraction: float,
+                 rss: Callable[[], Optional[int]] = get_rss):
+        self._threshold = int(limit * fraction) if limit is not None else None
+        self._rss = rss
+        self._exceeded = False
+        self.degradations: List[str] = []
+
+    @staticmethod
+    def from_memory_limit(fraction: float) -> 'ResourceMonitor':
+        return ResourceMonitor(get_memory_limit(), fraction)
+
+    @property
+    def threshold(self) -> Optional[int]:
+        return self._threshold
+
+    def exceeded(self) -> bool:
+        if not self._exceeded and self._threshold is not None:
+            rss = self._rss()
+            if rss is not None and rss > self._threshold:
+                logger.warning(f'memory usage of {rss} bytes exceeds {self._threshold} bytes')
+                self._exceeded = True
+        return self._exceeded
+
+    def degrade(self, degradation: str) -> None:
+        if degradation not in self.degradations:
+            logger.warning(f'degrading to save memory: {degradation}')
+            self.degradations.append(degradation)
+
+    def degraded(self, degradation: str) -> bool:
+        return degradation in self.degradations
@@ -0,0 +1,99 @@
+import sqlite3
+from collections.abc import Mapping
+from typing import Optional, List, Dict, Tuple, Iterator, Any, Callable
+
+from publish.unittestresults import UnitTestCase
+
+TestKey = Tuple[Optional[str], Optional[str], Optional[str]]
+
+case_fields = ['result_file', 'test_file', 'line', 'class_name', 'test_name', 'result', 'message', 'content', 'time']
+
+
+class SpilledUnitTestCaseResults(Mapping):
+    """
+    Holds test cases grouped by test and result like UnitTestCaseResults, but in a temporary
+    SQLite database on disk. It is read-only through the Mapping interface, cases are added via add.
+
+    Iterating over keys or items streams from the database, only the cases of one test
+    are held in memory at a time. Tests and their states are iterated in insertion order,
+    or in sorted order once sorted.
+    """
+
+    def __init__(self):
+        # an empty filename creates a temporary on-disk database that is deleted when closed
+        self._db = sqlite3.connect('')
+        self._db.execute('CREATE TABLE tests (id INTEGER PRIMARY KEY, position INTEGER, test_file TEXT, class_name TEXT, test_name TEXT)')
+        self._db.execute(f'CREATE TABLE cases (test_id INTEGER, {", ".join(case_fields)})')
+        self._db.execute('CREATE INDEX cases_test_id ON cases (test_id)')
+        self._ids: Dict[TestKey, int] = dict()
+        # ids of removed tests are not reused
+        self._last_id = 0
+        self.is_sorted = False
+
+    def add(self, key: TestKey, case: UnitTestCase) -> None:
+        test_id = self._ids.get(key)
+        if test_id is None:
+            self._last_id += 1
+            test_id = self._ids[key] = self._last_id
+            self._db.execute('INSERT INTO tests VALUES (?, ?, ?, ?, ?)', (test_id, test_id) + key)
+        self._db.execute(f'INSERT INTO cases VALUES (?{", ?" * len(case_fields)})', (test_id,) + case.__getstate__())
+
+    def remove_result_file(self, result_file: str) -> None:
+        """Removes the cases of the given result file, and the tests that are then left without cases."""
+        self._db.execute('DELETE FROM cases WHERE result_file = ?', (result_file,))
+        removed = set(test_id for test_id, in self._db.execute('SELECT id FROM tests WHERE id NOT IN (SELECT test_id FROM cases)'))
+        if removed:
+            self._db.executemany('DELETE FROM tests WHERE id = ?', [(test_id,) for test_id in removed])
+            self._ids = {key: test_id for key, test_id in self._ids.items() if test_id not in removed}
+
+    def sort(self, key: Callable[[TestKey], Any]) -> None:
+        """Sorts the tests by the given key function, tests added later are not sorted."""
+        self._ids = dict(sorted(self._ids.items(), key=lambda item: key(item[0])))
+        self._db.executemany('UPDATE tests SET position = ? WHERE id = ?',
+                             [(position, test_id) for position, test_id in enumerate(self._ids.values(), start=1)])
+        self.is_sorted = True
+
+    def close(self) -> None:
+        self._db.close()
+
+    @staticmethod
+    def _case(row: Tuple[Any, ...]) -> UnitTestCase:
+        return UnitTestCase(*row)
+
+    def __getitem__(self, key: TestKey) -> Dict[str, List[UnitTestCase]]:
+        test_id = self._ids.get(key)
+        if test_id is None:
+            raise KeyError(key)
+        states: Dict[str, List[UnitTestCase]] = dict()
+        for row in self._db.execute(f'SELECT {", ".join(case_fields)} FROM cases WHERE test_id = ? ORDER BY rowid', (test_id,)):
+            case = self._case(row)
+            states.setdefault(case.result, []).append(case)
+        return states
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._ids
+
+    def __iter__(self) -> Iterator[TestKey]:
+        return iter(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def items(self) -> Iterator[Tuple[TestKey, Dict[str, List[UnitTestCase]]]]:
+        # a single query over all cases, grouped into tests on the fly
+        keys = iter(self._ids)
+        current_id, states = None, None
+        columns = ', '.join([f'cases.{field}' for field in case_fields])
+        for row in self._db.execute(f'SELECT cases.test_id, {columns} FROM cases JOIN tests ON tests.id = cases.test_id '
+                                    f'ORDER BY tests.position, cases.rowid'):
+            if row[0] != current_id:
+                if states is not None:
+                    yield next(keys), states
+                current_id, states = row[0], dict()
+            case = self._case(row[1:])
+            states.setdefault(case.result, []).append(case)
+        if states is not None:
+            yield next(keys), states
+
+    def values(self) -> Iterator[Dict[str, List[UnitTestCase]]]:
+        return (states for _, states in self.items())
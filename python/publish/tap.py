@@ -0,0 +1,209 @@
+import os
+import re
+from typing import Optional, Iterable, List, Callable, Tuple
+
+from publish.unittestresults import ParsedUnitTestResults, UnitTestCase, UnitTestCaseFilter, ResultFileError, \
+    ParseLimits, default_parse_limits, Interner, parse_files_case_by_case
+
+tap_extensions = ['.tap']
+
+test_line_regexp = re.compile(r'^(not )?ok\b\s*(\d+)?\s*(?:-\s*)?([^#]*?)\s*(?:#\s*(SKIP|TODO)\S*\s*(.*))?$', re.IGNORECASE)
+bail_out_regexp = re.compile(r'^Bail out!\s*(.*)$')
+plan_regexp = re.compile(r'^1\.\.(\d+)\s*(?:#\s*(.*))?$')
+yaml_start_regexp = re.compile(r'^(\s+)---\s*$')
+yaml_end_regexp = re.compile(r'^\s+\.\.\.\s*$')
+
+
+def is_tap_file(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in tap_extensions
+
+
+def get_yaml_scalar(lines: List[str], key: str) -> Optional[str]:
+    """
+    Returns the value of the given top-level key of the given YAML lines.
+    This understands plain, quoted and block scalars, which is all TAP producers write for messages.
+    """
+    for index, line in enumerate(lines):
+        if not line.startswith(f'{key}:'):
+            continue
+
+        value = line[len(key) + 1:].strip()
+        if value and value[0] in '|>':
+            block = []
+            for block_line in lines[index + 1:]:
+                if block_line and not block_line[0].isspace():
+                    break
+                block.append(block_line)
+            indent = min([len(line) - len(line.lstrip()) for line in block if line.strip()], default=0)
+            separator = '\n' if value[0] == '|' else ' '
+            return separator.join([line[indent:] for line in block]).strip('\n')
+        if len(value) >= 2 and value[0] == value[-1] == "'":
+            return value[1:-1].replace("''", "'")
+        if len(value) >= 2 and value[0] == value[-1] == '"':
+            return value[1:-1].replace('\\"', '"').replace('\\n', '\n')
+        return value or None
+    return None
+
+
+class TapTestPoints:
+    """
+    Turns TAP test points into UnitTestCase instances while the file is read line by line.
+    Only the last test point is held back until its YAML diagnostic block, if any, has been read.
+
+    Only top-level test points are considered, indented subtests are summarized by their parent test point.
+    Test points missing from the plan are reported as an error case, unless the producer bailed out.
+
+    https://testanything.org/tap-version-13-specification.html
+    """
+
+    def __init__(self,
+                 result_file: str,
+                 emit: Callable[[UnitTestCase], None],
+                 case_filter: Optional[UnitTestCaseFilter] = None,
+                 intern: Optional[Interner] = None):
+        self._result_file = result_file
+        self._class_name = os.path.splitext(os.path.basename(result_file))[0]
+        self._emit = emit
+        self._case_filter = case_filter
+        self._intern = intern if intern is not None else Interner()
+        self._pending: Optional[Tuple[str, str, Optional[str]]] = None
+        self._yaml: Optional[List[str]] = None
+        self._yaml_indent = 0
+        self.tests = 0
+        # number of planned test points, 0 for a file whose tests are all skipped
+        self.planned: Optional[int] = None
+        self.bailed_out = False
+
+    def add(self, line: str) -> None:
+        line = line.rstrip('\r\n')
+
+        if self._yaml is not None:
+            if yaml_end_regexp.match(line):
+                self._flush(self._yaml)
+                self._yaml = None
+            else:
+                self._yaml.append(line[self._yaml_indent:])
+            return
+
+        yaml_start = yaml_start_regexp.match(line)
+        if yaml_start and self._pending is not None:
+            self._yaml = []
+            self._yaml_indent = len(yaml_start.group(1))
+            return
+
+        if line and line[0].isspace():
+            # subtests and unexpected indented lines
+            return
+
+        test_line = test_line_regexp.match(line)
+        if test_line:
+            self._flush()
+            self.tests += 1
+            not_ok, number, description, directive, reason = test_line.groups()
+            directive = directive.upper() if directive else None
+            if directive == 'SKIP':
+                result = 'skipped'
+            elif directive == 'TODO':
+                # failing todo tests are expected to fail, passing todo tests are reported as passing
+                result = 'skipped' if not_ok else 'success'
+            else:
+                result = 'failure' if not_ok else 'success'
+            name = description or f'test {number or self.tests}'
+            if self._case_filter is None or self._case_filter.matches(self._class_name, name):
+                self._pending = (name, result, (reason or None) if directive else None)
+            return
+
+        bail_out = bail_out_regexp.match(line)
+        if bail_out:
+            self._flush()
+            self.bailed_out = True
+            self._emit(self._case('Bail out!', 'error', bail_out.group(1) or None, None, None))
+            return
+
+        plan = plan_regexp.match(line)
+        if plan:
+            self._flush()
+            self.planned = int(plan.group(1))
+            return
+
+        # plans, version lines, diagnostics and anything else ends a pending test point
+        self._flush()
+
+    def _case(self, name: str, result: str, message: Optional[str], content: Optional[str], time: Optional[float]) -> UnitTestCase:
+        return UnitTestCase(
+            result_file=self._result_file,
+            test_file=None,
+            line=None,
+            class_name=self._class_name,
+            test_name=name,
+            result=result,
+            message=self._intern(message),
+            content=self._intern(content),
+            time=time
+        )
+
+    def _flush(self, yaml: Optional[List[str]] = None) -> None:
+        if self._pending is None:
+            return
+
+        name, result, message = self._pending
+        self._pending = None
+
+        content = None
+        time = None
+        if yaml:
+            message = get_yaml_scalar(yaml, 'message') or message
+            content = '\n'.join(yaml)
+            duration = get_yaml_scalar(yaml, 'duration_ms')
+            try:
+                time = float(duration) / 1000 if duration else None
+            except ValueError:
+                pass
+
+        self._emit(self._case(name, result, message, content, time))
+
+    def close(self) -> None:
+        if self._yaml is not None:
+            # unterminated YAML block
+            self._flush(self._yaml)
+            self._yaml = None
+        self._flush()
+
+        # a producer that crashes leaves planned test points missing, a bail out explains those already
+        if self.planned is not None and self.planned != self.tests and not self.bailed_out:
+            self._emit(self._case('Planned tests', 'error', f'Planned {self.planned} tests, but found {self.tests}.', None, None))
+
+
+def parse_tap_file(path: str,
+                   emit: Callable[[UnitTestCase], None],
+                   case_filter: Optional[UnitTestCaseFilter] = None,
+                   intern: Optional[Interner] = None) -> Tuple[int, Optional[float]]:
+    """
+    Reads the given TAP file line by line and emits UnitTestCase instances.
+    Each TAP file is a suite, whose time is the time of its cases.
+    """
+    test_points = TapTestPoints(path, emit, case_filter, intern)
+    with open(path, 'rt', encoding='utf-8') as r:
+        for line in r:
+            test_points.add(line)
+    test_points.close()
+    # a plan of 1..0 skips all tests, which is valid without test points, as is a bail out before the first test point
+    if test_points.tests == 0 and test_points.planned is None and not test_points.bailed_out:
+        raise ResultFileError('File is not a valid TAP file:\nno test points found')
+    return 1, None
+
+
+def parse_tap_files(files: Iterable[str],
+                    case_filter: Optional[UnitTestCaseFilter] = None,
+                    limits: ParseLimits = default_parse_limits,
+                    intern: Optional[Interner] = None,
+                    emit: Optional[Callable[[UnitTestCase], None]] = None,
+                    rollback: Optional[Callable[[str], None]] = None) -> ParsedUnitTestResults:
+    """
+    Parses TAP files and returns aggregated statistics as a ParsedUnitTestResults.
+    With emit, test cases are passed to emit as they are read rather than returned,
+    and rollback is called with files that turn out to be invalid after some of their cases have been emitted.
+    """
+    if intern is None:
+        intern = Interner()
+    return parse_files_case_by_case(files, lambda path, emit: parse_tap_file(path, emit, case_filter, intern), limits, emit, rollback)
@@ -1,11 +1,37 @@
-from collections import defaultdict
-from dataclasses import dataclass
-from typing import Optional, List, Mapping, Any, Union, Dict
+import dataclasses
+import os
+import re
+import struct
+import sys
+import zlib
+from collections import defaultdict, Counter
+from dataclasses import dataclass, field
+from typing import Optional, List, Mapping, Any, Union, Dict, Pattern, Callable, Tuple, BinaryIO, Iterator, Set, Iterable
 from xml.etree.ElementTree import ParseError as XmlParseError
 
+from publish.resources import ResourceMonitor, degradation_failure_content, degradation_case_results
+
+
+class FrozenSlots:
+    """
+    Base class of frozen dataclasses that define __slots__. Those have no __dict__ for pickle and copy
+    to restore, and cannot be assigned to, so their state is provided and restored here.
+    """
+    __slots__ = ()
+
+    def __getstate__(self):
+        return tuple([getattr(self, name) for name in self.__slots__])
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            object.__setattr__(self, name, value)
+
 
 @dataclass(frozen=True)
-class UnitTestCase:
+class UnitTestCase(FrozenSlots):
+    # there can be millions of test cases, slots save the per-instance __dict__
+    __slots__ = ('result_file', 'test_file', 'line', 'class_name', 'test_name', 'result', 'message', 'content', 'time')
+
     result_file: str
     test_file: Optional[str]
     line: Optional[int]
@@ -17,15 +43,174 @@ class UnitTestCase:
     time: Optional[float]
 
 
+@dataclass(frozen=True)
+class UnitTestCaseFilter:
+    """
+    Selects test cases by class name and test name, applied by the parsers before cases are created.
+    A case is selected when the include pattern matches its class name or test name (if given),
+    and the exclude pattern matches neither (if given). Patterns match at the beginning of the names.
+    """
+    include: Optional[Pattern]
+    exclude: Optional[Pattern]
+
+    @staticmethod
+    def from_patterns(include: Optional[str], exclude: Optional[str]) -> Optional['UnitTestCaseFilter']:
+        if not include and not exclude:
+            return None
+        return UnitTestCaseFilter(
+            include=re.compile(include) if include else None,
+            exclude=re.compile(exclude) if exclude else None
+        )
+
+    def matches(self, class_name: Optional[str], test_name: Optional[str]) -> bool:
+        def match(pattern: Pattern) -> bool:
+            return class_name is not None and pattern.match(class_name) is not None or \
+                   test_name is not None and pattern.match(test_name) is not None
+
+        if self.include is not None and not match(self.include):
+            return False
+        return self.exclude is None or not match(self.exclude)
+
+
+class Interner(dict):
+    """
+    Stores equal strings only once. Calling an interner with a string returns the first equal
+    string it has seen, e.g. the one message or stack trace shared by thousands of test cases
+    that fail due to the same broken fixture. Grouping those strings by dict keys is cheap
+    as the keys are identical, so no full string comparison is needed.
+
+    A released interner drops its strings and returns further strings as they are.
+    """
+    # set by release
+    released = False
+
+    def __call__(self, string: Optional[str]) -> Optional[str]:
+        if string is None or self.released:
+            return string
+        return self.setdefault(string, string)
+
+    def release(self) -> None:
+        """Drops the strings seen so far and stops storing strings, once strings are no longer held in memory."""
+        self.clear()
+        self.released = True
+
+
 class UnitTestCaseResults(defaultdict):
+    # set by sort_case_results, tests added later are not sorted
+    is_sorted = False
+
     def __init__(self, items=None):
         if items is None:
             items = []
         super(UnitTestCaseResults, self).__init__(lambda: defaultdict(list), items)
 
 
+def get_test_name(file_name: Optional[str],
+                  class_name: Optional[str],
+                  test_name: Optional[str]) -> str:
+    if not test_name:
+        test_name = 'Unknown test'
+
+    name = []
+    token = ' ‑ '  # U+2011 non-breaking hyphen
+    for part in [file_name, class_name, test_name]:
+        if part:
+            name.append(part.replace(token, ' ‐ '))  # U+2010 breaking hyphen
+
+    return token.join(name)
+
+
+def get_test_key_name(key: Tuple[Optional[str], Optional[str], Optional[str]]) -> str:
+    return get_test_name(*key)
+
+
+def sort_case_results(case_results: UnitTestCaseResults) -> UnitTestCaseResults:
+    """
+    Returns the case results with tests sorted by test name. Iterating over the returned case results
+    provides cases, annotations and test lists in a deterministic order that does not need sorting again.
+    """
+    sorted_case_results = UnitTestCaseResults(sorted(case_results.items(), key=lambda item: get_test_key_name(item[0])))
+    sorted_case_results.is_sorted = True
+    return sorted_case_results
+
+
+# states of tests, results of cases other than these count as skipped, like in aggregate_states
+test_states = ['success', 'skipped', 'failure', 'error']
+
+
+class UnitTestTreeNode:
+    # one node per package and class, slots save the per-instance __dict__
+    __slots__ = ('cases', 'tests', 'time', 'children')
+
+    def __init__(self):
+        self.cases: Counter = Counter()
+        self.tests: Counter = Counter()
+        self.time = 0.0
+        self.children: Dict[str, 'UnitTestTreeNode'] = dict()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns a compact dict of this node and its children, states with zero counts are omitted."""
+        dictionary = dict(
+            cases={state: self.cases[state] for state in test_states if self.cases[state]},
+            tests={state: self.tests[state] for state in test_states if self.tests[state]},
+            time=round(self.time, 3)
+        )
+        if self.children:
+            dictionary['children'] = {name: child.to_dict() for name, child in self.children.items()}
+        return dictionary
+
+
+class UnitTestTree:
+    """
+    Rolls up the number of cases and tests per state, and the time of cases, at each level of the
+    dotted class names. Cases and tests of class 'com.example.FooTest' count towards the nodes
+    'com', 'com.example' and 'com.example.FooTest'. The root node holds the totals,
+    cases and tests without class name only count towards the root.
+    """
+
+    def __init__(self):
+        self.root = UnitTestTreeNode()
+        # nodes from the root to the class, for each class seen so far
+        self._paths: Dict[Optional[str], List[UnitTestTreeNode]] = dict()
+
+    def _path(self, class_name: Optional[str]) -> List[UnitTestTreeNode]:
+        path = self._paths.get(class_name)
+        if path is None:
+            node = self.root
+            path = [node]
+            for name in class_name.split('.') if class_name else []:
+                child = node.children.get(name)
+                if child is None:
+                    child = node.children[name] = UnitTestTreeNode()
+                node = child
+                path.append(node)
+            self._paths[class_name] = path
+        return path
+
+    def add_class(self, class_name: Optional[str], cases: Mapping[str, int], tests: Mapping[str, int], time: float) -> None:
+        """Adds the number of cases and tests per state and the time of cases of the given class at once."""
+        for node in self._path(class_name):
+            node.cases.update(cases)
+            node.tests.update(tests)
+            node.time += time
+
+    def get(self, name: Optional[str]) -> Optional[UnitTestTreeNode]:
+        """Returns the node of the given package or class name, the root for None."""
+        node = self.root
+        for part in name.split('.') if name else []:
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.root.to_dict()
+
+
 @dataclass(frozen=True)
-class ParseError:
+class ParseError(FrozenSlots):
+    __slots__ = ('file', 'message', 'line', 'column')
+
     file: str
     message: str
     line: Optional[int]
@@ -44,9 +229,72 @@ class ParseError:
             elif msg.startswith('Invalid format.'):
                 msg = f'File is not a valid JUnit file:\n{msg}'
             return ParseError(file=file, message=msg, line=line, column=column)
+        if isinstance(exception, ResultFileError):
+            return ParseError(file=file, message=str(exception), line=exception.line, column=None)
         return ParseError(file=file, message=str(exception), line=None, column=None)
 
 
+class ResultFileError(ValueError):
+    """Raised by parsers for result files that are not valid, optionally at the given line."""
+    def __init__(self, message: str, line: Optional[int] = None):
+        super().__init__(message)
+        self.line = line
+
+
+class ParseLimitError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class ParseLimits:
+    """
+    Resource limits of the parsers. A file that exceeds any of these limits is
+    stopped early and reported as a ParseError, rather than exhausting the runner.
+    The defaults do not limit valid result files of any size, only hostile XML.
+    """
+    # size of a result file in bytes, unlimited if None
+    max_file_size: Optional[int] = None
+    # nesting depth of XML elements
+    max_depth: int = 256
+    # number of XML entity declarations, and number of characters of text and attribute values after entity expansion,
+    # text is never limited below the size of the file, which only entity expansion can exceed
+    max_entities: int = 64
+    max_text_size: int = 256 * 1024 * 1024
+    # number of test cases in a single result file, unlimited if None
+    max_cases: Optional[int] = None
+
+    def check_file_size(self, path: str) -> None:
+        if self.max_file_size is None:
+            return
+        size = os.stat(path).st_size
+        if size > self.max_file_size:
+            raise ParseLimitError(f'File size of {size} bytes exceeds limit of {self.max_file_size} bytes.')
+
+    def get_max_text_size(self, path: str) -> int:
+        return max(self.max_text_size, os.stat(path).st_size)
+
+    def check_cases(self, cases: int) -> None:
+        if self.max_cases is not None and cases > self.max_cases:
+            raise ParseLimitError(f'File exceeds limit of {self.max_cases} test cases.')
+
+    def count_cases(self, emit: Callable[[UnitTestCase], None]) -> Callable[[UnitTestCase], None]:
+        """Wraps the given emit function, which then raises ParseLimitError when too many cases are emitted."""
+        if self.max_cases is None:
+            return emit
+        cases = 0
+
+        def counting_emit(case: UnitTestCase) -> None:
+            nonlocal cases
+            cases += 1
+            self.check_cases(cases)
+            emit(case)
+
+        return counting_emit
+
+
+default_parse_limits = ParseLimits()
+
+
 @dataclass(frozen=True)
 class ParsedUnitTestResults:
     files: int
@@ -60,6 +308,7 @@ class ParsedUnitTestResults:
     cases: List[UnitTestCase]
 
     def with_commit(self, commit: str) -> 'ParsedUnitTestResultsWithCommit':
+        """Adds the commit. The errors and cases lists are shared with the returned instance, not copied."""
         return ParsedUnitTestResultsWithCommit(
             self.files,
             self.errors,
@@ -87,7 +336,15 @@ class ParsedUnitTestResultsWithCommit(ParsedUnitTestResults):
                    tests: int,
                    tests_skipped: int,
                    tests_failures: int,
-                   tests_errors: int) -> 'UnitTestResults':
+                   tests_errors: int,
+                   tree: Optional[UnitTestTree] = None,
+                   partitions: Optional[Dict[str, 'UnitTestRunResults']] = None,
+                   cases: Optional[int] = None) -> 'UnitTestResults':
+        """
+        Adds the statistics. The errors list and the given case_results are shared with the returned instance,
+        not copied. The returned instance does not reference the cases list, only their number,
+        which is given when cases have not been retained by this instance.
+        """
         return UnitTestResults(
             files=self.files,
             errors=self.errors,
@@ -100,7 +357,7 @@ class ParsedUnitTestResultsWithCommit(ParsedUnitTestResults):
 
             commit=self.commit,
 
-            cases=len(self.cases),
+            cases=len(self.cases) if cases is None else cases,
             cases_skipped=cases_skipped,
             cases_failures=cases_failures,
             cases_errors=cases_errors,
@@ -110,10 +367,88 @@ class ParsedUnitTestResultsWithCommit(ParsedUnitTestResults):
             tests=tests,
             tests_skipped=tests_skipped,
             tests_failures=tests_failures,
-            tests_errors=tests_errors
+            tests_errors=tests_errors,
+
+            tree=tree,
+            partitions=partitions
         )
 
 
+def parse_files_case_by_case(files: Iterable[str],
+                             parse_file: Callable[[str, Callable[[UnitTestCase], None]], Tuple[int, Optional[float]]],
+                             limits: ParseLimits = default_parse_limits,
+                             emit: Optional[Callable[[UnitTestCase], None]] = None,
+                             rollback: Optional[Callable[[str], None]] = None) -> ParsedUnitTestResults:
+    """
+    Parses result files that have no suite statistics, like TAP and JSON lines files. The given parse_file
+    function reads one file, passes its test cases to the given emit function one by one and returns the number
+    of suites of that file, and their time or None if that is the time of the cases. It raises an exception
+    for a file that cannot be parsed, which is reported as a ParseError.
+
+    Test state counts come from cases. With emit, test cases are passed to emit as they are read rather than returned.
+    Cases of a file that cannot be parsed are discarded, with emit the given rollback function is called with that file.
+    """
+    cases: List[UnitTestCase] = []
+    errors: List[ParseError] = []
+    suites = 0
+    suite_time = 0.0
+    # results of cases, which provide the test state counts
+    case_results = Counter()
+    files = list(files)
+
+    for path in files:
+        if not os.path.exists(path):
+            errors.append(ParseError.from_exception(path, FileNotFoundError('File does not exist.')))
+            continue
+        if os.stat(path).st_size == 0:
+            errors.append(ParseError.from_exception(path, Exception('File is empty.')))
+            continue
+
+        # cases of a file are only taken when the whole file could be read, like for JUnit files,
+        # but they are not held until then, only their counts
+        file_start = len(cases)
+        file_results = Counter()
+        file_cases_time = 0.0
+
+        def add(case: UnitTestCase) -> None:
+            nonlocal file_cases_time
+            file_results[case.result] += 1
+            if case.time:
+                file_cases_time += case.time
+            if emit is None:
+                cases.append(case)
+            else:
+                emit(case)
+
+        try:
+            limits.check_file_size(path)
+            file_suites, file_time = parse_file(path, limits.count_cases(add))
+        except BaseException as e:
+            errors.append(ParseError.from_exception(path, e))
+            if emit is None:
+                del cases[file_start:]
+            elif rollback is not None:
+                rollback(path)
+            continue
+
+        suites += file_suites
+        suite_time += file_time if file_time is not None else file_cases_time
+        case_results.update(file_results)
+
+    return ParsedUnitTestResults(
+        files=len(files),
+        errors=errors,
+        suites=suites,
+        suite_tests=sum(case_results.values()),
+        suite_skipped=case_results['skipped'],
+        suite_failures=case_results['failure'],
+        suite_errors=case_results['error'],
+        suite_time=int(suite_time),
+        # test cases
+        cases=cases
+    )
+
+
 @dataclass(frozen=True)
 class UnitTestResults(ParsedUnitTestResultsWithCommit):
     cases: int
@@ -128,6 +463,11 @@ class UnitTestResults(ParsedUnitTestResultsWithCommit):
     tests_failures: int
     tests_errors: int
 
+    # counts and times per package and class, derived from the cases, so not compared
+    tree: Optional[UnitTestTree] = field(default=None, compare=False)
+    # stats per partition of result files, derived from the cases, so not compared
+    partitions: Optional[Dict[str, 'UnitTestRunResults']] = field(default=None, compare=False)
+
 
 @dataclass(frozen=True)
 class UnitTestRunResults:
@@ -151,6 +491,7 @@ class UnitTestRunResults:
     commit: str
 
     def with_errors(self, errors: List[ParseError]):
+        """Replaces the errors. The given errors list is shared with the returned instance, not copied."""
         return UnitTestRunResults(
             files=self.files,
             errors=errors,
@@ -249,6 +590,21 @@ class UnitTestRunDeltaResults:
 UnitTestRunResultsOrDeltaResults = Union[UnitTestRunResults, UnitTestRunDeltaResults]
 
 
+def merge_parsed_results(results: List[ParsedUnitTestResults]) -> ParsedUnitTestResults:
+    """Merges results of multiple parsers into a single ParsedUnitTestResults."""
+    return ParsedUnitTestResults(
+        files=sum([result.files for result in results]),
+        errors=[error for result in results for error in result.errors],
+        suites=sum([result.suites for result in results]),
+        suite_tests=sum([result.suite_tests for result in results]),
+        suite_skipped=sum([result.suite_skipped for result in results]),
+        suite_failures=sum([result.suite_failures for result in results]),
+        suite_errors=sum([result.suite_errors for result in results]),
+        suite_time=sum([result.suite_time for result in results]),
+        cases=[case for result in results for case in result.cases]
+    )
+
+
 def aggregate_states(states: List[str]) -> str:
     return 'error' if 'error' in states else \
            'failure' if 'failure' in states else \
@@ -256,52 +612,452 @@ def aggregate_states(states: List[str]) -> str:
            'skipped'
 
 
+def get_case_size(case: UnitTestCase, charged: Set[int]) -> int:
+    """
+    Estimates the memory in bytes held by the given case. Result files, test files, class names,
+    messages and contents are shared between cases by the parsers, so they are charged only to the
+    first case that holds them, remembered by their id in charged. Test names are charged to every case.
+    """
+    size = sys.getsizeof(case) + sys.getsizeof(case.test_name)
+    for value in [case.result_file, case.test_file, case.class_name, case.message, case.content]:
+        if value is not None and id(value) not in charged:
+            charged.add(id(value))
+            size += sys.getsizeof(value)
+    return size
+
+
+def get_partition(partition_by: Pattern, result_file: str) -> Optional[str]:
+    """
+    Returns the partition of the given result file, which are the groups captured by the pattern
+    joined by '/', or the matched text if the pattern has no groups. Returns None if the pattern does not match.
+    """
+    match = partition_by.search(result_file)
+    if match is None:
+        return None
+    if not match.groups():
+        return match.group(0)
+    return '/'.join([group for group in match.groups() if group is not None])
+
+
+# severity of test states, a test has the most severe state of its cases,
+# other results count as skipped, like in aggregate_states
+test_state_severity = {'skipped': 0, 'success': 1, 'failure': 2, 'error': 3}
+
+
+class UnitTestStates:
+    """
+    Maintains the aggregated state of each test, and running totals of cases per state,
+    as cases are added one by one.
+    """
+
+    def __init__(self):
+        self.test_states: Dict[Tuple[Optional[str], Optional[str], Optional[str]], str] = dict()
+        self.cases_per_state: Counter = Counter()
+        self.cases_time = 0.0
+        # only maintained by callers that need the number of files
+        self.result_files = set()
+
+    def add_case(self, key: Tuple[Optional[str], Optional[str], Optional[str]], case: UnitTestCase) -> None:
+        """Adds the case of the test with the given key. This is called for every case, so it is kept lean."""
+        result = case.result
+        self.cases_per_state[result] += 1
+        if case.time:
+            self.cases_time += case.time
+
+        # aggregating the state with the new case's result is the same as aggregating all cases' results
+        test_states = self.test_states
+        state = test_states.get(key)
+        if state is None:
+            test_states[key] = result if result in test_state_severity else 'skipped'
+        elif test_state_severity.get(result, 0) > test_state_severity[state]:
+            test_states[key] = result
+
+    def add_states(self, states: 'UnitTestStates') -> None:
+        """Adds the cases of the given states, which is the same as adding those cases one by one."""
+        self.cases_per_state.update(states.cases_per_state)
+        self.cases_time += states.cases_time
+        test_states = self.test_states
+        for key, state in states.test_states.items():
+            current = test_states.get(key)
+            if current is None or test_state_severity[state] > test_state_severity[current]:
+                test_states[key] = state
+        self.result_files.update(states.result_files)
+
+    @property
+    def tests(self) -> int:
+        return len(self.test_states)
+
+    @property
+    def tests_per_state(self) -> Counter:
+        """Counts the tests per state, which is cheaper than maintaining those counts case by case."""
+        return Counter(self.test_states.values())
+
+    def get_stats(self, errors: List[ParseError], commit: str) -> 'UnitTestRunResults':
+        """
+        Provides stats from the cases added so far. There are no suite statistics, so runs come from cases,
+        the number of suites is unknown and the duration is the time of the cases.
+        """
+        cases = sum(self.cases_per_state.values())
+        tests_per_state = self.tests_per_state
+        return UnitTestRunResults(
+            files=len(self.result_files),
+            errors=errors,
+            suites=0,
+            duration=int(self.cases_time),
+
+            tests=self.tests,
+            tests_succ=tests_per_state['success'],
+            tests_skip=tests_per_state['skipped'],
+            tests_fail=tests_per_state['failure'],
+            tests_error=tests_per_state['error'],
+
+            runs=cases,
+            runs_succ=self.cases_per_state['success'],
+            runs_skip=cases - self.cases_per_state['success'] - self.cases_per_state['failure'] - self.cases_per_state['error'],
+            runs_fail=self.cases_per_state['failure'],
+            runs_error=self.cases_per_state['error'],
+
+            commit=commit
+        )
+
+
+# number of cases added to a UnitTestIndex between samples of the memory usage
+monitor_interval = 10000
+
+
+class UnitTestIndex(UnitTestStates):
+    """
+    Groups test cases by test in a single pass over the cases. Besides the cases of each test
+    by state (the UnitTestCaseResults), this provides the aggregated state of each test,
+    and totals of cases and tests per state. Those are also counted per partition of result files
+    if a partition_by pattern is given, and per class if a tree is requested, which get_tree rolls up
+    per package and class once all cases have been added.
+
+    Cases held in memory are counted test by test once all cases have been added, which is much cheaper
+    than counting them one by one. Only once cases are spilled to disk or no longer retained,
+    further cases are counted as they are added. Cases of the last result file are counted apart
+    until cases of another file are added, so that remove_result_file can remove them
+    when that file turns out to be invalid.
+
+    Parsers store equal strings of cases once by the index's intern, which is released once cases
+    are spilled to disk or no longer retained, as the index then does not hold strings of further cases.
+
+    With a resource monitor, memory usage is sampled while cases are added. When it exceeds
+    the monitor's threshold, the index degrades: content of cases is dropped and no further
+    cases are retained, while statistics still count all cases.
+    """
+
+    def __init__(self,
+                 dedup_classes_by_file_name: bool,
+                 memory_budget: Optional[int] = None,
+                 monitor: Optional[ResourceMonitor] = None,
+                 partition_by: Optional[Pattern] = None,
+                 tree: bool = False):
+        super().__init__()
+        self._dedup_classes_by_file_name = dedup_classes_by_file_name
+        self._memory_budget = memory_budget
+        self._memory = 0
+        # ids of shared strings that have been charged to the memory budget
+        self._charged: Set[int] = set()
+        self.intern = Interner()
+        self._monitor = monitor
+        # number of cases to add until the next sample of the memory usage
+        self._monitor_countdown = monitor_interval
+        self._collecting = True
+        # whether the cases in case_results have been counted, further cases are then counted when added
+        self._counted = False
+        # whether cases are only grouped in memory when added, which is the fast path of add
+        self._grouping = memory_budget is None
+        self.case_results: Union[UnitTestCaseResults, 'SpilledUnitTestCaseResults'] = UnitTestCaseResults()
+        self.spilled = False
+        # number of cases per class and result, and time of cases per class, only counted for the tree
+        self._class_cases: Optional[Counter] = Counter() if tree else None
+        self._class_time: Optional[Dict[Optional[str], float]] = defaultdict(float) if tree else None
+        self._partition_by = partition_by
+        self._partition_of_result_file: Dict[str, Optional[str]] = dict()
+        self.partitions: Dict[str, UnitTestStates] = dict()
+        # result file of the last case added, and the counts of its cases, which may still be removed
+        self._file: Optional[str] = None
+        self._file_states = UnitTestStates()
+        self._file_class_cases: Optional[Counter] = Counter() if tree else None
+        self._file_class_time: Optional[Dict[Optional[str], float]] = defaultdict(float) if tree else None
+
+    def spill(self) -> None:
+        """Moves the cases into a temporary SQLite database, further cases are added to that database."""
+        from publish.spill import SpilledUnitTestCaseResults
+
+        self.count()
+        spilled = SpilledUnitTestCaseResults()
+        for key, states in self.case_results.items():
+            # adding cases state by state keeps the order of states and of cases of each state
+            for cases in states.values():
+                for case in cases:
+                    spilled.add(key, case)
+        self.case_results = spilled
+        self.spilled = True
+        # strings of cases are not held in memory any more, so there is nothing to share or charge
+        self.intern.release()
+        self._charged = set()
+
+    def sort(self) -> None:
+        """Sorts the tests of the case results by test name, once all cases have been added."""
+        # no cases are removed once all cases have been added
+        self.count_file()
+        self._file = None
+        self.count()
+        if self.spilled:
+            self.case_results.sort(get_test_key_name)
+        else:
+            self.case_results = sort_case_results(self.case_results)
+
+    def degrade(self) -> None:
+        """Drops the content of retained cases and stops retaining further cases."""
+        self.count()
+        # dropped content and strings of cases that are not retained need not be shared,
+        # the intern would otherwise keep them in memory
+        self.intern.release()
+        if not self.spilled:
+            # cases are replaced one by one, so each replaced case is released right away,
+            # the parsers do not hold cases that have been passed to the index
+            for states in self.case_results.values():
+                for cases in states.values():
+                    for index, case in enumerate(cases):
+                        if case.content is not None:
+                            cases[index] = dataclasses.replace(case, content=None)
+            self._monitor.degrade(degradation_failure_content)
+        self._monitor.degrade(degradation_case_results)
+        self._collecting = False
+
+    def add(self, case: UnitTestCase) -> None:
+        # this is called for every case, so cases held in memory are only grouped here, with as few lookups as possible
+        key = (case.test_file if self._dedup_classes_by_file_name else None, case.class_name, case.test_name)
+        self._monitor_countdown -= 1
+        if self._monitor_countdown <= 0:
+            self._monitor_countdown = monitor_interval
+            if self._collecting and self._monitor is not None and self._monitor.exceeded():
+                self.degrade()
+
+        if self._grouping:
+            self.case_results[key][case.result].append(case)
+            self._file = case.result_file
+            return
+
+        # spilling counts this case with the cases held in memory
+        counted = self._counted
+        if counted and case.result_file != self._file:
+            self.count_file()
+        self._file = case.result_file
+        if self._collecting:
+            if self.spilled:
+                self.case_results.add(key, case)
+            else:
+                self.case_results[key][case.result].append(case)
+                if self._memory_budget is not None:
+                    self._memory += get_case_size(case, self._charged)
+                    if self._memory > self._memory_budget:
+                        self.spill()
+
+        if counted:
+            self.count_file_case(key, case)
+
+    def count(self) -> None:
+        """Counts the cases held in memory, test by test. This is called once all cases have been added."""
+        if self._counted:
+            return
+        self._counted = True
+        self._grouping = False
+
+        count_cases = self._class_cases is not None or self._partition_by is not None
+        test_states = self.test_states
+        cases_per_state = self.cases_per_state
+        cases_time = 0.0
+        file = self._file
+        for key, states in self.case_results.items():
+            # cases of the last result file are counted apart, they are the last cases of their test and state
+            if file is not None and any([cases[-1].result_file == file for cases in states.values()]):
+                for cases in states.values():
+                    for case in cases:
+                        if case.result_file == file:
+                            self.count_file_case(key, case)
+                        else:
+                            self.add_case(key, case)
+                            if count_cases:
+                                self.count_case(key, case)
+                continue
+
+            test_states[key] = aggregate_states(states)
+            for result, cases in states.items():
+                cases_per_state[result] += len(cases)
+                for case in cases:
+                    if case.time:
+                        cases_time += case.time
+                    if count_cases:
+                        self.count_case(key, case)
+        self.cases_time += cases_time
+
+    def count_case(self, key: Tuple[Optional[str], Optional[str], Optional[str]], case: UnitTestCase) -> None:
+        """Counts the given case towards its class and its partition."""
+        if self._class_cases is not None:
+            self._class_cases[(case.class_name, case.result)] += 1
+            self._class_time[case.class_name] += case.time or 0
+
+        if self._partition_by is not None:
+            partition = self.get_partition(case.result_file)
+            if partition is not None:
+                states = self.partitions.get(partition)
+                if states is None:
+                    states = self.partitions[partition] = UnitTestStates()
+                states.add_case(key, case)
+                states.result_files.add(case.result_file)
+
+    def count_file_case(self, key: Tuple[Optional[str], Optional[str], Optional[str]], case: UnitTestCase) -> None:
+        """Counts the given case of the last result file apart from the cases of other files."""
+        self._file_states.add_case(key, case)
+        if self._file_class_cases is not None:
+            self._file_class_cases[(case.class_name, case.result)] += 1
+            self._file_class_time[case.class_name] += case.time or 0
+
+    def count_file(self) -> None:
+        """Adds the counts of the cases of the last result file to the counts of all cases."""
+        states = self._file_states
+        if not states.cases_per_state:
+            return
+
+        self.add_states(states)
+        if self._class_cases is not None:
+            self._class_cases.update(self._file_class_cases)
+            for class_name, time in self._file_class_time.items():
+                self._class_time[class_name] += time
+        if self._partition_by is not None:
+            partition = self.get_partition(self._file)
+            if partition is not None:
+                partition_states = self.partitions.get(partition)
+                if partition_states is None:
+                    partition_states = self.partitions[partition] = UnitTestStates()
+                partition_states.add_states(states)
+                partition_states.result_files.add(self._file)
+        self.clear_file()
+
+    def clear_file(self) -> None:
+        """Drops the counts of the cases of the last result file."""
+        self._file_states = UnitTestStates()
+        if self._file_class_cases is not None:
+            self._file_class_cases = Counter()
+            self._file_class_time = defaultdict(float)
+
+    def remove_result_file(self, result_file: str) -> None:
+        """
+        Removes the cases of the given result file, which turned out to be invalid after some of its cases
+        have been added. Only cases of the last result file are removed, cases of other files have been counted.
+        """
+        if result_file != self._file:
+            return
+        self._file = None
+        self.clear_file()
+
+        if self.spilled:
+            self.case_results.remove_result_file(result_file)
+            return
+        # cases of the last result file are the last cases of their test and state
+        case_results = self.case_results
+        for key in list(case_results):
+            states = case_results[key]
+            for result in list(states):
+                cases = states[result]
+                while cases and cases[-1].result_file == result_file:
+                    cases.pop()
+                if not cases:
+                    del states[result]
+            if not states:
+                del case_results[key]
+
+    def get_tree(self) -> Optional[UnitTestTree]:
+        """Rolls up the counts per class into a UnitTestTree, if a tree has been requested."""
+        if self._class_cases is None:
+            return None
+
+        # there are few classes, but many cases and tests per class
+        cases = defaultdict(Counter)
+        for (class_name, result), count in self._class_cases.items():
+            cases[class_name][result if result in test_states else 'skipped'] += count
+        tests = defaultdict(Counter)
+        for (test_file, class_name, test_name), state in self.test_states.items():
+            tests[class_name][state] += 1
+
+        tree = UnitTestTree()
+        for class_name, time in self._class_time.items():
+            tree.add_class(class_name, cases[class_name], tests[class_name], time)
+        return tree
+
+    def get_test_results(self, parsed_results: ParsedUnitTestResultsWithCommit) -> 'UnitTestResults':
+        """
+        Adds the statistics of the cases added so far to the given parsed results. Cases may have been added
+        while parsing, in which case the parsed results do not hold them.
+        """
+        self.sort()
+        tests_per_state = self.tests_per_state
+
+        partitions = None
+        if self._partition_by is not None:
+            errors = defaultdict(list)
+            for error in parsed_results.errors:
+                partition = self.get_partition(error.file)
+                if partition is not None:
+                    errors[partition].append(error)
+            partitions = {partition: self.partitions.get(partition, UnitTestStates()).get_stats(errors[partition], parsed_results.commit)
+                          for partition in sorted(set(self.partitions).union(errors))}
+
+        return parsed_results.with_stats(
+            # test states and counts from cases
+            cases=sum(self.cases_per_state.values()),
+            cases_skipped=self.cases_per_state['skipped'],
+            cases_failures=self.cases_per_state['failure'],
+            cases_errors=self.cases_per_state['error'],
+            cases_time=self.cases_time,
+            case_results=self.case_results,
+
+            tests=self.tests,
+            # distinct test states by case name
+            tests_skipped=tests_per_state['skipped'],
+            tests_failures=tests_per_state['failure'],
+            tests_errors=tests_per_state['error'],
+
+            tree=self.get_tree(),
+            partitions=partitions
+        )
+
+    def get_partition(self, result_file: str) -> Optional[str]:
+        # there are few result files, but many cases per result file
+        if result_file not in self._partition_of_result_file:
+            self._partition_of_result_file[result_file] = get_partition(self._partition_by, result_file)
+        return self._partition_of_result_file[result_file]
+
+
 def get_test_results(parsed_results: ParsedUnitTestResultsWithCommit,
-                     dedup_classes_by_file_name: bool) -> UnitTestResults:
+                     dedup_classes_by_file_name: bool,
+                     memory_budget: Optional[int] = None,
+                     monitor: Optional[ResourceMonitor] = None,
+                     partition_by: Optional[Pattern] = None,
+                     tree: bool = False) -> UnitTestResults:
     """
     Computes case and test statistics and returns them as a UnitTestResults instance.
     With dedup_classes_by_file_name=True, considers file name to identify classes,
-    not just their class name.
+    not just their class name. With partition_by, also computes stats per partition
+    of result files, see get_partition. With tree, also rolls up counts per package and class.
 
     :param parsed_results: parsed unit test results
     :param dedup_classes_by_file_name: 
+    :param memory_budget: bytes of cases to hold in memory before they are moved to disk, unlimited if None
+    :param monitor: monitors memory usage, case results are degraded when memory usage exceeds its threshold
+    :param partition_by: pattern of result files that captures their partition
+    :param tree: whether to provide counts per package and class
     :return: unit test result statistics
     """
-    cases = parsed_results.cases
-    cases_skipped = [case for case in cases if case.result == 'skipped']
-    cases_failures = [case for case in cases if case.result == 'failure']
-    cases_errors = [case for case in cases if case.result == 'error']
-    cases_time = sum([case.time or 0 for case in cases])
-
-    # group cases by tests
-    cases_results = UnitTestCaseResults()
-    for case in cases:
-        key = (case.test_file if dedup_classes_by_file_name else None, case.class_name, case.test_name)
-        cases_results[key][case.result].append(case)
-
-    test_results = dict()
-    for test, states in cases_results.items():
-        test_results[test] = aggregate_states(states)
-
-    tests = len(test_results)
-    tests_skipped = len([test for test, state in test_results.items() if state == 'skipped'])
-    tests_failures = len([test for test, state in test_results.items() if state == 'failure'])
-    tests_errors = len([test for test, state in test_results.items() if state == 'error'])
-
-    return parsed_results.with_stats(
-        # test states and counts from cases
-        cases_skipped=len(cases_skipped),
-        cases_failures=len(cases_failures),
-        cases_errors=len(cases_errors),
-        cases_time=cases_time,
-        case_results=cases_results,
-
-        tests=tests,
-        # distinct test states by case name
-        tests_skipped=tests_skipped,
-        tests_failures=tests_failures,
-        tests_errors=tests_errors,
-    )
+    # group cases by tests and count states in a single pass
+    index = UnitTestIndex(dedup_classes_by_file_name, memory_budget, monitor, partition_by, tree)
+    for case in parsed_results.cases:
+        index.add(case)
+    return index.get_test_results(parsed_results)
 
 
 def get_stats(test_results: UnitTestResults) -> UnitTestRunResults:
@@ -370,3 +1126,336 @@ def get_stats_delta(stats: UnitTestRunResults,
         reference_type=reference_type,
         reference_commit=reference_stats.commit
     )
+
+
+# Compact binary format of parsed results, much smaller and faster to read than the result files:
+#
+#   header:  magic, varint version, varint flags
+#   blocks:  varint byte length, then
+#            varint number of cases, strings new to the string table,
+#            length-prefixed columns of varints: result_file, test_file, class_name, test_name, result
+#            (string table references), line (optional signed ints), message, content (text table references),
+#            one byte per case whether it has a time, little-endian doubles of those times,
+#            length-prefixed text section of texts new to the text table, zlib compressed if flagged
+#   end:     varint 0, then varint byte length and footer with the statistics and parse errors
+#
+# References are indices into tables that grow from block to block, where 0 means None.
+# Equal strings and texts are written once, and read back as one shared str instance.
+binary_results_magic = b'PUTR'
+binary_results_version = 1
+binary_results_flag_compressed_text = 1
+binary_results_block_size = 4096
+
+binary_results_string_columns = ['result_file', 'test_file', 'class_name', 'test_name', 'result']
+binary_results_text_columns = ['message', 'content']
+
+
+def write_varint(buffer: bytearray, value: int) -> None:
+    while value > 0x7f:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def write_optional_int(buffer: bytearray, value: Optional[int]) -> None:
+    # 0 is None, signed values are zigzag encoded so that small negative values are small too
+    write_varint(buffer, 0 if value is None else (value * 2 if value >= 0 else -value * 2 - 1) + 1)
+
+
+def write_bytes(buffer: bytearray, value: bytes) -> None:
+    write_varint(buffer, len(value))
+    buffer.extend(value)
+
+
+def write_strings(buffer: bytearray, strings: List[str]) -> None:
+    write_varint(buffer, len(strings))
+    for string in strings:
+        write_bytes(buffer, string.encode('utf-8'))
+
+
+def read_varints(data: bytes) -> List[int]:
+    """Returns all varints of data. This is the hot loop of reading cases, so it decodes a whole column at once."""
+    if not data or max(data) < 0x80:
+        return list(data)
+    values = []
+    value = shift = 0
+    for byte in data:
+        if byte < 0x80:
+            values.append(value | (byte << shift))
+            value = shift = 0
+        else:
+            value |= (byte & 0x7f) << shift
+            shift += 7
+    return values
+
+
+def from_optional_int(value: int) -> Optional[int]:
+    if value == 0:
+        return None
+    value -= 1
+    return value >> 1 if value & 1 == 0 else -((value + 1) >> 1)
+
+
+def read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """Returns the varint at the given position of data, and the position after it."""
+    value = shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError('Binary results are truncated')
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def read_optional_int(data: bytes, pos: int) -> Tuple[Optional[int], int]:
+    value, pos = read_varint(data, pos)
+    return from_optional_int(value), pos
+
+
+def read_bytes(data: bytes, pos: int) -> Tuple[bytes, int]:
+    length, pos = read_varint(data, pos)
+    if pos + length > len(data):
+        raise ValueError('Binary results are truncated')
+    return data[pos:pos + length], pos + length
+
+
+def read_strings(data: bytes, pos: int, strings: List[Optional[str]]) -> int:
+    """Appends the strings at the given position of data to the given list, returns the position after them."""
+    count, pos = read_varint(data, pos)
+    for _ in range(count):
+        string, pos = read_bytes(data, pos)
+        strings.append(string.decode('utf-8'))
+    return pos
+
+
+class BinaryResultsWriter:
+    """
+    Writes parsed results in the compact binary format to a binary stream. Cases are written
+    in blocks as they are added, so no more than one block of cases is held in memory.
+    Finishing writes the remaining cases and the statistics and parse errors of the results.
+    """
+
+    def __init__(self,
+                 stream: BinaryIO,
+                 compress_text: bool = True,
+                 block_size: int = binary_results_block_size):
+        self._stream = stream
+        self._compress_text = compress_text
+        self._block_size = block_size
+        self._strings: Dict[str, int] = dict()
+        self._texts: Dict[str, int] = dict()
+        self._cases: List[UnitTestCase] = []
+
+        header = bytearray(binary_results_magic)
+        write_varint(header, binary_results_version)
+        write_varint(header, binary_results_flag_compressed_text if compress_text else 0)
+        stream.write(header)
+
+    def add(self, case: UnitTestCase) -> None:
+        self._cases.append(case)
+        if len(self._cases) >= self._block_size:
+            self._write_block()
+
+    def finish(self, results: ParsedUnitTestResults) -> None:
+        """Writes the remaining cases and the footer. The cases of the given results are ignored, those have to be added."""
+        if self._cases:
+            self._write_block()
+
+        footer = bytearray()
+        for value in [results.files, results.suites, results.suite_tests, results.suite_skipped,
+                      results.suite_failures, results.suite_errors, results.suite_time]:
+            write_varint(footer, value)
+        write_varint(footer, len(results.errors))
+        for error in results.errors:
+            write_strings(footer, [error.file, error.message])
+            write_optional_int(footer, error.line)
+            write_optional_int(footer, error.column)
+
+        end = bytearray()
+        write_varint(end, 0)
+        write_bytes(end, bytes(footer))
+        self._stream.write(end)
+
+    @staticmethod
+    def _ref(table: Dict[str, int], new: List[str], value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        ref = table.get(value)
+        if ref is None:
+            ref = len(table) + 1
+            table[value] = ref
+            new.append(value)
+        return ref
+
+    def _write_block(self) -> None:
+        cases, self._cases = self._cases, []
+        new_strings = []
+        new_texts = []
+
+        columns = bytearray()
+        for column in binary_results_string_columns:
+            values = bytearray()
+            for case in cases:
+                write_varint(values, self._ref(self._strings, new_strings, getattr(case, column)))
+            write_bytes(columns, bytes(values))
+        values = bytearray()
+        for case in cases:
+            write_optional_int(values, case.line)
+        write_bytes(columns, bytes(values))
+        for column in binary_results_text_columns:
+            values = bytearray()
+            for case in cases:
+                write_varint(values, self._ref(self._texts, new_texts, getattr(case, column)))
+            write_bytes(columns, bytes(values))
+        times = [case.time for case in cases if case.time is not None]
+        columns.extend(bytes([case.time is not None for case in cases]))
+        columns.extend(struct.pack(f'<{len(times)}d', *times))
+
+        text = bytearray()
+        write_strings(text, new_texts)
+        text = zlib.compress(bytes(text)) if self._compress_text else bytes(text)
+
+        block = bytearray()
+        write_varint(block, len(cases))
+        write_strings(block, new_strings)
+        block.extend(columns)
+        write_bytes(block, text)
+
+        out = bytearray()
+        write_bytes(out, bytes(block))
+        self._stream.write(out)
+
+
+class BinaryResultsReader:
+    """
+    Reads parsed results in the compact binary format from a binary stream. Iterating
+    over the reader provides the cases block by block, after which the results property
+    provides the statistics and parse errors. Reading the stream to its end is what read does.
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self._strings: List[Optional[str]] = [None]
+        self._texts: List[Optional[str]] = [None]
+        self._results: Optional[ParsedUnitTestResults] = None
+
+        if stream.read(len(binary_results_magic)) != binary_results_magic:
+            raise ValueError('Not binary results')
+        version = self._read_varint()
+        if version != binary_results_version:
+            raise ValueError(f'Unsupported version of binary results: {version}')
+        self._compressed_text = self._read_varint() & binary_results_flag_compressed_text != 0
+
+    @property
+    def results(self) -> Optional[ParsedUnitTestResults]:
+        """The statistics and parse errors without cases, available once all cases have been read."""
+        return self._results
+
+    def read(self) -> ParsedUnitTestResults:
+        cases = list(self)
+        return dataclasses.replace(self._results, cases=cases)
+
+    def __iter__(self) -> Iterator[UnitTestCase]:
+        while True:
+            data = self._read_bytes()
+            if not data:
+                break
+            yield from self._read_block(data)
+        self._results = self._read_footer(self._read_bytes())
+
+    def _read_varint(self) -> int:
+        value = shift = 0
+        while True:
+            byte = self._stream.read(1)
+            if not byte:
+                raise ValueError('Binary results are truncated')
+            value |= (byte[0] & 0x7f) << shift
+            if byte[0] < 0x80:
+                return value
+            shift += 7
+
+    def _read_bytes(self) -> bytes:
+        length = self._read_varint()
+        data = self._stream.read(length)
+        if len(data) != length:
+            raise ValueError('Binary results are truncated')
+        return data
+
+    def _read_block(self, data: bytes) -> List[UnitTestCase]:
+        count, pos = read_varint(data, 0)
+        pos = read_strings(data, pos, self._strings)
+
+        def read_column() -> List[int]:
+            nonlocal pos
+            column, pos = read_bytes(data, pos)
+            values = read_varints(column)
+            if len(values) != count:
+                raise ValueError('Binary results are corrupt')
+            return values
+
+        strings = self._strings
+        string_columns = [[strings[ref] for ref in read_column()] for _ in binary_results_string_columns]
+        lines = [from_optional_int(value) for value in read_column()]
+        text_refs = [read_column() for _ in binary_results_text_columns]
+
+        has_time = data[pos:pos + count]
+        pos += count
+        times = iter(struct.unpack_from(f'<{sum(has_time)}d', data, pos))
+        pos += 8 * sum(has_time)
+        times = [next(times) if has else None for has in has_time]
+
+        text, pos = read_bytes(data, pos)
+        if self._compressed_text:
+            text = zlib.decompress(text)
+        read_strings(text, 0, self._texts)
+        texts = self._texts
+        text_columns = [[texts[ref] for ref in refs] for refs in text_refs]
+
+        result_files, test_files, class_names, test_names, results = string_columns
+        messages, contents = text_columns
+        # positional arguments in the order of UnitTestCase fields
+        return [UnitTestCase(*row)
+                for row in zip(result_files, test_files, lines, class_names, test_names, results, messages, contents, times)]
+
+    @staticmethod
+    def _read_footer(data: bytes) -> ParsedUnitTestResults:
+        values = []
+        pos = 0
+        for _ in range(8):
+            value, pos = read_varint(data, pos)
+            values.append(value)
+        files, suites, suite_tests, suite_skipped, suite_failures, suite_errors, suite_time, error_count = values
+
+        errors = []
+        for _ in range(error_count):
+            strings = []
+            pos = read_strings(data, pos, strings)
+            line, pos = read_optional_int(data, pos)
+            column, pos = read_optional_int(data, pos)
+            errors.append(ParseError(file=strings[0], message=strings[1], line=line, column=column))
+
+        return ParsedUnitTestResults(
+            files=files,
+            errors=errors,
+            suites=suites,
+            suite_tests=suite_tests,
+            suite_skipped=suite_skipped,
+            suite_failures=suite_failures,
+            suite_errors=suite_errors,
+            suite_time=suite_time,
+            cases=[]
+        )
+
+
+def write_binary_results(stream: BinaryIO, results: ParsedUnitTestResults, compress_text: bool = True) -> None:
+    writer = BinaryResultsWriter(stream, compress_text)
+    for case in results.cases:
+        writer.add(case)
+    writer.finish(results)
+
+
+def read_binary_results(stream: BinaryIO) -> ParsedUnitTestResults:
+    return BinaryResultsReader(stream).read()
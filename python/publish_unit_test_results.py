@@ -3,7 +3,7 @@ import logging
 import os
 import re
 from glob import glob
-from typing import List, Optional, Union
+from typing import List, Optional, Union, Mapping, Callable
 
 import github
 from urllib3.util.retry import Retry
@@ -11,11 +11,18 @@ from urllib3.util.retry import Retry
 import publish
 from publish import hide_comments_modes, available_annotations, default_annotations, \
     pull_request_build_modes, fail_on_modes, fail_on_mode_errors, fail_on_mode_failures, \
-    comment_mode_off, comment_mode_update, comment_modes
+    comment_mode_off, comment_mode_update, comment_modes, mode_publish, mode_prepare, mode_merge, modes, \
+    test_list_encoding_plain, test_list_encodings
 from publish.github_action import GithubAction
+from publish.jsonlines import parse_json_lines_files, is_json_lines_file, is_json_file
 from publish.junit import parse_junit_xml_files
+from publish.partial import PartialUnitTestResults, write_partial_results_file, merge_partial_results_files
 from publish.publisher import Publisher, Settings
-from publish.unittestresults import get_test_results, get_stats, ParsedUnitTestResults
+from publish.resources import ResourceMonitor, degradation_case_results, degradation_test_lists
+from publish.tap import parse_tap_files, is_tap_file
+from publish.unittestresults import get_stats, ParsedUnitTestResults, merge_parsed_results, \
+    UnitTestCaseFilter, ParseLimits, default_parse_limits, Interner, UnitTestTree, UnitTestRunResults, UnitTestResults, \
+    UnitTestCase, UnitTestIndex
 
 logger = logging.getLogger('publish-unit-test-results')
 
@@ -48,13 +55,47 @@ def get_files(multiline_files_globs: str) -> List[str]:
                 for files_glob in multiline_files_globs
                 if files_glob.startswith('!')
                 for file in glob(files_glob[1:], recursive=True)}
-    return list(included - excluded)
+    # sorted files make the order of cases, annotations and test lists independent of the hash seed
+    return sorted(included - excluded)
+
+
+def parse_files(files: List[str],
+                case_filter: Optional[UnitTestCaseFilter] = None,
+                limits: ParseLimits = default_parse_limits,
+                intern: Optional[Interner] = None,
+                emit: Optional[Callable[[UnitTestCase], None]] = None,
+                rollback: Optional[Callable[[str], None]] = None) -> ParsedUnitTestResults:
+    json_lines_files = [file for file in files if is_json_lines_file(file)]
+    # other JSON documents matched by the files glob are not result files, rather than files that fail to parse
+    other_json_files = set(file for file in files if is_json_file(file)).difference(json_lines_files)
+    if other_json_files:
+        logger.info(f'ignoring {len(other_json_files)} JSON files that are not go test or pytest report-log files')
+        logger.debug(f'ignoring {sorted(other_json_files)}')
+    tap_files = [file for file in files if is_tap_file(file)]
+    not_junit_files = other_json_files.union(json_lines_files, tap_files)
+    junit_files = [file for file in files if file not in not_junit_files]
+
+    # equal messages and stack traces are stored once across all files
+    if intern is None:
+        intern = Interner()
+    # JUnit files are read as a whole before their cases are emitted, other files emit cases as they are read,
+    # so cases emitted before such a file turns out to be invalid are rolled back
+    parsed = [parse(files, case_filter, limits, intern, emit, **kwargs)
+              for parse, files, kwargs in [(parse_junit_xml_files, junit_files, dict()),
+                                           (parse_json_lines_files, json_lines_files, dict(rollback=rollback)),
+                                           (parse_tap_files, tap_files, dict(rollback=rollback))]
+              if files]
+    if len(parsed) == 0:
+        return parse_junit_xml_files([], case_filter, limits, intern, emit)
+    if len(parsed) == 1:
+        return parsed[0]
+    return merge_parsed_results(parsed)
 
 
 def main(settings: Settings, gha: GithubAction) -> None:
     # we cannot create a check run or pull request comment
-    # when running on pull_request event from a fork
-    if settings.event_name == 'pull_request' and \
+    # when running on pull_request event from a fork, preparing partial results works nevertheless
+    if settings.mode != mode_prepare and settings.event_name == 'pull_request' and \
             settings.event.get('pull_request', {}).get('head', {}).get('repo', {}).get('full_name') != settings.repo:
         gha.warning(f'This action is running on a pull_request event for a fork repository. '
                     f'It cannot do anything useful like creating check runs or pull request comments.')
@@ -68,23 +109,71 @@ def main(settings: Settings, gha: GithubAction) -> None:
         logger.info(f'reading {settings.files_glob}')
         logger.debug(f'reading {list(files)}')
 
-    # get the unit test results
-    parsed = parse_junit_xml_files(files).with_commit(settings.commit)
-    [gha.error(message=f'Error processing result file: {error.message}', file=error.file, line=error.line, column=error.column)
-     for error in parsed.errors]
+    # samples memory usage, cheaper modes are used when it comes close to the memory limit
+    monitor = ResourceMonitor.from_memory_limit(settings.memory_limit_fraction)
 
-    # process the parsed results
-    results = get_test_results(parsed, settings.dedup_classes_by_file_name)
+    if settings.mode == mode_merge:
+        # the files are partial results written in prepare mode, which has reported their parse errors already
+        results = merge_partial_results_files(files).to_results(settings.commit)
+    else:
+        results = get_results(settings, files, gha, monitor)
+
+    # write the counts and times per package and class, and the stats per partition
+    # partial results do not carry these, so they are not available in merge mode
+    if settings.json_file:
+        if results.tree is not None:
+            write_json_file(settings.json_file, results.tree, results.partitions)
+        else:
+            logger.warning(f'not writing {settings.json_file} in {settings.mode} mode')
+
+    if settings.mode == mode_prepare:
+        logger.info(f'writing partial results to {settings.partial_file}')
+        write_partial_results_file(settings.partial_file, PartialUnitTestResults.from_results(results))
+        return
 
     # turn them into stats
     stats = get_stats(results)
 
     # derive check run conclusion from files
-    conclusion = get_conclusion(parsed, fail_on_failures=settings.fail_on_failures, fail_on_errors=settings.fail_on_errors)
+    conclusion = get_conclusion(results, fail_on_failures=settings.fail_on_failures, fail_on_errors=settings.fail_on_errors)
+
+    # test lists are incomplete when cases have not all been collected, and expensive to build
+    if monitor.degraded(degradation_case_results) or monitor.exceeded():
+        monitor.degrade(degradation_test_lists)
 
     # publish the delta stats
     gh = get_github(token=settings.token, url=settings.api_url, retries=10, backoff_factor=1)
-    Publisher(settings, gh, gha).publish(stats, results.case_results, conclusion)
+    Publisher(settings, gh, gha, monitor.degradations, results.partitions).publish(stats, results.case_results, conclusion)
+
+
+def get_results(settings: Settings, files: List[str], gha: GithubAction, monitor: ResourceMonitor) -> UnitTestResults:
+    # get the unit test results, test cases are filtered while parsing
+    case_filter = UnitTestCaseFilter.from_patterns(settings.test_include, settings.test_exclude)
+    limits = ParseLimits(max_file_size=settings.max_result_file_size, max_cases=settings.max_result_file_cases)
+    partition_by = re.compile(settings.partition_by) if settings.partition_by else None
+    # counts per package and class are only needed for the JSON file
+    tree = settings.json_file is not None
+    # the parsers pass cases to the index, which groups them by test, so parsed cases are never held
+    # all at once besides the index, which samples memory usage and spills to disk while files are parsed,
+    # cases of files that turn out to be invalid are removed from the index
+    index = UnitTestIndex(settings.dedup_classes_by_file_name, settings.memory_budget, monitor, partition_by, tree)
+    parsed = parse_files(files, case_filter, limits, index.intern, emit=index.add, rollback=index.remove_result_file).with_commit(settings.commit)
+    [gha.error(message=f'Error processing result file: {error.message}', file=error.file, line=error.line, column=error.column)
+     for error in parsed.errors]
+
+    # process the parsed results
+    return index.get_test_results(parsed)
+
+
+def write_json_file(path: str, tree: UnitTestTree, partitions: Optional[Mapping[str, UnitTestRunResults]] = None) -> None:
+    logger.info(f'writing test counts per package and class to {path}')
+    content = dict(tree=tree.to_dict())
+    if partitions is not None:
+        # errors are not needed, like in the digest
+        content['partitions'] = {partition: {key: value for key, value in stats.to_dict().items() if key != 'errors'}
+                                 for partition, stats in partitions.items()}
+    with open(path, 'wt', encoding='utf-8') as w:
+        json.dump(content, w, ensure_ascii=False, separators=(',', ':'))
 
 
 def get_commit_sha(event: dict, event_name: str, options: dict):
@@ -152,6 +241,23 @@ def deprecate_var(val: Optional[str], deprecated_var: str, replacement_var: str,
             gha.warning(message)
 
 
+def check_regex(var: Optional[str], name: str) -> None:
+    if var is not None:
+        try:
+            re.compile(var)
+        except re.error as e:
+            raise RuntimeError(f"Value '{var}' is not a valid regular expression for variable {name}: {e}")
+
+
+def check_fraction(var: str, name: str) -> None:
+    try:
+        fraction = float(var)
+    except ValueError:
+        fraction = None
+    if fraction is None or not 0 < fraction <= 1:
+        raise RuntimeError(f"Value '{var}' is not supported for variable {name}, expected: number larger than 0 and at most 1")
+
+
 def get_settings(options: dict, gha: Optional[GithubAction] = None) -> Settings:
     event = get_var('GITHUB_EVENT_PATH', options)
     event_name = get_var('GITHUB_EVENT_NAME', options)
@@ -163,6 +269,27 @@ def get_settings(options: dict, gha: Optional[GithubAction] = None) -> Settings:
     graphql_url = options.get('GITHUB_GRAPHQL_URL') or f'{github.MainClass.DEFAULT_BASE_URL}/graphql'
     test_changes_limit = get_var('TEST_CHANGES_LIMIT', options)
     test_changes_limit = int(test_changes_limit) if test_changes_limit and test_changes_limit.isdigit() else 10
+    memory_budget = get_var('MEMORY_BUDGET', options) or None
+    if memory_budget is not None and not memory_budget.isdigit():
+        raise RuntimeError(f"Value '{memory_budget}' is not supported for variable MEMORY_BUDGET, expected: number of megabytes")
+    memory_limit_fraction = get_var('MEMORY_LIMIT_FRACTION', options) or '0.9'
+    annotation_cluster_threshold = get_var('ANNOTATION_CLUSTER_THRESHOLD', options) or None
+    if annotation_cluster_threshold is not None and not (annotation_cluster_threshold.isdigit() and int(annotation_cluster_threshold) > 0):
+        raise RuntimeError(f"Value '{annotation_cluster_threshold}' is not supported for variable ANNOTATION_CLUSTER_THRESHOLD, "
+                           f"expected: positive number of tests")
+    max_annotations = get_var('MAX_ANNOTATIONS', options) or None
+    if max_annotations is not None and not max_annotations.isdigit():
+        raise RuntimeError(f"Value '{max_annotations}' is not supported for variable MAX_ANNOTATIONS, "
+                           f"expected: number of annotations")
+    max_result_file_size = get_var('MAX_RESULT_FILE_SIZE', options) or None
+    if max_result_file_size is not None and not max_result_file_size.isdigit():
+        raise RuntimeError(f"Value '{max_result_file_size}' is not supported for variable MAX_RESULT_FILE_SIZE, "
+                           f"expected: number of megabytes")
+    max_result_file_cases = get_var('MAX_RESULT_FILE_CASES', options) or None
+    if max_result_file_cases is not None and not max_result_file_cases.isdigit():
+        raise RuntimeError(f"Value '{max_result_file_cases}' is not supported for variable MAX_RESULT_FILE_CASES, "
+                           f"expected: number of test cases")
+    check_fraction(memory_limit_fraction, 'MEMORY_LIMIT_FRACTION')
 
     check_name = get_var('CHECK_NAME', options) or 'Unit Test Results'
     annotations = get_annotations_config(options, event)
@@ -193,7 +320,20 @@ def get_settings(options: dict, gha: Optional[GithubAction] = None) -> Settings:
         hide_comment_mode=get_var('HIDE_COMMENTS', options) or 'all but latest',
         report_individual_runs=get_var('REPORT_INDIVIDUAL_RUNS', options) == 'true',
         dedup_classes_by_file_name=get_var('DEDUPLICATE_CLASSES_BY_FILE_NAME', options) == 'true',
-        check_run_annotation=annotations
+        check_run_annotation=annotations,
+        test_include=get_var('TEST_INCLUDE', options) or None,
+        test_exclude=get_var('TEST_EXCLUDE', options) or None,
+        memory_budget=int(memory_budget) * 1024 * 1024 if memory_budget is not None else None,
+        memory_limit_fraction=float(memory_limit_fraction),
+        json_file=get_var('JSON_FILE', options) or None,
+        partition_by=get_var('PARTITION_BY', options) or None,
+        mode=get_var('MODE', options) or mode_publish,
+        partial_file=get_var('PARTIAL_FILE', options) or 'partial-results.json.gz',
+        test_list_encoding=get_var('TEST_LIST_ENCODING', options) or test_list_encoding_plain,
+        annotation_cluster_threshold=int(annotation_cluster_threshold) if annotation_cluster_threshold is not None else None,
+        max_annotations=int(max_annotations) if max_annotations is not None else None,
+        max_result_file_size=int(max_result_file_size) * 1024 * 1024 if max_result_file_size is not None else None,
+        max_result_file_cases=int(max_result_file_cases) if max_result_file_cases is not None else None
     )
 
     check_var(settings.token, 'GITHUB_TOKEN', 'GitHub token')
@@ -203,6 +343,11 @@ def get_settings(options: dict, gha: Optional[GithubAction] = None) -> Settings:
     check_var(settings.pull_request_build, 'PULL_REQUEST_BUILD', 'Pull Request build', pull_request_build_modes)
     check_var(settings.hide_comment_mode, 'HIDE_COMMENTS', 'Hide comments mode', hide_comments_modes)
     check_var(settings.check_run_annotation, 'CHECK_RUN_ANNOTATIONS', 'Check run annotations', available_annotations)
+    check_regex(settings.test_include, 'TEST_INCLUDE')
+    check_regex(settings.test_exclude, 'TEST_EXCLUDE')
+    check_regex(settings.partition_by, 'PARTITION_BY')
+    check_var(settings.mode, 'MODE', 'Mode', modes)
+    check_var(settings.test_list_encoding, 'TEST_LIST_ENCODING', 'Test list encoding', test_list_encodings)
 
     deprecate_var(get_var('COMMENT_ON_PR', options) or None, 'COMMENT_ON_PR', 'Instead, use option "comment_mode" with values "off", "create new", or "update last".', gha)
 
@@ -13,8 +13,11 @@
 #  limitations under the License.
 
 import os
+import random
 from contextlib import contextmanager
 
+from publish.unittestresults import ParsedUnitTestResultsWithCommit, UnitTestCase
+
 
 def n(number, delta=None):
     if delta is None:
@@ -36,3 +39,27 @@ def chdir(path: str):
         yield
     finally:
         os.chdir(cwd)
+
+
+def get_random_results(cases: int, tests: int, seed: int = 0) -> ParsedUnitTestResultsWithCommit:
+    rnd = random.Random(seed)
+    return ParsedUnitTestResultsWithCommit(
+        files=1,
+        errors=[],
+        suites=1, suite_tests=cases, suite_skipped=0, suite_failures=0, suite_errors=0, suite_time=0,
+        cases=[
+            UnitTestCase(
+                result_file='result',
+                test_file=f'file{test % 3}',
+                line=None,
+                class_name=f'package{test % 2}.class{test % 7}',
+                test_name=f'test{test}',
+                result=rnd.choice(['success', 'success', 'skipped', 'failure', 'error', 'disabled']),
+                message=None,
+                content=None,
+                time=rnd.choice([None, 0.5, 1.25])
+            )
+            for test in [rnd.randrange(tests) for _ in range(cases)]
+        ],
+        commit='commit'
+    )
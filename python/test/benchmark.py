@@ -0,0 +1,106 @@
+#  Benchmarks of the processing of test results, run from the python/test directory:
+#
+#    PYTHONPATH=.. python benchmark.py [cases]
+#
+#  This is not collected by pytest.
+
+import dataclasses
+import io
+import pickle
+import sys
+import time
+import tracemalloc
+from typing import Callable, Any
+
+from publish import Annotation, get_case_messages, get_case_annotation, get_case_annotations
+from publish.unittestresults import get_test_results, UnitTestCase, write_binary_results, read_binary_results
+from test import get_random_results
+
+
+def measure(label: str, func: Callable[[], Any], repeat: int = 3) -> float:
+    seconds = min([timed(func) for _ in range(repeat)])
+    print(f'{label}: {seconds:.3f}s')
+    return seconds
+
+
+def timed(func: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def benchmark_get_test_results(cases: int) -> None:
+    for tests in [cases // 10, cases]:
+        print(f'get_test_results with {cases} cases of {tests} tests')
+        parsed = get_random_results(cases, tests)
+        measure('  python', lambda: get_test_results(parsed, False))
+
+
+def measure_memory(label: str, func: Callable[[int], Any], instances: int) -> float:
+    tracemalloc.start()
+    objects = [func(index) for index in range(instances)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # the list holding the instances is not part of the instance size
+    bytes_per_instance = (size - sys.getsizeof(objects)) / instances
+    print(f'{label}: {bytes_per_instance:.0f} bytes per instance')
+    return bytes_per_instance
+
+
+def without_slots(cls: type) -> type:
+    """Returns an equivalent frozen dataclass with a per-instance __dict__."""
+    return dataclasses.make_dataclass(f'{cls.__name__}WithDict',
+                                      [(field.name, field.type) for field in dataclasses.fields(cls)],
+                                      frozen=True)
+
+
+def benchmark_memory(instances: int) -> None:
+    # all instances share the same strings, so this measures the instances only
+    for cls, args in [(UnitTestCase, ('result file', 'test file', 1, 'class', 'test', 'failure', 'message', 'content', 1.0)),
+                      (Annotation, ('path', 1, 1, None, None, 'warning', 'message', 'title', 'raw details'))]:
+        print(f'{cls.__name__} memory with {instances} instances')
+        with_dict = without_slots(cls)
+        before = measure_memory('  with __dict__', lambda index: with_dict(*args), instances)
+        after = measure_memory('  with slots   ', lambda index: cls(*args), instances)
+        print(f'  saving: {1 - after / before:.0%}')
+
+
+def benchmark_binary_results(cases: int) -> None:
+    print(f'binary results with {cases} cases')
+    parsed = get_random_results(cases, cases // 10)
+    stream = io.BytesIO()
+    write_binary_results(stream, parsed)
+    data = stream.getvalue()
+    print(f'  size: {len(data)} bytes, pickle: {len(pickle.dumps(parsed))} bytes')
+    measure('  write', lambda: write_binary_results(io.BytesIO(), parsed))
+    measure('  read ', lambda: read_binary_results(io.BytesIO(data)))
+
+
+def get_case_annotations_of_case_messages(case_results, report_individual_runs: bool) -> list:
+    # how get_case_annotations annotated cases before it used get_case_annotation_index
+    annotations = []
+    for key, states in case_results.items():
+        messages = get_case_messages(type(case_results)([(key, states)]))
+        for state in messages[key]:
+            if state not in ['success', 'skipped']:
+                for message in (messages[key][state] if report_individual_runs else [list(messages[key][state].keys())[0]]):
+                    annotations.append(get_case_annotation(messages, key, state, message, report_individual_runs))
+    return annotations
+
+
+def benchmark_case_annotations(cases: int) -> None:
+    # few tests with many runs each make the old approach quadratic
+    for tests in [cases // 10, cases // 1000]:
+        print(f'get_case_annotations with {cases} cases of {tests} tests')
+        results = get_test_results(get_random_results(cases, tests), False).case_results
+        before = measure('  case messages', lambda: get_case_annotations_of_case_messages(results, False))
+        after = measure('  index        ', lambda: get_case_annotations(results, False))
+        print(f'  speedup: {before / after:.2f}x')
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    benchmark_get_test_results(n)
+    benchmark_memory(n)
+    benchmark_binary_results(n)
+    benchmark_case_annotations(n)
@@ -1,3 +1,4 @@
+import dataclasses
 import json
 import os
 import tempfile
@@ -9,9 +10,10 @@ import mock
 from publish import pull_request_build_mode_merge, fail_on_mode_failures, fail_on_mode_errors, \
     fail_on_mode_nothing, comment_mode_off, comment_mode_create, comment_mode_update
 from publish.github_action import GithubAction
-from publish.unittestresults import ParsedUnitTestResults, ParseError
+from publish.unittestresults import ParsedUnitTestResults, ParseError, UnitTestCaseFilter, UnitTestTree, \
+    UnitTestRunResults
 from publish_unit_test_results import get_conclusion, get_commit_sha, \
-    get_settings, get_annotations_config, Settings, get_files
+    get_settings, get_annotations_config, Settings, get_files, parse_files, write_json_file
 from test import chdir
 
 event = dict(pull_request=dict(head=dict(sha='event_sha')))
@@ -138,7 +140,20 @@ class Test(unittest.TestCase):
                      hide_comment_mode='off',
                      report_individual_runs=True,
                      dedup_classes_by_file_name=True,
-                     check_run_annotation=[]):
+                     check_run_annotation=[],
+                     test_include=None,
+                     test_exclude=None,
+                     memory_budget=None,
+                     memory_limit_fraction=0.9,
+                     json_file=None,
+                     partition_by=None,
+                     mode='publish',
+                     partial_file='partial-results.json.gz',
+                     test_list_encoding='plain',
+                     annotation_cluster_threshold=None,
+                     max_annotations=None,
+                     max_result_file_size=None,
+                     max_result_file_cases=None):
         return Settings(
             token=token,
             api_url=api_url,
@@ -159,7 +174,20 @@ class Test(unittest.TestCase):
             hide_comment_mode=hide_comment_mode,
             report_individual_runs=report_individual_runs,
             dedup_classes_by_file_name=dedup_classes_by_file_name,
-            check_run_annotation=check_run_annotation.copy()
+            check_run_annotation=check_run_annotation.copy(),
+            test_include=test_include,
+            test_exclude=test_exclude,
+            memory_budget=memory_budget,
+            memory_limit_fraction=memory_limit_fraction,
+            json_file=json_file,
+            partition_by=partition_by,
+            mode=mode,
+            partial_file=partial_file,
+            test_list_encoding=test_list_encoding,
+            annotation_cluster_threshold=annotation_cluster_threshold,
+            max_annotations=max_annotations,
+            max_result_file_size=max_result_file_size,
+            max_result_file_cases=max_result_file_cases
         )
 
     def test_get_settings(self):
@@ -267,6 +295,119 @@ class Test(unittest.TestCase):
         self.do_test_get_settings(DEDUPLICATE_CLASSES_BY_FILE_NAME='foo', expected=self.get_settings(dedup_classes_by_file_name=False))
         self.do_test_get_settings(DEDUPLICATE_CLASSES_BY_FILE_NAME=None, expected=self.get_settings(dedup_classes_by_file_name=False))
 
+    def test_get_settings_test_include_exclude(self):
+        self.do_test_get_settings(TEST_INCLUDE=None, TEST_EXCLUDE=None, expected=self.get_settings(test_include=None, test_exclude=None))
+        self.do_test_get_settings(TEST_INCLUDE='', TEST_EXCLUDE='', expected=self.get_settings(test_include=None, test_exclude=None))
+        self.do_test_get_settings(TEST_INCLUDE='^integration\\.', expected=self.get_settings(test_include='^integration\\.'))
+        self.do_test_get_settings(TEST_EXCLUDE='.*Flaky', expected=self.get_settings(test_exclude='.*Flaky'))
+
+        with self.assertRaises(RuntimeError) as re:
+            self.do_test_get_settings(TEST_INCLUDE='(test')
+        self.assertEqual("Value '(test' is not a valid regular expression for variable TEST_INCLUDE: "
+                         "missing ), unterminated subpattern at position 0", str(re.exception))
+
+    def test_get_settings_memory_budget(self):
+        self.do_test_get_settings(MEMORY_BUDGET=None, expected=self.get_settings(memory_budget=None))
+        self.do_test_get_settings(MEMORY_BUDGET='', expected=self.get_settings(memory_budget=None))
+        self.do_test_get_settings(MEMORY_BUDGET='512', expected=self.get_settings(memory_budget=512 * 1024 * 1024))
+
+        with self.assertRaises(RuntimeError) as re:
+            self.do_test_get_settings(MEMORY_BUDGET='1 GB')
+        self.assertEqual("Value '1 GB' is not supported for variable MEMORY_BUDGET, expected: number of megabytes", str(re.exception))
+
+    def test_get_settings_memory_limit_fraction(self):
+        self.do_test_get_settings(MEMORY_LIMIT_FRACTION=None, expected=self.get_settings(memory_limit_fraction=0.9))
+        self.do_test_get_settings(MEMORY_LIMIT_FRACTION='', expected=self.get_settings(memory_limit_fraction=0.9))
+        self.do_test_get_settings(MEMORY_LIMIT_FRACTION='0.75', expected=self.get_settings(memory_limit_fraction=0.75))
+        self.do_test_get_settings(MEMORY_LIMIT_FRACTION='1', expected=self.get_settings(memory_limit_fraction=1.0))
+
+        for fraction in ['0', '1.5', '90%', 'nan']:
+            with self.assertRaises(RuntimeError) as re:
+                self.do_test_get_settings(MEMORY_LIMIT_FRACTION=fraction)
+            self.assertEqual(f"Value '{fraction}' is not supported for variable MEMORY_LIMIT_FRACTION, "
+                             f"expected: number larger than 0 and at most 1", str(re.exception))
+
+    def test_get_settings_json_file(self):
+        self.do_test_get_settings(JSON_FILE=None, expected=self.get_settings(json_file=None))
+        self.do_test_get_settings(JSON_FILE='', expected=self.get_settings(json_file=None))
+        self.do_test_get_settings(JSON_FILE='tests.json', expected=self.get_settings(json_file='tests.json'))
+
+    def test_get_settings_partition_by(self):
+        self.do_test_get_settings(PARTITION_BY=None, expected=self.get_settings(partition_by=None))
+        self.do_test_get_settings(PARTITION_BY='', expected=self.get_settings(partition_by=None))
+        self.do_test_get_settings(PARTITION_BY='artifacts/([^/]+)/', expected=self.get_settings(partition_by='artifacts/([^/]+)/'))
+
+        with self.assertRaises(RuntimeError) as re:
+            self.do_test_get_settings(PARTITION_BY='artifacts/(')
+        self.assertEqual("Value 'artifacts/(' is not a valid regular expression for variable PARTITION_BY: "
+                         "missing ), unterminated subpattern at position 10", str(re.exception))
+
+    def test_get_settings_mode(self):
+        self.do_test_get_settings(MODE=None, expected=self.get_settings(mode='publish'))
+        self.do_test_get_settings(MODE='', expected=self.get_settings(mode='publish'))
+        self.do_test_get_settings(MODE='prepare', expected=self.get_settings(mode='prepare'))
+        self.do_test_get_settings(MODE='merge', expected=self.get_settings(mode='merge'))
+
+        with self.assertRaises(RuntimeError) as re:
+            self.do_test_get_settings(MODE='reduce')
+        self.assertEqual("Value 'reduce' is not supported for variable MODE, expected: publish, prepare, merge", str(re.exception))
+
+    def test_get_settings_partial_file(self):
+        self.do_test_get_settings(PARTIAL_FILE=None, expected=self.get_settings(partial_file='partial-results.json.gz'))
+        self.do_test_get_settings(PARTIAL_FILE='', expected=self.get_settings(partial_file='partial-results.json.gz'))
+        self.do_test_get_settings(PARTIAL_FILE='shard.json.gz', expected=self.get_settings(partial_file='shard.json.gz'))
+
+    def test_get_settings_test_list_encoding(self):
+        self.do_test_get_settings(TEST_LIST_ENCODING=None, expected=self.get_settings(test_list_encoding='plain'))
+        self.do_test_get_settings(TEST_LIST_ENCODING='', expected=self.get_settings(test_list_encoding='plain'))
+        self.do_test_get_settings(TEST_LIST_ENCODING='plain', expected=self.get_settings(test_list_encoding='plain'))
+        self.do_test_get_settings(TEST_LIST_ENCODING='front-coded', expected=self.get_settings(test_list_encoding='front-coded'))
+        self.do_test_get_settings(TEST_LIST_ENCODING='gzip', expected=self.get_settings(test_list_encoding='gzip'))
+        self.do_test_get_settings(TEST_LIST_ENCODING='delta', expected=self.get_settings(test_list_encoding='delta'))
+
+        with self.assertRaises(RuntimeError) as re:
+            self.do_test_get_settings(TEST_LIST_ENCODING='zip')
+        self.assertEqual("Value 'zip' is not supported for variable TEST_LIST_ENCODING, expected: plain, front-coded, gzip, delta", str(re.exception))
+
+    def test_get_settings_annotation_cluster_threshold(self):
+        self.do_test_get_settings(ANNOTATION_CLUSTER_THRESHOLD=None, expected=self.get_settings(annotation_cluster_threshold=None))
+        self.do_test_get_settings(ANNOTATION_CLUSTER_THRESHOLD='', expected=self.get_settings(annotation_cluster_threshold=None))
+        self.do_test_get_settings(ANNOTATION_CLUSTER_THRESHOLD='1', expected=self.get_settings(annotation_cluster_threshold=1))
+        self.do_test_get_settings(ANNOTATION_CLUSTER_THRESHOLD='100', expected=self.get_settings(annotation_cluster_threshold=100))
+
+        for value in ['0', '-1', '1.5', 'many']:
+            with self.subTest(value=value):
+                with self.assertRaises(RuntimeError) as re:
+                    self.do_test_get_settings(ANNOTATION_CLUSTER_THRESHOLD=value)
+                self.assertEqual(f"Value '{value}' is not supported for variable ANNOTATION_CLUSTER_THRESHOLD, "
+                                 f"expected: positive number of tests", str(re.exception))
+
+    def test_get_settings_max_annotations(self):
+        self.do_test_get_settings(MAX_ANNOTATIONS=None, expected=self.get_settings(max_annotations=None))
+        self.do_test_get_settings(MAX_ANNOTATIONS='', expected=self.get_settings(max_annotations=None))
+        self.do_test_get_settings(MAX_ANNOTATIONS='0', expected=self.get_settings(max_annotations=0))
+        self.do_test_get_settings(MAX_ANNOTATIONS='1000', expected=self.get_settings(max_annotations=1000))
+
+        for value in ['-1', '1.5', 'many']:
+            with self.subTest(value=value):
+                with self.assertRaises(RuntimeError) as re:
+                    self.do_test_get_settings(MAX_ANNOTATIONS=value)
+                self.assertEqual(f"Value '{value}' is not supported for variable MAX_ANNOTATIONS, "
+                                 f"expected: number of annotations", str(re.exception))
+
+    def test_get_settings_max_result_file_limits(self):
+        self.do_test_get_settings(MAX_RESULT_FILE_SIZE=None, MAX_RESULT_FILE_CASES=None, expected=self.get_settings())
+        self.do_test_get_settings(MAX_RESULT_FILE_SIZE='', MAX_RESULT_FILE_CASES='', expected=self.get_settings())
+        self.do_test_get_settings(MAX_RESULT_FILE_SIZE='512', expected=self.get_settings(max_result_file_size=512 * 1024 * 1024))
+        self.do_test_get_settings(MAX_RESULT_FILE_CASES='1000000', expected=self.get_settings(max_result_file_cases=1000000))
+
+        for variable, expected in [('MAX_RESULT_FILE_SIZE', 'number of megabytes'), ('MAX_RESULT_FILE_CASES', 'number of test cases')]:
+            for value in ['-1', '1.5', 'many']:
+                with self.subTest(variable=variable, value=value):
+                    with self.assertRaises(RuntimeError) as re:
+                        self.do_test_get_settings(**{variable: value})
+                    self.assertEqual(f"Value '{value}' is not supported for variable {variable}, expected: {expected}", str(re.exception))
+
     def test_get_settings_missing_options(self):
         with self.assertRaises(RuntimeError) as re:
             self.do_test_get_settings(GITHUB_EVENT_PATH=None)
@@ -468,6 +609,17 @@ class Test(unittest.TestCase):
                         files = get_files(f'*1.txt{sep}*3.bin')
                         self.assertEqual(['file1.txt', 'file3.bin'], sorted(files))
 
+    def test_get_files_sorted(self):
+        filenames = ['file3.xml', 'file1.xml', 'file10.xml', 'file2.xml']
+        with tempfile.TemporaryDirectory() as path:
+            with chdir(path):
+                for filename in filenames:
+                    with open(filename, mode='w'):
+                        pass
+
+                # files are sorted, not in the order of a set
+                self.assertEqual(['file1.xml', 'file10.xml', 'file2.xml', 'file3.xml'], get_files('*.xml\nfile3.xml'))
+
     def test_get_files_subdir_and_wildcard(self):
         filenames = [os.path.join('sub', 'file1.txt'),
                      os.path.join('sub', 'file2.txt'),
@@ -584,8 +736,92 @@ class Test(unittest.TestCase):
                 files = get_files('*.txt\n!file1.txt')
                 self.assertEqual(['file2.txt'], sorted(files))
 
+    def test_parse_files(self):
+        junit = parse_files(['files/junit.fail.xml'])
+        self.assertEqual((1, 1, 5), (junit.files, junit.suites, len(junit.cases)))
+
+        json_lines = parse_files(['files/go-test.json'])
+        self.assertEqual((1, 2, 4), (json_lines.files, json_lines.suites, len(json_lines.cases)))
+
+        tap = parse_files(['files/perl.tap'])
+        self.assertEqual((1, 1, 6), (tap.files, tap.suites, len(tap.cases)))
+
+        all = parse_files(['files/junit.fail.xml', 'files/go-test.json', 'files/perl.tap'])
+        self.assertEqual(3, all.files)
+        self.assertEqual(4, all.suites)
+        self.assertEqual(junit.suite_tests + json_lines.suite_tests + tap.suite_tests, all.suite_tests)
+        self.assertEqual(junit.suite_failures + json_lines.suite_failures + tap.suite_failures, all.suite_failures)
+        self.assertEqual(junit.cases + json_lines.cases + tap.cases, all.cases)
+
+    def test_parse_files_with_emit(self):
+        files = ['files/junit.fail.xml', 'files/go-test.json', 'files/perl.tap', 'files/empty.xml']
+        for case_filter in [None, UnitTestCaseFilter.from_patterns(None, 'example.com/calc')]:
+            with self.subTest(case_filter=case_filter):
+                expected = parse_files(files, case_filter)
+                emitted = []
+                actual = parse_files(files, case_filter, emit=emitted.append)
+                # cases are emitted rather than returned, all other statistics are the same
+                self.assertEqual([], actual.cases)
+                self.assertEqual(expected.cases, emitted)
+                self.assertEqual(dataclasses.replace(expected, cases=[]), actual)
+
+    def test_parse_files_ignores_other_json_files(self):
+        actual = parse_files(['files/junit.fail.xml', 'files/json-document.json', 'files/go-test.json'])
+        self.assertEqual(2, actual.files)
+        self.assertEqual([], actual.errors)
+        self.assertEqual(parse_files(['files/junit.fail.xml', 'files/go-test.json']), actual)
+
+    def test_parse_files_interns_strings_across_files(self):
+        actual = parse_files(['files/go-test.json', 'files/junit.fail.xml', 'files/go-test.json'])
+        go_cases = [case for case in actual.cases if case.result_file == 'files/go-test.json']
+        self.assertEqual(8, len(go_cases))
+        for first, second in zip(go_cases[:4], go_cases[4:]):
+            self.assertIs(first.class_name, second.class_name)
+            self.assertIs(first.content, second.content)
+
+    def test_parse_files_with_case_filter(self):
+        files = ['files/junit.fail.xml', 'files/go-test.json', 'files/perl.tap']
+        all = parse_files(files)
+
+        case_filter = UnitTestCaseFilter.from_patterns(None, 'example.com/calc')
+        filtered = parse_files(files, case_filter)
+        self.assertEqual(3, filtered.files)
+        self.assertEqual(4, filtered.suites)
+        self.assertEqual([case for case in all.cases if case.class_name != 'example.com/calc'], filtered.cases)
+        self.assertEqual(len(filtered.cases), filtered.suite_tests)
+        self.assertEqual(len([case for case in filtered.cases if case.result == 'failure']), filtered.suite_failures)
+
     def test_get_files_with_mock(self):
         with mock.patch('publish_unit_test_results.glob') as m:
             files = get_files('*.txt\n!file1.txt')
             self.assertEqual([], files)
             self.assertEqual([mock.call('*.txt', recursive=True), mock.call('file1.txt', recursive=True)], m.call_args_list)
+
+    def test_write_json_file(self):
+        tree = UnitTestTree()
+        tree.add_class('package.Class', {'success': 2}, {'success': 1}, 1.25)
+        with tempfile.TemporaryDirectory() as path:
+            filename = os.path.join(path, 'tests.json')
+            write_json_file(filename, tree)
+            with open(filename, 'rt', encoding='utf-8') as r:
+                content = r.read()
+        self.assertEqual('{"tree":{"cases":{"success":2},"tests":{"success":1},"time":1.25,"children":{"package":'
+                         '{"cases":{"success":2},"tests":{"success":1},"time":1.25,"children":{"Class":'
+                         '{"cases":{"success":2},"tests":{"success":1},"time":1.25}}}}}}', content)
+        self.assertEqual(dict(tree=tree.to_dict()), json.loads(content))
+
+    def test_write_json_file_with_partitions(self):
+        stats = UnitTestRunResults(files=1, errors=[ParseError("file", "error", None, None)], suites=0, duration=3,
+                                   tests=2, tests_succ=1, tests_skip=0, tests_fail=1, tests_error=0,
+                                   runs=3, runs_succ=2, runs_skip=0, runs_fail=1, runs_error=0,
+                                   commit='commit')
+        with tempfile.TemporaryDirectory() as path:
+            filename = os.path.join(path, 'tests.json')
+            write_json_file(filename, UnitTestTree(), dict(linux=stats))
+            with open(filename, 'rt', encoding='utf-8') as r:
+                content = json.load(r)
+        self.assertEqual({'linux': dict(files=1, suites=0, duration=3,
+                                        tests=2, tests_succ=1, tests_skip=0, tests_fail=1, tests_error=0,
+                                        runs=3, runs_succ=2, runs_skip=0, runs_fail=1, runs_error=0,
+                                        commit='commit')},
+                         content['partitions'])
@@ -0,0 +1,217 @@
+import unittest
+
+from publish.jsonlines import parse_json_lines_files, is_json_lines_file, is_json_lines_event, get_pytest_longrepr_text, \
+    get_pytest_longrepr_message, GoTestEvents, PytestReportLogEvents
+from publish.unittestresults import ParsedUnitTestResults, UnitTestCase, ParseError, ParseLimits, UnitTestCaseFilter
+
+
+class TestJsonLines(unittest.TestCase):
+
+    def test_is_json_lines_file(self):
+        for file, expected in [('file.jsonl', True), ('dir/file.NDJSON', True),
+                               ('file.xml', False), ('file', False), ('file.json.xml', False),
+                               # .json files are recognized by their first line
+                               ('files/go-test.json', True), ('files/non-json-lines.json', True),
+                               ('files/json-document.json', False), ('files/junit.fail.xml', False),
+                               ('file.json', False)]:
+            with self.subTest(file=file):
+                self.assertEqual(expected, is_json_lines_file(file))
+
+    def test_is_json_lines_event(self):
+        for line, expected in [('{"Action":"run","Package":"p","Test":"T"}', True),
+                               ('{"pytest_version": "6.2.4", "$report_type": "SessionStart"}', True),
+                               ('{"name": "example"}', False), ('{', False), ('[1, 2]', False),
+                               ('<?xml version="1.0"?>', False), ('', False), (None, False)]:
+            with self.subTest(line=line):
+                self.assertEqual(expected, is_json_lines_event(line))
+
+    def test_parse_json_lines_files_with_no_files(self):
+        self.assertEqual(
+            parse_json_lines_files([]),
+            ParsedUnitTestResults(
+                files=0,
+                errors=[],
+                suites=0,
+                suite_tests=0,
+                suite_skipped=0,
+                suite_failures=0,
+                suite_errors=0,
+                suite_time=0,
+                cases=[]
+            ))
+
+    def test_parse_json_lines_files_with_go_test_file(self):
+        self.assertEqual(
+            parse_json_lines_files(['files/go-test.json']),
+            ParsedUnitTestResults(
+                files=1,
+                errors=[],
+                suites=2,
+                suite_tests=4,
+                suite_skipped=1,
+                suite_failures=1,
+                suite_errors=0,
+                suite_time=2,
+                cases=[
+                    UnitTestCase(result_file='files/go-test.json', test_file=None, line=None, class_name='example.com/calc', test_name='TestAdd', result='success', message=None, content=None, time=0.01),
+                    UnitTestCase(result_file='files/go-test.json', test_file=None, line=None, class_name='example.com/calc', test_name='TestDiv', result='failure', message=None, content='=== RUN   TestDiv\n    calc_test.go:12: division by zero\n--- FAIL: TestDiv (0.02s)\n', time=0.02),
+                    UnitTestCase(result_file='files/go-test.json', test_file=None, line=None, class_name='example.com/calc', test_name='TestMul', result='skipped', message=None, content='    calc_test.go:20: not implemented\n', time=0),
+                    UnitTestCase(result_file='files/go-test.json', test_file=None, line=None, class_name='example.com/util', test_name='TestTrim', result='success', message=None, content=None, time=0.003),
+                ]
+            ))
+
+    def test_parse_json_lines_files_with_go_test_file_and_case_filter(self):
+        actual = parse_json_lines_files(['files/go-test.json'], UnitTestCaseFilter.from_patterns(r'example\.com/util', None))
+        self.assertEqual(['TestTrim'], [case.test_name for case in actual.cases])
+        self.assertEqual((2, 1, 0), (actual.suites, actual.suite_tests, actual.suite_failures))
+        # package times include filtered-out tests, so the time of the cases is used
+        actual = parse_json_lines_files(['files/go-test.json'], UnitTestCaseFilter.from_patterns(None, 'TestAdd'))
+        self.assertEqual(0, actual.suite_time)
+
+    def test_parse_json_lines_files_with_pytest_report_log_file(self):
+        actual = parse_json_lines_files(['files/pytest-report-log.jsonl'])
+        self.assertEqual(1, actual.files)
+        self.assertEqual([], actual.errors)
+        self.assertEqual(2, actual.suites)
+        self.assertEqual(4, actual.suite_tests)
+        self.assertEqual(1, actual.suite_skipped)
+        self.assertEqual(1, actual.suite_failures)
+        self.assertEqual(1, actual.suite_errors)
+        self.assertEqual(0, actual.suite_time)
+        self.assertEqual(
+            [('tests/test_calc.py', 5, 'tests.test_calc.TestCalc', 'test_add', 'success', None, None),
+             ('tests/test_calc.py', 11, 'tests.test_calc', 'test_div', 'failure', 'ZeroDivisionError: division by zero',
+              '    def test_div():\n'
+              '>       1 / 0\n'
+              'E       ZeroDivisionError: division by zero\n'
+              'tests/test_calc.py:12: ZeroDivisionError: division by zero'),
+             ('tests/test_calc.py', 16, 'tests.test_calc', 'test_mul', 'skipped', 'Skipped: not implemented', 'Skipped: not implemented'),
+             ('tests/test_util.py', 3, 'tests.test_util', 'test_trim', 'error', None, "fixture 'tmpdir2' not found")],
+            [(case.test_file, case.line, case.class_name, case.test_name, case.result, case.message, case.content)
+             for case in actual.cases]
+        )
+        # time of a test is the sum of its setup, call and teardown durations
+        self.assertEqual([0.012, 0.022, 0.002, 0.002], [round(case.time, 3) for case in actual.cases])
+
+    def test_parse_json_lines_files_with_non_json_file(self):
+        self.assertEqual(
+            parse_json_lines_files(['files/non-json-lines.json']),
+            ParsedUnitTestResults(
+                files=1,
+                errors=[ParseError(file='files/non-json-lines.json', message='File is not a valid JSON lines file:\nExpecting value: line 1 column 1 (char 0)', line=2, column=None)],
+                suites=0,
+                suite_tests=0,
+                suite_skipped=0,
+                suite_failures=0,
+                suite_errors=0,
+                suite_time=0,
+                cases=[]
+            ))
+
+    def test_parse_json_lines_files_with_empty_and_non_existing_file(self):
+        self.assertEqual(
+            parse_json_lines_files(['files/empty.xml', 'files/does_not_exist.json']),
+            ParsedUnitTestResults(
+                files=2,
+                errors=[ParseError('files/empty.xml', 'File is empty.', None, None),
+                        ParseError('files/does_not_exist.json', 'File does not exist.', None, None)],
+                suites=0,
+                suite_tests=0,
+                suite_skipped=0,
+                suite_failures=0,
+                suite_errors=0,
+                suite_time=0,
+                cases=[]
+            ))
+
+    def test_parse_json_lines_files_with_limits(self):
+        actual = parse_json_lines_files(['files/go-test.json'], limits=ParseLimits(max_file_size=100))
+        self.assertEqual([ParseError('files/go-test.json', 'File size of 2023 bytes exceeds limit of 100 bytes.', None, None)], actual.errors)
+        self.assertEqual([], actual.cases)
+
+        actual = parse_json_lines_files(['files/go-test.json'], limits=ParseLimits(max_cases=2))
+        self.assertEqual([ParseError('files/go-test.json', 'File exceeds limit of 2 test cases.', None, None)], actual.errors)
+        # cases read before the limit was exceeded are discarded, as for JUnit files
+        self.assertEqual([], actual.cases)
+        self.assertEqual(0, actual.suites)
+
+    def test_parse_json_lines_files_with_invalid_line(self):
+        # the first line is a valid event, cases of a file that fails mid-file are discarded
+        actual = parse_json_lines_files(['files/non-json-lines.json', 'files/go-test.json'])
+        self.assertEqual(1, len(actual.errors))
+        self.assertEqual(('files/non-json-lines.json', 2), (actual.errors[0].file, actual.errors[0].line))
+        self.assertEqual({'files/go-test.json'}, {case.result_file for case in actual.cases})
+        self.assertEqual(4, actual.suite_tests)
+
+    def test_go_test_events_holds_only_tests_in_flight(self):
+        cases = []
+        events = GoTestEvents('file', cases.append)
+        events.add(dict(Action='run', Package='pkg', Test='Test1'))
+        events.add(dict(Action='run', Package='pkg', Test='Test2'))
+        events.add(dict(Action='output', Package='pkg', Test='Test1', Output='output\n'))
+        self.assertEqual(2, len(events._in_flight))
+        events.add(dict(Action='pass', Package='pkg', Test='Test1', Elapsed=1.0))
+        self.assertEqual(1, len(events._in_flight))
+        self.assertEqual([UnitTestCase('file', None, None, 'pkg', 'Test1', 'success', None, None, 1.0)], cases)
+
+        # tests that never finish are reported as errors
+        events.add(dict(Action='output', Package='pkg', Test='Test2', Output='panic\n'))
+        events.close()
+        self.assertEqual(0, len(events._in_flight))
+        self.assertEqual(UnitTestCase('file', None, None, 'pkg', 'Test2', 'error', 'Test did not finish', 'panic\n', None), cases[-1])
+
+    def test_go_test_events_with_package_failure(self):
+        actual = parse_json_lines_files(['files/go-test-package-failure.json'])
+        self.assertEqual([], actual.errors)
+        self.assertEqual((1, 1, 1), (actual.suites, actual.suite_tests, actual.suite_errors))
+        self.assertEqual([UnitTestCase('files/go-test-package-failure.json', None, None, 'example.com/broken', 'Package failed', 'error', None,
+                                       'panic: runtime error: invalid memory address or nil pointer dereference\nFAIL\texample.com/broken\t0.004s\n', 0.004)],
+                         actual.cases)
+
+        # a package with a failing test is not reported on its own, also when the failing test is filtered out
+        cases = []
+        events = GoTestEvents('file', cases.append, UnitTestCaseFilter.from_patterns(None, 'TestFail'))
+        events.add(dict(Action='run', Package='pkg', Test='TestFail'))
+        events.add(dict(Action='fail', Package='pkg', Test='TestFail', Elapsed=1.0))
+        events.add(dict(Action='output', Package='pkg', Output='FAIL\n'))
+        events.add(dict(Action='fail', Package='pkg', Elapsed=1.0))
+        self.assertEqual([], cases)
+
+        # a package with a test that did not finish is not reported on its own
+        events = GoTestEvents('file', cases.append)
+        events.add(dict(Action='run', Package='pkg', Test='TestPanic'))
+        events.add(dict(Action='fail', Package='pkg', Elapsed=1.0))
+        events.close()
+        self.assertEqual([('TestPanic', 'error')], [(case.test_name, case.result) for case in cases])
+        self.assertEqual(0, len(events._package_output))
+
+    def test_pytest_report_log_events_holds_only_tests_in_flight(self):
+        cases = []
+        events = PytestReportLogEvents('file', cases.append)
+        report = {'$report_type': 'TestReport', 'nodeid': 'test.py::test', 'location': ['test.py', 0, 'test'], 'outcome': 'passed', 'duration': 1.0}
+        events.add(dict(report, when='setup'))
+        events.add(dict(report, when='call'))
+        self.assertEqual(1, len(events._in_flight))
+        self.assertEqual([], cases)
+        events.add(dict(report, when='teardown'))
+        self.assertEqual(0, len(events._in_flight))
+        self.assertEqual([UnitTestCase('file', 'test.py', 1, 'test', 'test', 'success', None, None, 3.0)], cases)
+
+    def test_get_pytest_longrepr_text(self):
+        self.assertIsNone(get_pytest_longrepr_text(None))
+        self.assertEqual('text', get_pytest_longrepr_text('text'))
+        self.assertEqual('Skipped: reason', get_pytest_longrepr_text(['file', 1, 'Skipped: reason']))
+        self.assertEqual('line 1\nline 2\nfile:1: message', get_pytest_longrepr_text({
+            'reprcrash': {'path': 'file', 'lineno': 1, 'message': 'message'},
+            'reprtraceback': {'reprentries': [{'data': {'lines': ['line 1', 'line 2']}}]}
+        }))
+
+    def test_get_pytest_longrepr_message(self):
+        self.assertIsNone(get_pytest_longrepr_message(None))
+        self.assertIsNone(get_pytest_longrepr_message('text'))
+        self.assertEqual('Skipped: reason', get_pytest_longrepr_message(['file', 1, 'Skipped: reason']))
+        self.assertEqual('message', get_pytest_longrepr_message({'reprcrash': {'message': 'message'}}))
+
+
+if __name__ == '__main__':
+    unittest.main()
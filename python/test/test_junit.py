@@ -4,8 +4,9 @@ from typing import Optional
 
 from junitparser import JUnitXml, Element, version
 
-from publish.junit import parse_junit_xml_files, get_results, get_result, get_content, get_message
-from publish.unittestresults import ParsedUnitTestResults, UnitTestCase, ParseError
+from publish.junit import parse_junit_xml_files, parse_xml_file, get_results, get_result, get_content, get_message
+from publish.unittestresults import ParsedUnitTestResults, UnitTestCase, ParseError, UnitTestCaseFilter, \
+    ParseLimits
 
 
 class TestElement(Element):
@@ -251,6 +252,24 @@ class TestJunit(unittest.TestCase):
                 ]
             ))
 
+    def test_parse_junit_xml_files_with_case_filter(self):
+        all = parse_junit_xml_files(['files/junit.fail.xml'])
+
+        case_filter = UnitTestCaseFilter.from_patterns(None, 'test_rsh')
+        actual = parse_junit_xml_files(['files/junit.fail.xml'], case_filter)
+        expected_cases = [case for case in all.cases if not case.test_name.startswith('test_rsh')]
+        self.assertEqual(expected_cases, actual.cases)
+        self.assertLess(len(actual.cases), len(all.cases))
+        # test state counts come from the remaining cases
+        self.assertEqual(all.suites, actual.suites)
+        self.assertEqual(len(expected_cases), actual.suite_tests)
+        self.assertEqual(len([case for case in expected_cases if case.result == 'skipped']), actual.suite_skipped)
+        self.assertEqual(len([case for case in expected_cases if case.result == 'failure']), actual.suite_failures)
+        self.assertEqual(len([case for case in expected_cases if case.result == 'error']), actual.suite_errors)
+        # so does the time, suite time includes filtered-out cases
+        self.assertEqual(int(sum([case.time for case in expected_cases])), actual.suite_time)
+        self.assertEqual(12, actual.suite_time)
+
     def test_parse_junit_xml_files_with_minimal_attributes_file(self):
         self.assertEqual(
             parse_junit_xml_files(['files/minimal-attributes.xml']),
@@ -440,6 +459,53 @@ class TestJunit(unittest.TestCase):
             ))
 
     # tests https://github.com/weiwei/junitparser/issues/64
+    def test_parse_junit_xml_files_with_limits(self):
+        for file, limits, expected in [
+            ('files/junit.fail.xml', ParseLimits(max_file_size=100), 'File size of 2421 bytes exceeds limit of 100 bytes.'),
+            ('files/junit.fail.xml', ParseLimits(max_depth=2), 'File exceeds limit of 2 nested elements.'),
+            ('files/junit.fail.xml', ParseLimits(max_cases=2), 'File exceeds limit of 2 test cases.'),
+            ('files/billion-laughs.xml', ParseLimits(max_entities=3), 'File exceeds limit of 3 entity declarations.'),
+            ('files/billion-laughs.xml', ParseLimits(max_text_size=100000), 'File exceeds limit of 100000 characters of text.'),
+            ('files/billion-laughs-attribute.xml', ParseLimits(max_text_size=100000), 'File exceeds limit of 100000 characters of text.'),
+        ]:
+            with self.subTest(file=file, limits=limits):
+                self.assertEqual(
+                    parse_junit_xml_files([file], limits=limits),
+                    ParsedUnitTestResults(
+                        files=1,
+                        errors=[ParseError(file=file, message=expected, line=None, column=None)],
+                        suites=0,
+                        suite_tests=0,
+                        suite_skipped=0,
+                        suite_failures=0,
+                        suite_errors=0,
+                        suite_time=0,
+                        cases=[]
+                    ))
+
+        # within default limits
+        actual = parse_junit_xml_files(['files/billion-laughs.xml'])
+        self.assertEqual([], actual.errors)
+        self.assertEqual(300000, len(actual.cases[0].content))
+        actual = parse_junit_xml_files(['files/billion-laughs-attribute.xml'])
+        self.assertEqual([], actual.errors)
+        self.assertEqual(300000, len(actual.cases[0].message))
+
+    def test_parse_junit_xml_files_interns_strings(self):
+        actual = parse_junit_xml_files(['files/junit.fail.xml', 'files/junit.fail.xml'])
+        self.assertEqual(10, len(actual.cases))
+        for first, second in zip(actual.cases[:5], actual.cases[5:]):
+            self.assertIs(first.class_name, second.class_name)
+            self.assertIs(first.message, second.message)
+            self.assertIs(first.content, second.content)
+        self.assertTrue(any(case.content for case in actual.cases))
+
+    def test_parse_xml_file(self):
+        tree = parse_xml_file('files/junit.fail.xml')
+        self.assertEqual('testsuites', tree.getroot().tag)
+        self.assertEqual(5, len(tree.getroot().findall('testsuite/testcase')))
+        self.assertEqual('1412', tree.getroot().find('testsuite/testcase').get('line'))
+
     def test_junitparser_locale(self):
         junit = JUnitXml.fromfile('files/junit.spark.integration.1.xml')
         self.assertAlmostEqual(162.933, junit.time, 3)
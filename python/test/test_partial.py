@@ -0,0 +1,139 @@
+import dataclasses
+import itertools
+import os
+import tempfile
+import unittest
+from collections import Counter
+
+from publish import get_case_annotations, get_all_tests_list
+from publish.partial import PartialUnitTestResults, empty_partial_results, \
+    write_partial_results_file, read_partial_results_file, merge_partial_results_files, merge_partial_results
+from publish.unittestresults import get_test_results, get_stats, UnitTestCase, ParseError
+from publish_unit_test_results import parse_files
+
+shards = [
+    ['files/junit.fail.xml', 'files/go-test.json'],
+    ['files/perl.tap', 'files/non-xml.xml'],
+    ['files/junit.multiresult.xml', 'files/junit.fail.xml'],
+]
+
+
+def get_partial(files):
+    parsed = parse_files(files).with_commit('commit')
+    return PartialUnitTestResults.from_results(get_test_results(parsed, False))
+
+
+def get_cases_per_state(results):
+    return {key: {state: len(cases) for state, cases in states.items()}
+            for key, states in results.case_results.items()}
+
+
+class TestPartial(unittest.TestCase):
+
+    def test_from_results(self):
+        partial = get_partial(['files/junit.multiresult.xml'])
+        self.assertEqual(1, partial.files)
+        self.assertEqual(4, partial.cases)
+        self.assertEqual({
+            (None, 'test class', 'test that errors'): Counter({'error': 1}),
+            (None, 'test class', 'test that fails'): Counter({'failure': 1}),
+            (None, 'test class', 'test that is skipped'): Counter({'skipped': 1}),
+            (None, 'test class', 'test that succeeds'): Counter({'success': 1})
+        }, partial.tests)
+        # only failures and errors are retained
+        self.assertEqual({'failure', 'error'}, {case.result for cases in partial.retained.values() for case in cases})
+
+    def test_to_results(self):
+        files = [file for shard in shards for file in shard]
+        expected = get_test_results(parse_files(files).with_commit('commit'), False)
+        actual = get_partial(files).to_results('commit')
+
+        self.assertEqual(get_stats(expected), get_stats(actual))
+        self.assertEqual(get_cases_per_state(expected), get_cases_per_state(actual))
+        self.assertTrue(actual.case_results.is_sorted)
+        self.assertEqual(get_all_tests_list(expected.case_results), get_all_tests_list(actual.case_results))
+        self.assertEqual(sorted(get_case_annotations(expected.case_results, 'report'), key=repr),
+                         sorted(get_case_annotations(actual.case_results, 'report'), key=repr))
+
+    def test_merge_equals_parsing_all_files(self):
+        expected = get_test_results(parse_files([file for shard in shards for file in shard]).with_commit('commit'), False)
+        partials = [get_partial(shard) for shard in shards]
+
+        # merging is order-independent and associative
+        for order in itertools.permutations(partials):
+            left = order[0].merge(order[1]).merge(order[2]).to_results('commit')
+            right = order[0].merge(order[1].merge(order[2])).to_results('commit')
+            for actual in [left, right]:
+                # each shard rounds its duration down to seconds
+                self.assertEqual(dataclasses.replace(get_stats(expected), duration=0), dataclasses.replace(get_stats(actual), duration=0))
+                self.assertAlmostEqual(get_stats(expected).duration, get_stats(actual).duration, delta=len(shards))
+                self.assertEqual(get_cases_per_state(expected), get_cases_per_state(actual))
+                # merged results do not depend on the order of partial results
+                self.assertEqual(partials[0].merge(partials[1]).merge(partials[2]).to_results('commit'), actual)
+
+    def test_merge_partial_results(self):
+        partials = [get_partial(shard) for shard in shards]
+        copies = [dataclasses.replace(partial,
+                                      tests={key: Counter(counts) for key, counts in partial.tests.items()},
+                                      retained={key: list(cases) for key, cases in partial.retained.items()})
+                  for partial in partials]
+
+        merged = merge_partial_results(partials)
+        self.assertEqual(partials[0].merge(partials[1]).merge(partials[2]), merged)
+        self.assertEqual(empty_partial_results, merge_partial_results([]))
+        # the merged partial results are not modified
+        self.assertEqual(copies, partials)
+
+    def test_merge_empty(self):
+        partial = get_partial(shards[0])
+        self.assertEqual(partial.to_results('commit'), partial.merge(empty_partial_results).to_results('commit'))
+        self.assertEqual(partial.to_results('commit'), empty_partial_results.merge(partial).to_results('commit'))
+
+    def test_dict_round_trip(self):
+        partial = get_partial([file for shard in shards for file in shard])
+        self.assertEqual(partial, PartialUnitTestResults.from_dict(partial.to_dict()))
+
+        with self.assertRaises(ValueError) as e:
+            PartialUnitTestResults.from_dict(dict(partial.to_dict(), version=0))
+        self.assertEqual('Unsupported version of partial results: 0', str(e.exception))
+
+    def test_file_round_trip(self):
+        partials = [get_partial(shard) for shard in shards]
+        with tempfile.TemporaryDirectory() as path:
+            files = [os.path.join(path, f'partial-{index}.json.gz') for index in range(len(partials))]
+            for file, partial in zip(files, partials):
+                write_partial_results_file(file, partial)
+            self.assertEqual(partials[0], read_partial_results_file(files[0]))
+
+            merged = merge_partial_results_files(files)
+            expected = partials[0].merge(partials[1]).merge(partials[2])
+            self.assertEqual(expected.to_results('commit'), merged.to_results('commit'))
+
+    def test_merge_invalid_files(self):
+        merged = merge_partial_results_files(['files/junit.fail.xml', 'files/does-not-exist.json.gz'])
+        self.assertEqual(2, merged.files)
+        self.assertEqual(0, merged.cases)
+        self.assertEqual(['files/junit.fail.xml', 'files/does-not-exist.json.gz'], [error.file for error in merged.errors])
+        self.assertTrue(all([isinstance(error, ParseError) and
+                             error.message.startswith('File is not a valid partial results file: ')
+                             for error in merged.errors]))
+
+    def test_to_results_counted_cases(self):
+        case = UnitTestCase(result_file='result', test_file='file', line=1, class_name='class', test_name='test',
+                            result='failure', message='message', content='content', time=1.0)
+        partial = empty_partial_results.merge(PartialUnitTestResults(
+            files=1, errors=[], suites=1, suite_tests=3, suite_skipped=0, suite_failures=1, suite_errors=0, suite_time=3,
+            cases=3, cases_skipped=0, cases_failures=1, cases_errors=0, cases_time=3.0,
+            tests={('file', 'class', 'test'): Counter({'success': 2, 'failure': 1})},
+            retained={('file', 'class', 'test'): [case]}
+        ))
+        results = partial.to_results('commit')
+        states = results.case_results[('file', 'class', 'test')]
+        self.assertEqual([case], states['failure'])
+        self.assertEqual(2, len(states['success']))
+        self.assertEqual([None, None], [case.result_file for case in states['success']])
+        self.assertEqual((1, 0, 1, 0), (results.tests, results.tests_skipped, results.tests_failures, results.tests_errors))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import contextlib
 import locale
+import pickle
 import unittest
 
 import mock
@@ -59,6 +60,37 @@ class PublishTest(unittest.TestCase):
         self.assertEqual({'unskip'}, changes.remaining_and_un_skipped())
         self.assertEqual({'removed-skip'}, changes.removed_skips())
 
+    def test_test_changes_from_test_ids(self):
+        before_all = ['removed-test', 'removed-skip', 'remain-test', 'remain-skip', 'skip', 'unskip']
+        before_skipped = ['removed-skip', 'remain-skip', 'unskip']
+        current_all = ['remain-test', 'remain-skip', 'skip', 'unskip', 'add-test', 'add-skip']
+        current_skipped = ['remain-skip', 'skip', 'add-skip']
+        changes = SomeTestChanges.from_test_ids({get_test_id(test) for test in before_all}, current_all,
+                                                {get_test_id(test) for test in before_skipped}, current_skipped)
+        # names of removed tests are not known from ids
+        self.assertFalse(changes.has_names())
+        self.assertEqual({'add-test', 'add-skip'}, changes.adds())
+        self.assertEqual({'remain-test', 'remain-skip', 'skip', 'unskip'}, changes.remains())
+        self.assertEqual({'add-skip'}, changes.added_and_skipped())
+        self.assertEqual({'skip'}, changes.remaining_and_skipped())
+        self.assertEqual({'unskip'}, changes.remaining_and_un_skipped())
+
+        changes = SomeTestChanges.from_test_ids({get_test_id('test1')}, ['test1', 'test2'], set(), ['test2'])
+        self.assertTrue(changes.has_names())
+        self.assertEqual({'test2'}, changes.adds())
+        self.assertEqual(set(), changes.removes())
+        self.assertEqual({'test2'}, changes.added_and_skipped())
+
+        self.assertTrue(SomeTestChanges.from_test_ids(None, ['test'], None, []).has_names())
+        self.assertTrue(SomeTestChanges(['test'], [], [], []).has_names())
+
+    def test_get_test_id(self):
+        # ids must not change between runs and versions, they are compared with ids of earlier commits
+        self.assertEqual(10857399923672245971, get_test_id('test'))
+        self.assertEqual(1137303695312777912, get_test_id('file ‑ class ‑ test'))
+        self.assertNotEqual(get_test_id('test1'), get_test_id('test2'))
+        self.assertLess(get_test_id('test'), 2 ** 64)
+
     def test_test_changes_empty(self):
         changes = SomeTestChanges([], [], [], [])
         self.assertEqual(set(), changes.adds())
@@ -468,6 +500,70 @@ class PublishTest(unittest.TestCase):
             commit='commit'
         ))
 
+    def test_get_stats_digest_undigest_with_test_ids(self):
+        stats = UnitTestRunResults(
+            files=1, errors=[], suites=2, duration=3,
+            tests=4, tests_succ=5, tests_skip=6, tests_fail=7, tests_error=8,
+            runs=9, runs_succ=10, runs_skip=11, runs_fail=12, runs_error=13,
+            commit='commit'
+        )
+        all_tests = [f'class ‑ test{i}' for i in range(1000)]
+        skipped_tests = all_tests[::10]
+        digest = get_digest_from_stats(stats, all_tests, skipped_tests)
+        self.assertEqual(stats, get_stats_from_digest(digest))
+        self.assertEqual(({get_test_id(test) for test in all_tests}, {get_test_id(test) for test in skipped_tests}),
+                         get_test_ids_from_digest(digest))
+        # sorted ids are delta encoded, skipped tests take one bit per test
+        self.assertLess(len(digest), 1000 * 12)
+        self.assertLess(len(digest) - len(get_digest_from_stats(stats, all_tests, [])), 200)
+
+        # empty test lists
+        digest = get_digest_from_stats(stats, [], [])
+        self.assertEqual((set(), set()), get_test_ids_from_digest(digest))
+
+        # version 1 digests have no test ids
+        self.assertEqual((None, None), get_test_ids_from_digest(get_digest_from_stats(stats)))
+
+    def test_test_ids_digest(self):
+        test_ids = sorted({get_test_id(test) for test in ['test1', 'test2', 'test3']})
+        self.assertEqual(test_ids, get_test_ids_from_test_ids_digest(get_test_ids_digest(test_ids)))
+        self.assertEqual('', get_test_ids_digest([]))
+        self.assertEqual([], get_test_ids_from_test_ids_digest(''))
+
+    def test_subset_digest(self):
+        test_ids = list(range(0, 100, 7))
+        for subset in [set(), {0}, {98}, set(test_ids[::3]), set(test_ids)]:
+            with self.subTest(subset=subset):
+                self.assertEqual(subset, get_subset_from_subset_digest(test_ids, get_subset_digest(test_ids, subset)))
+        self.assertEqual('', get_subset_digest([], set()))
+
+    def test_get_long_summary_with_digest_md_with_test_ids(self):
+        stats = UnitTestRunResults(
+            files=1, errors=[], suites=2, duration=3,
+            tests=4, tests_succ=5, tests_skip=6, tests_fail=7, tests_error=8,
+            runs=9, runs_succ=10, runs_skip=11, runs_fail=12, runs_error=13,
+            commit='commit'
+        )
+        all_tests = [f'class ‑ test{i}' for i in range(1000)]
+        actual = get_long_summary_with_digest_md(stats, all_tests=all_tests, skipped_tests=[])
+        digest = actual[actual.index(digest_prefix) + len(digest_prefix):]
+        self.assertEqual(({get_test_id(test) for test in all_tests}, set()), get_test_ids_from_digest(digest))
+
+        # the digest provides only stats when test ids do not fit into the summary
+        with mock.patch('publish.max_summary_length', len(actual) - 1):
+            actual = get_long_summary_with_digest_md(stats, all_tests=all_tests, skipped_tests=[])
+        digest = actual[actual.index(digest_prefix) + len(digest_prefix):]
+        self.assertEqual((None, None), get_test_ids_from_digest(digest))
+        self.assertEqual(stats, get_stats_from_digest(digest))
+
+        # tests are not hashed at all when their ids cannot fit into the summary
+        all_tests = [f'class ‑ test{i}' for i in range(max_summary_length // min_digest_test_id_length + 1)]
+        with mock.patch('publish.get_test_id') as get_test_id_mock:
+            actual = get_long_summary_with_digest_md(stats, all_tests=all_tests, skipped_tests=[])
+        get_test_id_mock.assert_not_called()
+        digest = actual[actual.index(digest_prefix) + len(digest_prefix):]
+        self.assertEqual((None, None), get_test_ids_from_digest(digest))
+
     def test_digest_ungest_string(self):
         digest = digest_string('abc')
         self.assertTrue(isinstance(digest, str))
@@ -825,6 +921,22 @@ class PublishTest(unittest.TestCase):
             'Results for commit commit.\n')
         )
 
+    def test_get_partitions_md(self):
+        def stats(tests: int, duration: int) -> UnitTestRunResults:
+            return UnitTestRunResults(files=1, errors=[], suites=0, duration=duration,
+                                      tests=tests, tests_succ=tests - 3, tests_skip=1, tests_fail=1, tests_error=1,
+                                      runs=tests + 1, runs_succ=tests - 2, runs_skip=1, runs_fail=1, runs_error=1,
+                                      commit='commit')
+
+        self.assertEqual('', get_partitions_md(None))
+        self.assertEqual('', get_partitions_md({}))
+        self.assertEqual('\n'
+                         '|partition|tests|:heavy_check_mark:|:zzz:|:x:|:fire:|runs|:stopwatch:|\n'
+                         '|:--|--:|--:|--:|--:|--:|--:|--:|\n'
+                         '|linux/py3.8|10|7|1|1|1|11|1m 5s|\n'
+                         '|a&#124;b|3|0|1|1|1|4|0s|\n',
+                         get_partitions_md({'linux/py3.8': stats(10, 65), 'a|b': stats(3, 0)}))
+
     def test_get_long_summary_with_digest_md_with_single_run(self):
         # makes gzipped digest deterministic
         with mock.patch('gzip.time.time', return_value=0):
@@ -1405,6 +1517,14 @@ class PublishTest(unittest.TestCase):
         annotation = Annotation(path='file', start_line=0, end_line=0, start_column=None, end_column=None, annotation_level='notice', message='message', title=None, raw_details=None)
         self.assertEqual(dict(path='file', start_line=0, end_line=0, annotation_level='notice', message='message'), annotation.to_dict())
 
+    def test_annotation_slots(self):
+        annotation = Annotation(path='file', start_line=0, end_line=0, start_column=None, end_column=None, annotation_level='notice', message='message', title=None, raw_details=None)
+        self.assertFalse(hasattr(annotation, '__dict__'))
+        self.assertEqual(annotation, pickle.loads(pickle.dumps(annotation)))
+        # to_dict does not modify the annotation
+        annotation.to_dict()
+        self.assertIsNone(annotation.title)
+
     def test_annotation_to_dict_abbreviation(self):
         annotation = Annotation(path='file', start_line=123, end_line=123, start_column=None, end_column=None, annotation_level='notice', message='message ' * 8000, title='title - ' * 31, raw_details='raw ' * 16000)
         self.assertEqual('message ' * 8000, annotation.to_dict().get('message'))
@@ -1652,11 +1772,218 @@ class PublishTest(unittest.TestCase):
 
         self.assertEqual(expected, annotations)
 
+    def test_get_case_annotation_index(self):
+        def case(result_file: str, result: str, content: Optional[str]) -> UnitTestCase:
+            return UnitTestCase(result_file=result_file, test_file='file1', line=123, class_name='class1', test_name='test1',
+                                result=result, message='message', content=content, time=1.0)
+
+        failures = [case('result-file3', 'failure', 'content1'), case('result-file1', 'failure', 'content2'), case(None, 'failure', 'content1')]
+        errors = [case('result-file2', 'error', 'content3')]
+        results = UnitTestCaseResults([
+            ((None, 'class1', 'test1'), dict([
+                ('success', [case('result-file1', 'success', None)] * 3),
+                ('failure', failures),
+                ('error', errors),
+            ])),
+            ((None, 'class1', 'test2'), dict([
+                ('success', [case('result-file1', 'success', None)]),
+                ('skipped', [case('result-file1', 'skipped', None)]),
+            ])),
+            ((None, 'class1', 'test3'), dict([('failure', [])]))
+        ])
+
+        self.assertEqual([
+            CaseAnnotationGroup(case=failures[0], state='failure', message='content1', same_cases=3, all_cases=7, result_files=['result-file1', 'result-file3']),
+            CaseAnnotationGroup(case=errors[0], state='error', message='content3', same_cases=1, all_cases=7, result_files=['result-file2']),
+        ], get_case_annotation_index(results, report_individual_runs=False))
+        self.assertEqual([
+            CaseAnnotationGroup(case=failures[0], state='failure', message='content1', same_cases=2, all_cases=7, result_files=['result-file3']),
+            CaseAnnotationGroup(case=failures[1], state='failure', message='content2', same_cases=1, all_cases=7, result_files=['result-file1']),
+            CaseAnnotationGroup(case=errors[0], state='error', message='content3', same_cases=1, all_cases=7, result_files=['result-file2']),
+        ], get_case_annotation_index(results, report_individual_runs=True))
+
+    def test_get_case_annotations_equals_case_messages(self):
+        # files with the same tests provide tests with multiple runs
+        files = ['files/junit.multiresult.xml', 'files/junit.fail.xml', 'files/junit.fail.xml', 'files/junit.mpi.integration.xml']
+        results = get_test_results(parse_junit_xml_files(files).with_commit('commit'), False).case_results
+        messages = get_case_messages(results)
+        for report_individual_runs in [False, True]:
+            with self.subTest(report_individual_runs=report_individual_runs):
+                expected = [
+                    get_case_annotation(messages, key, state, message, report_individual_runs)
+                    for key in messages
+                    for state in messages[key] if state not in ['success', 'skipped']
+                    for message in (messages[key][state] if report_individual_runs else
+                                    [list(messages[key][state].keys())[0]])
+                ]
+                self.assertGreater(len(expected), 0)
+                self.assertEqual(expected, get_case_annotations(results, report_individual_runs))
+
+    def test_get_case_fingerprint(self):
+        self.assertEqual(get_case_fingerprint('failure', 'Connection to 10.0.0.12:8080 refused after 3000 ms'),
+                         get_case_fingerprint('failure', 'Connection to 10.0.0.7:8081 refused after 12 ms'))
+        self.assertEqual(get_case_fingerprint('failure', 'object at 0x7f3a2b1c, see /tmp/pytest-of-runner/pytest-3/test0/out.txt'),
+                         get_case_fingerprint('failure', 'object at 0x55d0c1e2, see /tmp/pytest-of-runner/pytest-4/test1/out.txt'))
+        self.assertEqual(get_case_fingerprint('error', 'C:\\Users\\runner\\AppData\\Local\\Temp\\tmp5x2a\\data.bin missing'),
+                         get_case_fingerprint('error', 'C:\\Users\\runner\\AppData\\Local\\Temp\\tmpq9w1\\data.bin missing'))
+        self.assertEqual(get_case_fingerprint('error', 'request 123e4567-e89b-12d3-a456-426614174000 failed'),
+                         get_case_fingerprint('error', 'request 9b2e0c1a-0f3d-4b7e-8c55-aa41d07e5f19 failed'))
+        self.assertEqual(get_case_fingerprint('failure', None), get_case_fingerprint('failure', ''))
+
+        self.assertNotEqual(get_case_fingerprint('failure', 'Connection refused'), get_case_fingerprint('error', 'Connection refused'))
+        self.assertNotEqual(get_case_fingerprint('failure', 'Connection refused'), get_case_fingerprint('failure', 'Connection reset'))
+        self.assertNotEqual(get_case_fingerprint('failure', 'see /home/runner/out.txt'), get_case_fingerprint('failure', 'see /home/runner/in.txt'))
+
+    def test_get_case_annotations_clustered(self):
+        def case(test_name: str, result: str, content: str) -> UnitTestCase:
+            return UnitTestCase(result_file='result-file', test_file=None, line=12, class_name='class', test_name=test_name,
+                                result=result, message='message', content=content, time=1.0)
+
+        results = UnitTestCaseResults([
+            ((None, 'class', 'test1'), dict([('failure', [case('test1', 'failure', 'Connection refused at 0x7f3a2b1c')])])),
+            ((None, 'class', 'test2'), dict([('error', [case('test2', 'error', 'Unexpected exception')])])),
+            ((None, 'class', 'test3'), dict([('failure', [case('test3', 'failure', 'Connection refused at 0x55d0c1e2')])])),
+            ((None, 'class', 'test4'), dict([('success', [case('test4', 'success', None)]),
+                                             ('failure', [case('test4', 'failure', 'Connection refused at 0x55d0c1e2')])])),
+            ((None, 'class', 'test5'), dict([('failure', [case('test5', 'failure', 'Assertion failed: 1 != 2')])])),
+        ])
+
+        unclustered = get_case_annotations(results, report_individual_runs=False)
+        self.assertEqual(5, len(unclustered))
+        self.assertEqual(unclustered, get_case_annotations(results, report_individual_runs=False, cluster_threshold=4))
+        self.assertEqual([
+            Annotation(path='.github', start_line=0, end_line=0, start_column=None, end_column=None, annotation_level='warning', message='class ‑ test1\nclass ‑ test3\nclass ‑ test4', title='3 tests failed with similar messages', raw_details='Connection refused at 0x7f3a2b1c'),
+            unclustered[1],
+            unclustered[4],
+        ], get_case_annotations(results, report_individual_runs=False, cluster_threshold=3))
+
+        clustered = get_case_annotations(results, report_individual_runs=False, cluster_threshold=1)
+        self.assertEqual([('3 tests failed with similar messages', 'class ‑ test1\nclass ‑ test3\nclass ‑ test4', 'warning'),
+                          ('1 test with similar errors', 'class ‑ test2', 'failure'),
+                          ('1 test failed with similar messages', 'class ‑ test5', 'warning')],
+                         [(annotation.title, annotation.message, annotation.annotation_level) for annotation in clustered])
+
     def test_get_error_annotation(self):
         self.assertEqual(Annotation(path='file', start_line=0, end_line=0, start_column=None, end_column=None, annotation_level='failure', message='message', title='Error processing result file', raw_details='file'), get_error_annotation(ParseError('file', 'message', None, None)))
         self.assertEqual(Annotation(path='file', start_line=12, end_line=12, start_column=None, end_column=None, annotation_level='failure', message='message', title='Error processing result file', raw_details='file'), get_error_annotation(ParseError('file', 'message', 12, None)))
         self.assertEqual(Annotation(path='file', start_line=12, end_line=12, start_column=34, end_column=34, annotation_level='failure', message='message', title='Error processing result file', raw_details='file'), get_error_annotation(ParseError('file', 'message', 12, 34)))
 
+    def test_get_annotations_within_limit(self):
+        def annotation(title: str, level: str) -> Annotation:
+            return Annotation(path='path', start_line=0, end_line=0, start_column=None, end_column=None,
+                              annotation_level=level, message='message', title=title, raw_details=None)
+
+        error_annotations = [annotation('parse error', 'failure')]
+        case_annotations = [annotation('failure 1', 'warning'), annotation('error', 'failure'), annotation('failure 2', 'warning')]
+        test_list_annotation_groups = [[annotation('skipped tests', 'notice')],
+                                       [annotation('all tests 1', 'notice'), annotation('all tests 2', 'notice')]]
+
+        def titles(max_annotations: Optional[int]) -> List[str]:
+            return [annotation.title for annotation in get_annotations_within_limit(
+                error_annotations, case_annotations, test_list_annotation_groups, max_annotations
+            )]
+
+        # within limit, annotations are kept in their order
+        all_titles = ['parse error', 'failure 1', 'error', 'failure 2', 'skipped tests', 'all tests 1', 'all tests 2']
+        self.assertEqual(all_titles, titles(None))
+        self.assertEqual(all_titles, titles(7))
+        self.assertEqual(all_titles, titles(100))
+
+        self.assertEqual([], titles(0))
+        self.assertEqual(['Annotations limited to 1'], titles(1))
+        self.assertEqual(['parse error', 'error', 'Annotations limited to 3'], titles(3))
+        self.assertEqual(['parse error', 'error', 'failure 1', 'failure 2', 'skipped tests', 'Annotations limited to 6'], titles(6))
+        self.assertEqual(['parse error', 'error', 'failure 1', 'failure 2', 'Annotations limited to 5'], titles(5))
+
+        # iterables are iterated only once
+        self.assertEqual(['parse error', 'error', 'failure 1', 'failure 2', 'skipped tests', 'Annotations limited to 6'],
+                         [annotation.title for annotation in get_annotations_within_limit(
+                             iter(error_annotations), iter(case_annotations), iter(test_list_annotation_groups), 6
+                         )])
+
+        notices = [annotations[-1] for annotations in [
+            list(get_annotations_within_limit(error_annotations, case_annotations, test_list_annotation_groups, max_annotations))
+            for max_annotations in [1, 3, 6]
+        ]]
+        self.assertEqual([Annotation(path='.github', start_line=0, end_line=0, start_column=None, end_column=None,
+                                     annotation_level='notice', message='Not annotated: 1 parse error, 1 test error, 2 test failures, 2 test lists.',
+                                     title='Annotations limited to 1', raw_details=None),
+                          Annotation(path='.github', start_line=0, end_line=0, start_column=None, end_column=None,
+                                     annotation_level='notice', message='Not annotated: 2 test failures, 2 test lists.',
+                                     title='Annotations limited to 3', raw_details=None),
+                          Annotation(path='.github', start_line=0, end_line=0, start_column=None, end_column=None,
+                                     annotation_level='notice', message='Not annotated: 1 test list.',
+                                     title='Annotations limited to 6', raw_details=None)],
+                         notices)
+
+    def test_get_annotations_within_limit_is_lazy(self):
+        def annotation(title: str) -> Annotation:
+            return Annotation(path='path', start_line=0, end_line=0, start_column=None, end_column=None,
+                              annotation_level='warning', message='message', title=title, raw_details=None)
+
+        def test_list_annotation_groups() -> Iterator[List[Annotation]]:
+            self.fail('test lists should not be built before they are needed')
+            yield []
+
+        annotations = get_annotations_within_limit([annotation('error')], iter([annotation('failure')]),
+                                                   test_list_annotation_groups(), None)
+        self.assertEqual('error', next(annotations).title)
+        self.assertEqual('failure', next(annotations).title)
+
+    def test_get_annotations_within_limit_builds_taken_case_annotations_only(self):
+        def case(test_name: str, result: str) -> UnitTestCase:
+            return UnitTestCase(result_file='result', test_file='file', line=1, class_name='class', test_name=test_name,
+                                result=result, message=None, content=f'{test_name} {result}', time=1.0)
+
+        results = UnitTestCaseResults([
+            ((None, 'class', f'test{index}'), dict([(result, [case(f'test{index}', result)])]))
+            for index, result in enumerate(['failure', 'error', 'failure', 'error', 'failure'])
+        ])
+        case_annotations = CaseAnnotations(results, report_individual_runs=False)
+        self.assertEqual(['warning', 'failure', 'warning', 'failure', 'warning'],
+                         [case_annotations.get_annotation_level(index) for index in range(len(case_annotations))])
+
+        def test_list_annotation_groups() -> Iterator[List[Annotation]]:
+            self.fail('test lists should not be built before the case annotations are sent')
+            yield []
+
+        with mock.patch('publish.get_case_group_annotation', wraps=get_case_group_annotation) as group_annotation:
+            annotations = get_annotations_within_limit([], case_annotations, test_list_annotation_groups(), 4)
+            group_annotation.assert_not_called()
+            self.assertEqual('test1 (class) with error', next(annotations).title)
+            self.assertEqual(1, group_annotation.call_count)
+            self.assertEqual('test3 (class) with error', next(annotations).title)
+            self.assertEqual('test0 (class) failed', next(annotations).title)
+            self.assertEqual(3, group_annotation.call_count)
+
+    def test_get_annotation_batches(self):
+        def annotation(index: int) -> Annotation:
+            return Annotation(path='path', start_line=index, end_line=index, start_column=None, end_column=None,
+                              annotation_level='warning', message='message', title=None, raw_details=None)
+
+        def lines(batches: Iterator[List[Mapping[str, Any]]]) -> List[List[int]]:
+            return [[annotation['start_line'] for annotation in batch] for batch in batches]
+
+        self.assertEqual([[]], lines(get_annotation_batches([])))
+        self.assertEqual([[0, 1, 2]], lines(get_annotation_batches([annotation(index) for index in range(3)])))
+        self.assertEqual([[0, 1], [2, 3]], lines(get_annotation_batches([annotation(index) for index in range(4)], 2)))
+        self.assertEqual([[0, 1], [2, 3], [4]], lines(get_annotation_batches([annotation(index) for index in range(5)], 2)))
+        self.assertEqual([list(range(50)), list(range(50, 100)), [100]],
+                         lines(get_annotation_batches(annotation(index) for index in range(101))))
+
+        # annotations are serialized and truncated
+        long = Annotation(path='path', start_line=1, end_line=1, start_column=None, end_column=None,
+                          annotation_level='warning', message='message', title='title' * 100, raw_details=None)
+        self.assertEqual([[{'path': 'path', 'start_line': 1, 'end_line': 1, 'annotation_level': 'warning',
+                            'message': 'message', 'title': long.to_dict()['title']}]],
+                         list(get_annotation_batches([long])))
+        self.assertEqual(255, len(long.to_dict()['title']))
+
+        # the first batch is provided before later annotations are built
+        batches = get_annotation_batches((annotation(index) if index < 2 else self.fail('built too early')
+                                          for index in range(3)), 2)
+        self.assertEqual([[0, 1]], lines([next(batches)]))
+
     def test_get_all_tests_list_annotation(self):
         results = UnitTestCaseResults([
             ((None, 'class1', 'test2'), dict([
@@ -1822,6 +2149,182 @@ class PublishTest(unittest.TestCase):
                           ['abcdefghijklmnopqrstuvw-9']],
                          chunks)
 
+    def test_front_code_test_list(self):
+        self.assertEqual([], front_code_test_list([]))
+        self.assertEqual([], decode_front_coded_test_list([]))
+
+        tests = ['class ‑ test', 'class ‑ test1', 'class ‑ test2', 'class2 ‑ test', 'other ‑ test', 'other ‑ test']
+        lines = front_code_test_list(tests)
+        self.assertEqual(['0 class ‑ test', '12 1', '12 2', '5 2 ‑ test', '0 other ‑ test', '12 '], lines)
+        self.assertEqual(tests, decode_front_coded_test_list(lines))
+
+        # suffixes may contain spaces and digits
+        tests = ['a 1', 'a 1 2', 'a 12 3']
+        self.assertEqual(['0 a 1', '3  2', '3 2 3'], front_code_test_list(tests))
+        self.assertEqual(tests, decode_front_coded_test_list(front_code_test_list(tests)))
+
+    def test_front_code_test_list_with_line_breaks(self):
+        tests = ['cls ‑ test[a\nb]', 'cls ‑ test[a\r\nb]', 'cls ‑ test[a\\nb]']
+        lines = front_code_test_list(tests)
+        self.assertEqual(['0 cls ‑ test[a\\nb]', '12 \\r\\nb]', '12 \\\\nb]'], lines)
+        self.assertTrue(all('\n' not in line and '\r' not in line for line in lines))
+        self.assertEqual(tests, decode_front_coded_test_list('\n'.join(lines).split('\n')))
+
+    def test_decode_front_coded_test_list_with_undecodable_lines(self):
+        self.assertIsNone(decode_front_coded_test_list(['0 cls ‑ test[a', 'b]']))
+        self.assertIsNone(decode_front_coded_test_list(['0 test', '5 longer than previous']))
+        self.assertIsNone(decode_front_coded_test_list(['-1 test']))
+        self.assertIsNone(decode_front_coded_test_list(['']))
+
+    def test_chunk_front_coded(self):
+        self.assertEqual([], chunk_front_coded_test_list([], '\n', 100))
+
+        tests = [f'abcdefghijklmnopqrstu-{i}' for i in range(10)]
+        self.assertEqual([front_code_test_list(tests)], chunk_front_coded_test_list(tests, '\n', 100))
+
+        # the first test of each chunk is not front-coded, so each chunk can be decoded on its own
+        tests = [f'abcdefghijklmnopqrstuvwxyz-{i:02d}' for i in range(30)]
+        chunks = chunk_front_coded_test_list(tests, '\n', 100)
+        self.assertEqual([['0 abcdefghijklmnopqrstuvwxyz-00'] + [f'28 {i}' for i in range(1, 10)] + ['27 10'] + [f'28 {i}' for i in range(1, 4)],
+                          ['0 abcdefghijklmnopqrstuvwxyz-14'] + [f'28 {i}' for i in range(5, 10)] + ['27 20'] + [f'28 {i}' for i in range(1, 8)],
+                          ['0 abcdefghijklmnopqrstuvwxyz-28', '28 9']],
+                         chunks)
+        self.assertTrue(all(len('\n'.join(chunk).encode('utf8')) < 100 for chunk in chunks))
+        self.assertEqual(tests, [test for chunk in chunks for test in decode_front_coded_test_list(chunk)])
+
+        # in a plain test list, only three of those tests fit into one chunk
+        self.assertEqual(10, len(chunk_test_list(tests, '\n', 100)))
+
+    def test_get_test_list_annotation_front_coded(self):
+        tests = ['class1 ‑ test1', 'class1 ‑ test2', 'file ‑ class1 ‑ test2']
+        self.assertEqual([], get_test_list_annotation([], 'test', encoding=test_list_encoding_front_coded))
+        self.assertEqual(
+            [Annotation(path='.github', start_line=0, end_line=0, start_column=None, end_column=None, annotation_level='notice', message='There is 1 test, see "Raw output" for the name of the test.', title='1 test found [front-coded]', raw_details='0 class1 ‑ test1')],
+            get_test_list_annotation(tests[:1], 'test', encoding=test_list_encoding_front_coded)
+        )
+        self.assertEqual(
+            [Annotation(path='.github', start_line=0, end_line=0, start_column=None, end_column=None, annotation_level='notice', message='There are 3 skipped tests, see "Raw output" for the full list of skipped tests.', title='3 skipped tests found [front-coded]', raw_details='0 class1 ‑ test1\n13 2\n0 file ‑ class1 ‑ test2')],
+            get_test_list_annotation(tests, 'skipped test', encoding=test_list_encoding_front_coded)
+        )
+        self.assertEqual(
+            [
+                Annotation(path='.github', start_line=0, end_line=0, start_column=None, end_column=None, annotation_level='notice', message='There are 3 tests, see "Raw output" for the list of tests 1 to 2.', title='3 tests found (test 1 to 2) [front-coded]', raw_details='0 class1 ‑ test1\n13 2'),
+                Annotation(path='.github', start_line=0, end_line=0, start_column=None, end_column=None, annotation_level='notice', message='There are 3 tests, see "Raw output" for the list of tests 3 to 3.', title='3 tests found (test 3 to 3) [front-coded]', raw_details='0 file ‑ class1 ‑ test2')
+            ],
+            get_test_list_annotation(tests, 'test', max_chunk_size=40, encoding=test_list_encoding_front_coded)
+        )
+
+    def test_get_test_list_annotation_front_coded_size(self):
+        tests = sorted(f'uk.co.gresearch.spark.diff.DiffOptionsSuite{suite} ‑ diff with options {test}'
+                       for suite in range(100) for test in range(500))
+        plain = get_test_list_annotation(tests, 'test')
+        front_coded = get_test_list_annotation(tests, 'test', encoding=test_list_encoding_front_coded)
+        self.assertEqual(57, len(plain))
+        self.assertEqual(4, len(front_coded))
+        self.assertEqual(tests, [test for annotation in front_coded
+                                 for test in decode_front_coded_test_list(annotation.raw_details.split('\n'))])
+
+    def test_chunk_gzip(self):
+        self.assertEqual([], chunk_gzip_test_list([], '\n', 100))
+
+        tests = [f'abcdefghijklmnopqrstu-{i}' for i in range(10)]
+        chunks = chunk_gzip_test_list(tests, '\n', 200)
+        self.assertEqual([tests], [chunk for chunk, _ in chunks])
+        self.assertEqual(tests, decode_gzip_test_list(chunks[0][1]))
+
+        tests = [f'abcdefghijklmnopqrstuvwxyz-{i:03d}' for i in range(1000)]
+        chunks = chunk_gzip_test_list(tests, '\n', 1000)
+        self.assertTrue(all(len(details) < 1000 for _, details in chunks))
+        self.assertEqual(tests, [test for chunk, _ in chunks for test in chunk])
+        self.assertEqual(tests, [test for _, details in chunks for test in decode_gzip_test_list(details)])
+        # compressed chunks hold many more tests than plain chunks
+        self.assertLess(len(chunks) * 5, len(chunk_test_list(tests, '\n', 1000)))
+
+        # a test that does not fit into a chunk on its own gets its own chunk
+        tests = ['a', bytes(range(256)).hex() * 2, 'b']
+        chunks = chunk_gzip_test_list(tests, '\n', 100)
+        self.assertEqual([['a'], [tests[1]], ['b']], [chunk for chunk, _ in chunks])
+
+    def test_get_test_list_annotation_gzip(self):
+        tests = ['class1 ‑ test1', 'class1 ‑ test2', 'file ‑ class1 ‑ test2']
+        self.assertEqual([], get_test_list_annotation([], 'test', encoding=test_list_encoding_gzip))
+
+        annotations = get_test_list_annotation(tests, 'skipped test', encoding=test_list_encoding_gzip)
+        self.assertEqual(['3 skipped tests found [gzip]'], [annotation.title for annotation in annotations])
+        self.assertEqual(['There are 3 skipped tests, see "Raw output" for the full list of skipped tests.'],
+                         [annotation.message for annotation in annotations])
+        self.assertEqual(tests, decode_gzip_test_list(annotations[0].raw_details))
+
+        annotations = get_test_list_annotation(tests, 'test', max_chunk_size=60, encoding=test_list_encoding_gzip)
+        self.assertEqual(['3 tests found (test 1 to 2) [gzip]', '3 tests found (test 3 to 3) [gzip]'],
+                         [annotation.title for annotation in annotations])
+        self.assertEqual(tests, [test for annotation in annotations for test in decode_gzip_test_list(annotation.raw_details)])
+
+    def test_get_test_list_annotation_gzip_size(self):
+        tests = sorted(f'uk.co.gresearch.spark.diff.DiffOptionsSuite{suite} ‑ diff with options {test}'
+                       for suite in range(100) for test in range(500))
+        plain = get_test_list_annotation(tests, 'test')
+        compressed = get_test_list_annotation(tests, 'test', encoding=test_list_encoding_gzip)
+        self.assertEqual(57, len(plain))
+        self.assertLessEqual(len(compressed), 5)
+        self.assertTrue(all(len(annotation.raw_details) < 64000 for annotation in compressed))
+        self.assertEqual(tests, [test for annotation in compressed for test in decode_gzip_test_list(annotation.raw_details)])
+
+    def test_get_test_list_changes(self):
+        self.assertEqual([], get_test_list_changes([], []))
+        self.assertEqual([], get_test_list_changes(['test1', 'test2'], ['test2', 'test1']))
+        self.assertEqual(['+test1', '-test2', '+test3'], get_test_list_changes(['test1', 'test3'], ['test2']))
+        self.assertEqual(['-test1', '-test2'], get_test_list_changes([], ['test1', 'test2']))
+
+    def test_delta_test_list_apply(self):
+        reference = ['test1', 'test2', 'test4']
+        tests = ['test1', 'test3', 'test4']
+        delta = DeltaTestList(reference_id=1234, hash=get_test_list_hash(tests), changes=get_test_list_changes(tests, reference))
+        self.assertEqual(tests, delta.apply(reference))
+        self.assertEqual(tests, delta.apply(list(reversed(reference))))
+        # the hash does not match when applied to a different reference
+        self.assertIsNone(delta.apply(['test1', 'test2']))
+        self.assertIsNone(delta.apply([]))
+
+    def test_get_test_list_delta_annotation(self):
+        reference = ['class1 ‑ test1', 'class1 ‑ test2', 'class1 ‑ test3']
+        tests = ['class1 ‑ test1', 'class1 ‑ test3', 'class1 ‑ test4']
+        hash = get_test_list_hash(tests)
+
+        self.assertEqual([], get_test_list_delta_annotation([], reference, 1234, 'test'))
+        self.assertEqual(
+            [Annotation(path='.github', start_line=0, end_line=0, start_column=None, end_column=None, annotation_level='notice', message='See "Raw output" for the changes to the tests of check run 1234.', title='3 tests found [delta]', raw_details=f'1234 {hash}\n-class1 ‑ test2\n+class1 ‑ test4')],
+            get_test_list_delta_annotation(tests, reference, 1234, 'test')
+        )
+        self.assertEqual(
+            [Annotation(path='.github', start_line=0, end_line=0, start_column=None, end_column=None, annotation_level='notice', message='See "Raw output" for the changes to the skipped tests of check run 1234.', title='1 skipped test found [delta]', raw_details=f'1234 {get_test_list_hash(tests[:1])}')],
+            get_test_list_delta_annotation(tests[:1], tests[:1], 1234, 'skipped test')
+        )
+        self.assertEqual(
+            [
+                Annotation(path='.github', start_line=0, end_line=0, start_column=None, end_column=None, annotation_level='notice', message='See "Raw output" for the changes 1 to 1 to the tests of check run 1234.', title='3 tests found (changes 1 to 1) [delta]', raw_details=f'1234 {hash}\n-class1 ‑ test2'),
+                Annotation(path='.github', start_line=0, end_line=0, start_column=None, end_column=None, annotation_level='notice', message='See "Raw output" for the changes 2 to 2 to the tests of check run 1234.', title='3 tests found (changes 2 to 2) [delta]', raw_details=f'1234 {hash}\n+class1 ‑ test4')
+            ],
+            get_test_list_delta_annotation(tests, reference, 1234, 'test', max_chunk_size=100)
+        )
+
+        # with as many changes as tests, the tests should be listed in full
+        self.assertIsNone(get_test_list_delta_annotation(tests[:2], ['class1 ‑ test2', 'class1 ‑ test4'], 1234, 'test'))
+        self.assertIsNone(get_test_list_delta_annotation(tests, [], 1234, 'test'))
+
+    def test_decode_test_list_delta(self):
+        reference = [f'class ‑ test{i}' for i in range(100)]
+        tests = reference[:40] + reference[50:] + ['class ‑ test100']
+        annotations = get_test_list_delta_annotation(tests, reference, 1234, 'test', max_chunk_size=150)
+        self.assertEqual(3, len(annotations))
+
+        deltas = [decode_test_list_delta(annotation.raw_details) for annotation in annotations]
+        self.assertEqual({1234}, {delta.reference_id for delta in deltas})
+        self.assertEqual({get_test_list_hash(tests)}, {delta.hash for delta in deltas})
+        delta = DeltaTestList(reference_id=1234, hash=get_test_list_hash(tests), changes=[change for delta in deltas for change in delta.changes])
+        self.assertEqual(11, len(delta.changes))
+        self.assertEqual(sorted(tests), delta.apply(reference))
+
     def test_files(self):
         parsed = parse_junit_xml_files(['files/junit.gloo.elastic.spark.tf.xml',
                                         'files/junit.gloo.elastic.spark.torch.xml',
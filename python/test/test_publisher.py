@@ -7,6 +7,7 @@ from github import Github, GithubException
 from publish import *
 from publish.github_action import GithubAction
 from publish.publisher import Publisher, Settings
+from publish.resources import degradation_case_results, degradation_test_lists
 from publish.unittestresults import UnitTestCase, ParseError
 
 errors = [ParseError('file', 'error', 1, 2)]
@@ -41,7 +42,12 @@ class TestPublisher(unittest.TestCase):
                         event: Optional[dict] = {'before': 'before'},
                         event_name: str = 'event name',
                         pull_request_build: str = pull_request_build_mode_merge,
-                        test_changes_limit: Optional[int] = 5):
+                        test_changes_limit: Optional[int] = 5,
+                        test_list_encoding: str = test_list_encoding_plain,
+                        annotation_cluster_threshold: Optional[int] = None,
+                        max_annotations: Optional[int] = None,
+                        max_result_file_size: Optional[int] = None,
+                        max_result_file_cases: Optional[int] = None):
         return Settings(
             token=None,
             api_url='https://the-github-api-url',
@@ -62,7 +68,20 @@ class TestPublisher(unittest.TestCase):
             hide_comment_mode=hide_comment_mode,
             report_individual_runs=report_individual_runs,
             dedup_classes_by_file_name=dedup_classes_by_file_name,
-            check_run_annotation=check_run_annotation
+            check_run_annotation=check_run_annotation,
+            test_include=None,
+            test_exclude=None,
+            memory_budget=None,
+            memory_limit_fraction=0.9,
+            json_file=None,
+            partition_by=None,
+            mode='publish',
+            partial_file=None,
+            test_list_encoding=test_list_encoding,
+            annotation_cluster_threshold=annotation_cluster_threshold,
+            max_annotations=max_annotations,
+            max_result_file_size=max_result_file_size,
+            max_result_file_cases=max_result_file_cases
         )
 
     stats = UnitTestRunResults(
@@ -357,20 +376,33 @@ class TestPublisher(unittest.TestCase):
         settings = self.create_settings(comment_mode=comment_mode_update, compare_earlier=False)
         publisher = mock.MagicMock(Publisher)
         publisher._settings = settings
+        publisher._degradations = []
+        publisher.get_test_lists = mock.Mock(side_effect=lambda cases: Publisher.get_test_lists(publisher, cases))
+        publisher.get_test_ids_from_check_run = mock.Mock(return_value=(None, None))
         publisher.get_test_lists_from_check_run = mock.Mock(return_value=(None, None))
         publisher.reuse_comment = mock.Mock(return_value=one_exists)
         with mock.patch('publish.publisher.get_long_summary_md', return_value='body'):
             Publisher.publish_comment(publisher, 'title', stats, pr, cr, cases)
         mock_calls = publisher.mock_calls
 
-        self.assertEqual(2, len(mock_calls))
+        self.assertEqual(4, len(mock_calls))
 
         (method, args, kwargs) = mock_calls[0]
-        self.assertEqual('get_test_lists_from_check_run', method)
-        self.assertEqual((None, ), args)
+        self.assertEqual('get_test_lists', method)
+        self.assertEqual((cases, ), args)
         self.assertEqual({}, kwargs)
 
         (method, args, kwargs) = mock_calls[1]
+        self.assertEqual('get_test_ids_from_check_run', method)
+        self.assertEqual((None, ), args)
+        self.assertEqual({}, kwargs)
+
+        (method, args, kwargs) = mock_calls[2]
+        self.assertEqual('get_test_lists_from_check_run', method)
+        self.assertEqual((None, publisher.get_check_run_by_id), args)
+        self.assertEqual({}, kwargs)
+
+        (method, args, kwargs) = mock_calls[3]
         self.assertEqual('reuse_comment', method)
         self.assertEqual((pr, '## title\nbody'), args)
         self.assertEqual({}, kwargs)
@@ -607,6 +639,24 @@ class TestPublisher(unittest.TestCase):
 
     all_annotations = [all_tests_annotation, skipped_tests_annotation, other_annotation]
 
+    @staticmethod
+    def create_check_run_annotations(annotations: List[Annotation]) -> List[mock.Mock]:
+        check_run_annotations = []
+        for annotation in annotations:
+            check_run_annotation = mock.Mock()
+            check_run_annotation.title = annotation.title
+            check_run_annotation.message = annotation.message
+            check_run_annotation.raw_details = annotation.raw_details
+            check_run_annotations.append(check_run_annotation)
+        return check_run_annotations
+
+    @staticmethod
+    def create_check_run(check_run_id: int, annotations: List[Annotation]) -> mock.Mock:
+        check_run = mock.Mock()
+        check_run.id = check_run_id
+        check_run.get_annotations = mock.Mock(return_value=TestPublisher.create_check_run_annotations(annotations))
+        return check_run
+
     def test_get_test_lists_from_none_check_run(self):
         self.assertEqual((None, None), Publisher.get_test_lists_from_check_run(None))
 
@@ -673,6 +723,84 @@ class TestPublisher(unittest.TestCase):
             Publisher.get_test_lists_from_check_run(check_run)
         )
 
+    def test_get_test_lists_from_check_run_front_coded_tests(self):
+        all_tests = [f'class ‑ test {i}' for i in range(20)]
+        skipped_tests = ['class ‑ test 1', 'class ‑ test 10']
+        annotations = self.create_check_run_annotations(
+            get_test_list_annotation(all_tests, 'test', max_chunk_size=50, encoding=test_list_encoding_front_coded) +
+            get_test_list_annotation(skipped_tests, 'skipped test', encoding=test_list_encoding_front_coded)
+        )
+        self.assertEqual('20 tests found (test 1 to 7) [front-coded]', annotations[0].title)
+
+        check_run = mock.Mock()
+        check_run.get_annotations = mock.Mock(return_value=annotations)
+        self.assertEqual((all_tests, skipped_tests), Publisher.get_test_lists_from_check_run(check_run))
+
+    def test_get_test_lists_from_check_run_front_coded_tests_with_line_breaks(self):
+        all_tests = ['class ‑ test[a\nb]', 'class ‑ test[a\r\nb\\n]', 'class ‑ test[c]']
+        annotations = self.create_check_run_annotations(
+            get_test_list_annotation(all_tests, 'test', encoding=test_list_encoding_front_coded)
+        )
+        check_run = mock.Mock()
+        check_run.get_annotations = mock.Mock(return_value=annotations)
+        self.assertEqual((all_tests, None), Publisher.get_test_lists_from_check_run(check_run))
+
+        # a test list that cannot be decoded is ignored, rather than failing the action
+        annotations[0].raw_details = '0 class ‑ test[a\nb]\n16 c]'
+        self.assertEqual((None, None), Publisher.get_test_lists_from_check_run(check_run))
+
+    def test_get_test_lists_from_check_run_gzip_tests(self):
+        all_tests = [f'class ‑ test {i}' for i in range(20)]
+        skipped_tests = ['class ‑ test 1', 'class ‑ test 10']
+        annotations = self.create_check_run_annotations(
+            get_test_list_annotation(all_tests, 'test', max_chunk_size=100, encoding=test_list_encoding_gzip) +
+            get_test_list_annotation(skipped_tests, 'skipped test', encoding=test_list_encoding_gzip)
+        )
+        self.assertGreater(len(annotations), 2)
+        self.assertTrue(annotations[0].title.endswith(') [gzip]'))
+
+        check_run = mock.Mock()
+        check_run.get_annotations = mock.Mock(return_value=annotations)
+        self.assertEqual((all_tests, skipped_tests), Publisher.get_test_lists_from_check_run(check_run))
+
+    def test_get_test_lists_from_check_run_delta_tests(self):
+        reference_all_tests = [f'class ‑ test {i}' for i in range(20)]
+        reference_skipped_tests = ['class ‑ test 1', 'class ‑ test 10']
+        reference = self.create_check_run(1234,
+                                          get_test_list_annotation(reference_all_tests, 'test') +
+                                          get_test_list_annotation(reference_skipped_tests, 'skipped test'))
+
+        all_tests = sorted(reference_all_tests[1:] + ['class ‑ test 20'])
+        skipped_tests = ['class ‑ test 1', 'class ‑ test 10', 'class ‑ test 5']
+        check_run = self.create_check_run(
+            2345,
+            get_test_list_delta_annotation(all_tests, reference_all_tests, 1234, 'test', max_chunk_size=100) +
+            get_test_list_delta_annotation(skipped_tests, reference_skipped_tests, 1234, 'skipped test')
+        )
+        get_check_run_by_id = mock.Mock(return_value=reference)
+
+        self.assertEqual((all_tests, skipped_tests), Publisher.get_test_lists_from_check_run(check_run, get_check_run_by_id))
+        get_check_run_by_id.assert_called_once_with(1234)
+
+        # delta test lists cannot be resolved without their reference
+        self.assertEqual((None, None), Publisher.get_test_lists_from_check_run(check_run))
+        self.assertEqual((None, None), Publisher.get_test_lists_from_check_run(check_run, mock.Mock(return_value=None)))
+
+        # delta test lists do not resolve against other references
+        other = self.create_check_run(1234, get_test_list_annotation(reference_all_tests[:10], 'test'))
+        self.assertEqual((None, None), Publisher.get_test_lists_from_check_run(check_run, mock.Mock(return_value=other)))
+
+    def test_get_test_lists_from_check_run_written_chunked_tests(self):
+        # titles of chunked test lists are written as '(test 1 to 2)'
+        annotations = self.create_check_run_annotations(
+            get_test_list_annotation(['test one', 'test two', 'test three'], 'test', max_chunk_size=20)
+        )
+        self.assertEqual('3 tests found (test 1 to 2)', annotations[0].title)
+
+        check_run = mock.Mock()
+        check_run.get_annotations = mock.Mock(return_value=annotations)
+        self.assertEqual((['test one', 'test two', 'test three'], None), Publisher.get_test_lists_from_check_run(check_run))
+
     def test_get_test_lists_from_check_run_none_raw_details(self):
         annotation1 = mock.Mock()
         annotation1.title = '1 test found'
@@ -701,6 +829,117 @@ class TestPublisher(unittest.TestCase):
     def test_publish_check_with_skipped_tests_annotations(self):
         self.do_test_publish_check_without_base_stats([], [skipped_tests_list])
 
+    def test_get_test_list_annotations_front_coded(self):
+        settings = self.create_settings(test_list_encoding=test_list_encoding_front_coded)
+        gh, gha, req, repo, commit = self.create_mocks()
+        publisher = Publisher(settings, gh, gha)
+
+        annotations = publisher.get_test_list_annotations(self.cases)
+        self.assertEqual(['1 skipped test found [front-coded]', '3 tests found [front-coded]'],
+                         [annotation.title for annotation in annotations])
+        self.assertEqual(['0 class ‑ test3', '0 class ‑ test\n12 2\n12 3'],
+                         [annotation.raw_details for annotation in annotations])
+
+    def do_test_get_test_list_annotations_delta(self, base: Optional[mock.Mock], reference: Optional[mock.Mock]):
+        settings = self.create_settings(event={'before': 'before'}, test_list_encoding=test_list_encoding_delta)
+        gh, gha, req, repo, commit = self.create_mocks()
+        publisher = Publisher(settings, gh, gha)
+        publisher.get_pull = mock.Mock(return_value=None)
+        publisher.get_check_run = mock.Mock(return_value=base)
+        publisher.get_check_run_by_id = mock.Mock(return_value=reference)
+
+        annotations = publisher.get_test_list_annotations(self.cases)
+        publisher.get_pull.assert_called_once_with(settings.commit)
+        publisher.get_check_run.assert_called_once_with('before')
+        return publisher, annotations
+
+    def test_get_test_list_annotations_delta(self):
+        base = self.create_check_run(1234,
+                                     get_test_list_annotation(['class ‑ test', 'class ‑ test2', 'class ‑ test4'], 'test') +
+                                     get_test_list_annotation(['class ‑ test3'], 'skipped test'))
+        publisher, annotations = self.do_test_get_test_list_annotations_delta(base, None)
+        publisher.get_check_run_by_id.assert_not_called()
+
+        self.assertEqual(['1 skipped test found [delta]', '3 tests found [delta]'], [annotation.title for annotation in annotations])
+        self.assertEqual([f'1234 {get_test_list_hash(["class ‑ test3"])}',
+                          f'1234 {get_test_list_hash(["class ‑ test", "class ‑ test2", "class ‑ test3"])}\n'
+                          f'+class ‑ test3\n'
+                          f'-class ‑ test4'],
+                         [annotation.raw_details for annotation in annotations])
+
+    def test_get_test_list_annotations_delta_of_delta(self):
+        # the base has delta test lists itself, test lists refer to the reference of the base
+        reference = self.create_check_run(1234,
+                                          get_test_list_annotation(['class ‑ test', 'class ‑ test2', 'class ‑ test4'], 'test') +
+                                          get_test_list_annotation(['class ‑ test3'], 'skipped test'))
+        base = self.create_check_run(2345,
+                                     get_test_list_delta_annotation(['class ‑ test', 'class ‑ test4'], ['class ‑ test', 'class ‑ test2', 'class ‑ test4'], 1234, 'test'))
+        publisher, annotations = self.do_test_get_test_list_annotations_delta(base, reference)
+        publisher.get_check_run_by_id.assert_called_once_with(1234)
+
+        self.assertEqual(['1 skipped test found [delta]', '3 tests found [delta]'], [annotation.title for annotation in annotations])
+        self.assertTrue(all(annotation.raw_details.startswith('1234 ') for annotation in annotations))
+
+    def test_get_test_list_annotations_delta_without_base(self):
+        publisher, annotations = self.do_test_get_test_list_annotations_delta(None, None)
+        self.assertEqual(['1 skipped test found', '3 tests found'], [annotation.title for annotation in annotations])
+
+    def test_get_test_list_annotations_delta_with_many_changes(self):
+        # the base has no test list annotations, so test lists are listed in full
+        base = self.create_check_run(1234, [])
+        publisher, annotations = self.do_test_get_test_list_annotations_delta(base, None)
+        self.assertEqual(['1 skipped test found', '3 tests found'], [annotation.title for annotation in annotations])
+
+    def test_publish_check_with_annotation_cluster_threshold(self):
+        settings = self.create_settings(event={}, annotation_cluster_threshold=1)
+        gh, gha, req, repo, commit = self.create_mocks(commit=mock.Mock(), digest=None, check_names=[])
+        publisher = Publisher(settings, gh, gha)
+
+        with mock.patch('publish.publisher.CaseAnnotations', wraps=CaseAnnotations) as case_annotations:
+            publisher.publish_check(self.stats, self.cases, 'conclusion')
+        case_annotations.assert_called_once_with(self.cases, False, 1)
+
+        annotations = repo.create_check_run.call_args[1]['output']['annotations']
+        self.assertEqual(['1 test failed with similar messages', '1 test with similar errors', '1 skipped test found', '3 tests found'],
+                         [annotation['title'] for annotation in annotations])
+
+    def test_publish_check_with_max_annotations(self):
+        settings = self.create_settings(event={}, max_annotations=3)
+        gh, gha, req, repo, commit = self.create_mocks(commit=mock.Mock(), digest=None, check_names=[])
+        publisher = Publisher(settings, gh, gha)
+
+        publisher.publish_check(self.stats.with_errors(errors), self.cases, 'conclusion')
+
+        annotations = repo.create_check_run.call_args[1]['output']['annotations']
+        self.assertEqual(['Error processing result file', '1 out of 2 runs with error: test2 (class)', 'Annotations limited to 3'],
+                         [annotation['title'] for annotation in annotations])
+        self.assertEqual('Not annotated: 1 test failure, 2 test lists.', annotations[-1]['message'])
+
+    def test_publish_check_with_many_annotations(self):
+        settings = self.create_settings(event={})
+        gh, gha, req, repo, commit = self.create_mocks(commit=mock.Mock(), digest=None, check_names=[])
+        publisher = Publisher(settings, gh, gha)
+
+        case_annotations = (Annotation(path='file', start_line=index, end_line=index, start_column=None, end_column=None,
+                                       annotation_level='warning', message='message', title=f'test {index} failed', raw_details=None)
+                            for index in range(120))
+        get_test_list_annotation_groups = publisher.get_test_list_annotation_groups
+        checks_before_test_lists = []
+
+        def test_list_annotation_groups(cases: UnitTestCaseResults) -> Iterator[List[Annotation]]:
+            checks_before_test_lists.append(repo.create_check_run.call_count)
+            yield from get_test_list_annotation_groups(cases)
+
+        with mock.patch('publish.publisher.CaseAnnotations', return_value=case_annotations), \
+                mock.patch.object(publisher, 'get_test_list_annotation_groups', side_effect=test_list_annotation_groups):
+            publisher.publish_check(self.stats, self.cases, 'conclusion')
+
+        # annotations are sent in batches of 50, test lists are built only once the first two batches are sent
+        self.assertEqual([50, 50, 22], [len(call[1]['output']['annotations']) for call in repo.create_check_run.call_args_list])
+        self.assertEqual(['test 119 failed', '1 skipped test found', '3 tests found'],
+                         [annotation['title'] for annotation in repo.create_check_run.call_args_list[2][1]['output']['annotations']][-3:])
+        self.assertEqual([2], checks_before_test_lists)
+
     def test_publish_check_without_base_stats(self):
         self.do_test_publish_check_without_base_stats([])
 
@@ -733,10 +972,12 @@ class TestPublisher(unittest.TestCase):
                            'Results for commit commit.\n'
                            '\n'
                            '[test-results]:data:application/gzip;base64,'
-                           'H4sIAAAAAAAC/0WOSQqEMBBFryJZu+g4tK2XkRAVCoc0lWQl3t'
-                           '3vULqr9z48alUDTb1XTaLTRPlI4YQM0EU2gdwCzIEYwjllAq2P'
-                           '1sIUrxjpD1E+YjA0QXwf0TM7hqlgOC5HMP/dt/RevnK18F3THx'
-                           'FS08fz1s0zBZBc2w5zHdX73QAAAA=='.format(errors='{} errors\u2004\u2003'.format(len(errors)) if len(errors) > 0 else ''),
+                           'H4sIAAAAAAAC/0WPyw6CMBBFf8V0qwveggkLjS5YuNEPIKSUpA'
+                           'q0tNSIxn93Cgzs5pxJ7tz5korXTJPDxt1tiDa8H8EDKI0qei5a'
+                           'QB8QFv248hBybSgFE6ziySWIcBFVwWsQ0SKYUkKB2YNRprWBfj'
+                           'zPmLfyFJcgz2mugwLTXFueiqbhPRBO4F5M6ekFbJ3z0h4lcTbc'
+                           '3gXvhoA65vqJHpm5iyRsjPQ7SRUbtpezTbAdJCtzfJ+cjmlKfn'
+                           '8EieOUOAEAAA=='.format(errors='{} errors\u2004\u2003'.format(len(errors)) if len(errors) > 0 else ''),
                 'annotations': error_annotations + [
                         {'path': 'test file', 'start_line': 0, 'end_line': 0, 'annotation_level': 'warning', 'message': 'result file', 'title': '1 out of 2 runs failed: test (class)', 'raw_details': 'content'},
                         {'path': 'test file', 'start_line': 0, 'end_line': 0, 'annotation_level': 'failure', 'message': 'result file', 'title': '1 out of 2 runs with error: test2 (class)', 'raw_details': 'error content'}
@@ -786,10 +1027,12 @@ class TestPublisher(unittest.TestCase):
                            'Results for commit commit.\u2003± Comparison against earlier commit past.\n'
                            '\n'
                            '[test-results]:data:application/gzip;base64,'
-                           'H4sIAAAAAAAC/0WOSQqEMBBFryJZu+g4tK2XkRAVCoc0lWQl3t'
-                           '3vULqr9z48alUDTb1XTaLTRPlI4YQM0EU2gdwCzIEYwjllAq2P'
-                           '1sIUrxjpD1E+YjA0QXwf0TM7hqlgOC5HMP/dt/RevnK18F3THx'
-                           'FS08fz1s0zBZBc2w5zHdX73QAAAA=='.format(errors='{} errors\u2004\u2003'.format(len(errors)) if len(errors) > 0 else ''),
+                           'H4sIAAAAAAAC/0WPyw6CMBBFf8V0qwveggkLjS5YuNEPIKSUpA'
+                           'q0tNSIxn93Cgzs5pxJ7tz5korXTJPDxt1tiDa8H8EDKI0qei5a'
+                           'QB8QFv248hBybSgFE6ziySWIcBFVwWsQ0SKYUkKB2YNRprWBfj'
+                           'zPmLfyFJcgz2mugwLTXFueiqbhPRBO4F5M6ekFbJ3z0h4lcTbc'
+                           '3gXvhoA65vqJHpm5iyRsjPQ7SRUbtpezTbAdJCtzfJ+cjmlKfn'
+                           '8EieOUOAEAAA=='.format(errors='{} errors\u2004\u2003'.format(len(errors)) if len(errors) > 0 else ''),
                 'annotations': error_annotations + [
                     {'path': 'test file', 'start_line': 0, 'end_line': 0, 'annotation_level': 'warning', 'message': 'result file', 'title': '1 out of 2 runs failed: test (class)', 'raw_details': 'content'},
                     {'path': 'test file', 'start_line': 0, 'end_line': 0, 'annotation_level': 'failure', 'message': 'result file', 'title': '1 out of 2 runs with error: test2 (class)', 'raw_details': 'error content'},
@@ -828,10 +1071,13 @@ class TestPublisher(unittest.TestCase):
                            '\n'
                            'Results for commit commit.\n'
                            '\n'
-                           '[test-results]:data:application/gzip;base64,H4sIAAAAAAAC/0WOSQqEMBBFryJ'
-                           'Zu+g4tK2XkRAVCoc0lWQl3t3vULqr9z48alUDTb1XTaLTRPlI4YQM0EU2gdwCzIEYwjllAq'
-                           '2P1sIUrxjpD1E+YjA0QXwf0TM7hqlgOC5HMP/dt/RevnK18F3THxFS08fz1s0zBZBc2w5zH'
-                           'dX73QAAAA==',
+                           '[test-results]:data:application/gzip;base64,'
+                           'H4sIAAAAAAAC/0WPyw6CMBBFf8V0qwveggkLjS5YuNEPIKSUpA'
+                           'q0tNSIxn93Cgzs5pxJ7tz5korXTJPDxt1tiDa8H8EDKI0qei5a'
+                           'QB8QFv248hBybSgFE6ziySWIcBFVwWsQ0SKYUkKB2YNRprWBfj'
+                           'zPmLfyFJcgz2mugwLTXFueiqbhPRBO4F5M6ekFbJ3z0h4lcTbc'
+                           '3gXvhoA65vqJHpm5iyRsjPQ7SRUbtpezTbAdJCtzfJ+cjmlKfn'
+                           '8EieOUOAEAAA==',
                 'annotations': [
                     {'path': 'test file', 'start_line': 0, 'end_line': 0, 'annotation_level': 'warning', 'message': 'result file', 'title': '1 out of 2 runs failed: test (class)', 'raw_details': 'content'},
                     {'path': 'test file', 'start_line': 0, 'end_line': 0, 'annotation_level': 'failure', 'message': 'result file', 'title': '1 out of 2 runs with error: test2 (class)', 'raw_details': 'error content'},
@@ -846,6 +1092,20 @@ class TestPublisher(unittest.TestCase):
         # the result of the last call to repo.create_check_run
         self.assertEqual({'check_run_for_kwargs': create_check_run_kwargs}, check_run)
 
+    def test_publish_check_with_degradations(self):
+        settings = self.create_settings(event={}, compare_earlier=False)
+        gh, gha, req, repo, commit = self.create_mocks(commit=mock.Mock(), digest=None, check_names=[])
+        publisher = Publisher(settings, gh, gha, [degradation_case_results, degradation_test_lists])
+        publisher.publish_check(self.stats, self.cases, 'conclusion')
+
+        output = repo.create_check_run.call_args.kwargs['output']
+        self.assertIn('\n:warning: Memory usage came close to the limit, so this run '
+                      'stopped collecting test cases and skipped test list annotations.\n'
+                      '\n[test-results]:data:application/gzip;base64,', output['summary'])
+        # test list annotations are skipped, but the digest is still found by later runs
+        self.assertEqual(['test file', 'test file'], [annotation['path'] for annotation in output['annotations']])
+        self.assertEqual(self.stats, Publisher.get_stats_from_check_run(mock.Mock(output=mock.Mock(summary=output['summary']))))
+
     def test_publish_check_with_multiple_annotation_pages(self):
         earlier_commit = 'past'
         settings = self.create_settings(event={'before': earlier_commit})
@@ -870,6 +1130,8 @@ class TestPublisher(unittest.TestCase):
         # makes gzipped digest deterministic
         with mock.patch('gzip.time.time', return_value=0):
             check_run = publisher.publish_check(self.stats, cases, 'conclusion')
+            # the digest carries the ids of the 150 tests
+            digest = get_digest_from_stats(self.stats, get_all_tests_list(cases), [])
 
         repo.get_commit.assert_called_once_with(earlier_commit)
         # we expect multiple calls to create_check_run
@@ -887,11 +1149,7 @@ class TestPublisher(unittest.TestCase):
                                '\n'
                                'Results for commit commit.\u2003± Comparison against earlier commit past.\n'
                                '\n'
-                               '[test-results]:data:application/gzip;base64,'
-                               'H4sIAAAAAAAC/0WOSQqEMBBFryJZu+g4tK2XkRAVCoc0lWQl3t'
-                               '3vULqr9z48alUDTb1XTaLTRPlI4YQM0EU2gdwCzIEYwjllAq2P'
-                               '1sIUrxjpD1E+YjA0QXwf0TM7hqlgOC5HMP/dt/RevnK18F3THx'
-                               'FS08fz1s0zBZBc2w5zHdX73QAAAA==',
+                               '[test-results]:data:application/gzip;base64,' + digest,
                     'annotations': ([
                         {'path': 'test file', 'start_line': i, 'end_line': i, 'annotation_level': 'warning', 'message': 'result file', 'title': f'test{i} (class) failed', 'raw_details': f'content{i}'}
                         # for each batch starting at start we expect 50 annotations
@@ -955,6 +1213,29 @@ class TestPublisher(unittest.TestCase):
             'Results for commit commit.\n'
         )
 
+    def do_test_publish_comment_with_test_ids(self, before_all_tests: List[str], before_skipped_tests: List[str]) -> mock.Mock:
+        settings = self.create_settings(event={'pull_request': {'base': {'sha': 'commit base'}}}, event_name='pull_request')
+        digest = get_digest_from_stats(self.stats, before_all_tests, before_skipped_tests)
+        gh, gha, req, repo, commit = self.create_mocks(digest=digest, check_names=[settings.check_name])
+        pr = self.create_github_pr(settings.repo, 'base-commit')
+        publisher = Publisher(settings, gh, gha)
+
+        publisher.publish_comment(settings.comment_title, self.stats, pr, cases=self.cases)
+        base_check_run = list(commit.get_check_runs())[0]
+        return pr, base_check_run
+
+    def test_publish_comment_with_test_ids(self):
+        # the digest of the base check run tells all test changes, its annotations are not needed
+        pr, base_check_run = self.do_test_publish_comment_with_test_ids(['class ‑ test', 'class ‑ test2', 'class ‑ test3'], [])
+        base_check_run.get_annotations.assert_not_called()
+        body = pr.create_issue_comment.call_args.args[0]
+        self.assertIn('This pull request <b>skips</b> 1 test.', body)
+
+    def test_publish_comment_with_test_ids_of_removed_tests(self):
+        # names of removed tests are only known from the annotations of the base check run
+        pr, base_check_run = self.do_test_publish_comment_with_test_ids(['class ‑ test', 'class ‑ test2', 'class ‑ test3', 'class ‑ test4'], [])
+        base_check_run.get_annotations.assert_called_once_with()
+
     def test_publish_comment_without_compare(self):
         settings = self.create_settings(event={'pull_request': {'base': {'sha': 'commit base'}}}, event_name='pull_request', compare_earlier=False)
         base_commit = 'base-commit'
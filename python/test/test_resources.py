@@ -0,0 +1,144 @@
+import gc
+import unittest
+import weakref
+
+import mock
+
+from publish import get_degradations_md
+from publish.resources import ResourceMonitor, get_memory_limit, get_rss, \
+    degradation_failure_content, degradation_case_results, degradation_test_lists
+from publish.unittestresults import get_test_results, UnitTestIndex, UnitTestCase
+from publish_unit_test_results import parse_files
+
+
+class TestResources(unittest.TestCase):
+
+    def test_get_rss_and_memory_limit(self):
+        rss = get_rss()
+        limit = get_memory_limit()
+        if rss is not None and limit is not None:
+            self.assertGreater(rss, 0)
+            self.assertGreater(limit, rss)
+
+    def test_get_memory_limit_from_cgroup(self):
+        for content, expected in [('1073741824\n', 1024 * 1024 * 1024), ('max\n', None)]:
+            with self.subTest(content=content), \
+                    mock.patch('publish.resources.open', mock.mock_open(read_data=content)), \
+                    mock.patch('os.sysconf', side_effect=ValueError):
+                self.assertEqual(expected, get_memory_limit())
+
+        # physical memory caps the cgroup limit
+        with mock.patch('publish.resources.open', mock.mock_open(read_data='9223372036854771712\n')), \
+                mock.patch('os.sysconf', return_value=1024):
+            self.assertEqual(1024 * 1024, get_memory_limit())
+
+    def test_resource_monitor(self):
+        rss = mock.Mock(side_effect=[800, 950, 800])
+        monitor = ResourceMonitor(1000, 0.9, rss)
+        self.assertEqual(900, monitor.threshold)
+        self.assertFalse(monitor.exceeded())
+        self.assertTrue(monitor.exceeded())
+        # the monitor stays exceeded without sampling again
+        self.assertTrue(monitor.exceeded())
+        self.assertEqual(2, rss.call_count)
+
+        self.assertFalse(monitor.degraded(degradation_test_lists))
+        monitor.degrade(degradation_test_lists)
+        monitor.degrade(degradation_test_lists)
+        self.assertTrue(monitor.degraded(degradation_test_lists))
+        self.assertEqual([degradation_test_lists], monitor.degradations)
+
+    def test_resource_monitor_without_limit(self):
+        rss = mock.Mock(return_value=10)
+        monitor = ResourceMonitor(None, 0.9, rss)
+        self.assertIsNone(monitor.threshold)
+        self.assertFalse(monitor.exceeded())
+        rss.assert_not_called()
+
+    def test_unit_test_index_degrades(self):
+        parsed = parse_files(['files/junit.fail.xml', 'files/go-test.json', 'files/perl.tap']).with_commit('commit')
+        expected = get_test_results(parsed, False)
+
+        monitor = ResourceMonitor(1000, 0.5, mock.Mock(side_effect=[0, 0, 1000]))
+        with mock.patch('publish.unittestresults.monitor_interval', 1):
+            actual = get_test_results(parsed, False, monitor=monitor)
+
+        self.assertEqual([degradation_failure_content, degradation_case_results], monitor.degradations)
+        # the first two cases are retained without content, statistics cover all cases
+        self.assertEqual(2, len([case for states in actual.case_results.values() for cases in states.values() for case in cases]))
+        self.assertTrue(all([case.content is None
+                             for states in actual.case_results.values()
+                             for cases in states.values()
+                             for case in cases]))
+        self.assertEqual((expected.cases, expected.cases_skipped, expected.cases_failures, expected.cases_errors),
+                         (actual.cases, actual.cases_skipped, actual.cases_failures, actual.cases_errors))
+        self.assertEqual((expected.tests, expected.tests_skipped, expected.tests_failures, expected.tests_errors),
+                         (actual.tests, actual.tests_skipped, actual.tests_failures, actual.tests_errors))
+
+    def test_unit_test_index_degrades_while_parsing(self):
+        files = ['files/junit.fail.xml', 'files/go-test.json', 'files/perl.tap']
+        expected = get_test_results(parse_files(files).with_commit('commit'), False)
+
+        # memory usage is sampled while cases are passed from the parsers to the index
+        monitor = ResourceMonitor(1000, 0.5, mock.Mock(side_effect=[0] * 5 + [1000]))
+        with mock.patch('publish.unittestresults.monitor_interval', 1):
+            index = UnitTestIndex(False, monitor=monitor)
+            parsed = parse_files(files, intern=index.intern, emit=index.add).with_commit('commit')
+        self.assertEqual([], parsed.cases)
+        self.assertEqual([degradation_failure_content, degradation_case_results], monitor.degradations)
+        # the intern does not hold dropped content, nor strings of cases that are not retained
+        self.assertTrue(index.intern.released)
+        self.assertEqual(0, len(index.intern))
+
+        # only cases of the first file are retained, statistics cover all cases
+        actual = index.get_test_results(parsed)
+        retained = [case for states in actual.case_results.values() for cases in states.values() for case in cases]
+        self.assertEqual(5, len(retained))
+        self.assertEqual({'files/junit.fail.xml'}, {case.result_file for case in retained})
+        self.assertEqual((expected.cases, expected.cases_skipped, expected.cases_failures, expected.cases_errors),
+                         (actual.cases, actual.cases_skipped, actual.cases_failures, actual.cases_errors))
+        self.assertEqual((expected.tests, expected.tests_skipped, expected.tests_failures, expected.tests_errors),
+                         (actual.tests, actual.tests_skipped, actual.tests_failures, actual.tests_errors))
+
+    def test_unit_test_index_releases_strings_when_degraded(self):
+        # a str subclass can be referenced weakly, which tells whether anything holds the string
+        class Content(str):
+            pass
+
+        monitor = ResourceMonitor(1000, 0.5, mock.Mock(side_effect=[0, 1000]))
+        with mock.patch('publish.unittestresults.monitor_interval', 10):
+            index = UnitTestIndex(False, monitor=monitor)
+            contents = []
+            for i in range(30):
+                content = index.intern(Content(f'stack trace {i}'))
+                contents.append(weakref.ref(content))
+                index.add(UnitTestCase('result', None, None, 'class', f'test{i}', 'failure', index.intern('message'), content, None))
+                del content
+        gc.collect()
+
+        self.assertEqual([degradation_failure_content, degradation_case_results], monitor.degradations)
+        # content of retained cases has been dropped, cases added after degrading are not retained,
+        # the intern holds none of those strings
+        self.assertEqual(0, len(index.intern))
+        self.assertEqual([], [content() for content in contents if content() is not None])
+        self.assertEqual(19, len([case for states in index.case_results.values() for cases in states.values() for case in cases]))
+
+    def test_unit_test_index_without_monitor(self):
+        parsed = parse_files(['files/junit.fail.xml']).with_commit('commit')
+        index = UnitTestIndex(False)
+        for case in parsed.cases:
+            index.add(case)
+        self.assertEqual(len(parsed.cases), len([case for states in index.case_results.values() for cases in states.values() for case in cases]))
+
+    def test_get_degradations_md(self):
+        self.assertEqual('', get_degradations_md(None))
+        self.assertEqual('', get_degradations_md([]))
+        self.assertEqual('\n:warning: Memory usage came close to the limit, so this run skipped test list annotations.\n',
+                         get_degradations_md([degradation_test_lists]))
+        self.assertEqual('\n:warning: Memory usage came close to the limit, so this run dropped failure details, '
+                         'stopped collecting test cases and skipped test list annotations.\n',
+                         get_degradations_md([degradation_failure_content, degradation_case_results, degradation_test_lists]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import gc
+import sys
+import unittest
+import weakref
+
+from publish import get_case_annotations, get_all_tests_list, get_skipped_tests_list
+from publish.spill import SpilledUnitTestCaseResults
+from publish.unittestresults import get_test_results, get_case_size, UnitTestCase, UnitTestIndex, ParseLimits
+from publish_unit_test_results import parse_files
+
+
+class TestSpill(unittest.TestCase):
+
+    def test_spilled_unit_test_case_results(self):
+        case1 = UnitTestCase('result', 'file', 1, 'class', 'test1', 'failure', 'message', 'content', 1.0)
+        case2 = UnitTestCase('result', 'file', 1, 'class', 'test1', 'success', None, None, 2.0)
+        case3 = UnitTestCase('result', None, None, None, 'test2', 'skipped', 'message', None, None)
+        case4 = UnitTestCase('result', 'file', 1, 'class', 'test1', 'failure', 'message', 'content', 3.5)
+
+        results = SpilledUnitTestCaseResults()
+        self.assertEqual(0, len(results))
+        self.assertFalse(results)
+        self.assertEqual([], list(results.items()))
+
+        for key, case in [(('file', 'class', 'test1'), case1), (('file', 'class', 'test1'), case2),
+                          ((None, None, 'test2'), case3), (('file', 'class', 'test1'), case4)]:
+            results.add(key, case)
+
+        self.assertEqual(2, len(results))
+        self.assertEqual([('file', 'class', 'test1'), (None, None, 'test2')], list(results.keys()))
+        self.assertIn((None, None, 'test2'), results)
+        self.assertNotIn((None, None, 'test3'), results)
+        with self.assertRaises(KeyError):
+            results[(None, None, 'test3')]
+
+        expected = [
+            (('file', 'class', 'test1'), {'failure': [case1, case4], 'success': [case2]}),
+            ((None, None, 'test2'), {'skipped': [case3]})
+        ]
+        self.assertEqual(expected, list(results.items()))
+        self.assertEqual(['failure', 'success'], list(results[('file', 'class', 'test1')].keys()))
+        self.assertEqual(expected[0][1], results[('file', 'class', 'test1')])
+        self.assertEqual([states for _, states in expected], list(results.values()))
+        results.close()
+
+    def test_spilled_unit_test_case_results_sort(self):
+        results = SpilledUnitTestCaseResults()
+        for test in ['test3', 'test1', 'test2', 'test1']:
+            results.add((None, 'class', test), UnitTestCase('result', None, None, 'class', test, 'success', None, None, None))
+        self.assertFalse(results.is_sorted)
+
+        results.sort(lambda key: key[2])
+        self.assertTrue(results.is_sorted)
+        self.assertEqual(['test1', 'test2', 'test3'], [test for _, _, test in results.keys()])
+        self.assertEqual([('test1', 2), ('test2', 1), ('test3', 1)],
+                         [(key[2], len(states['success'])) for key, states in results.items()])
+        results.close()
+
+    def test_spilled_unit_test_case_results_remove_result_file(self):
+        results = SpilledUnitTestCaseResults()
+        for result_file, test in [('result1', 'test1'), ('result2', 'test1'), ('result2', 'test2')]:
+            results.add((None, 'class', test), UnitTestCase(result_file, None, None, 'class', test, 'success', None, None, None))
+
+        results.remove_result_file('result2')
+        self.assertEqual([((None, 'class', 'test1'), ['result1'])],
+                         [(key, [case.result_file for case in states['success']]) for key, states in results.items()])
+        # tests added later do not reuse the ids of removed tests
+        results.add((None, 'class', 'test3'), UnitTestCase('result3', None, None, 'class', 'test3', 'success', None, None, None))
+        self.assertEqual([(None, 'class', 'test1'), (None, 'class', 'test3')], [key for key, _ in results.items()])
+        results.close()
+
+    def test_get_case_size(self):
+        message = 'message' * 10
+        case1 = UnitTestCase('result', 'file', 1, 'class', 'test1', 'failure', message, None, 1.0)
+        case2 = UnitTestCase('result', 'file', 1, 'class', 'test2', 'failure', message, None, 1.0)
+        charged = set()
+        size1 = get_case_size(case1, charged)
+        size2 = get_case_size(case2, charged)
+        # strings shared by cases are charged to the first case only, test names to every case
+        self.assertEqual(size1 - sys.getsizeof('result') - sys.getsizeof('file') - sys.getsizeof('class') - sys.getsizeof(message), size2)
+        self.assertEqual(sys.getsizeof(case2) + sys.getsizeof('test2'), size2)
+
+    def test_unit_test_index_spills_over_memory_budget(self):
+        parsed = parse_files(['files/junit.fail.xml', 'files/go-test.json', 'files/perl.tap']).with_commit('commit')
+
+        index = UnitTestIndex(False, memory_budget=2000)
+        for case in parsed.cases[:3]:
+            index.add(case)
+        self.assertFalse(index.spilled)
+        for case in parsed.cases[3:]:
+            index.add(case)
+        self.assertTrue(index.spilled)
+
+        expected = get_test_results(parsed, False)
+        actual = get_test_results(parsed, False, memory_budget=2000)
+        self.assertIsInstance(actual.case_results, SpilledUnitTestCaseResults)
+        self.assertEqual(list(expected.case_results.items()), list(actual.case_results.items()))
+        self.assertEqual((expected.tests, expected.tests_skipped, expected.tests_failures, expected.tests_errors),
+                         (actual.tests, actual.tests_skipped, actual.tests_failures, actual.tests_errors))
+
+        # annotations and test lists stream over the spilled cases
+        for report_individual_runs in [False, True]:
+            self.assertEqual(get_case_annotations(expected.case_results, report_individual_runs),
+                             get_case_annotations(actual.case_results, report_individual_runs))
+        self.assertEqual(get_all_tests_list(expected.case_results), get_all_tests_list(actual.case_results))
+        self.assertEqual(get_skipped_tests_list(expected.case_results), get_skipped_tests_list(actual.case_results))
+
+    def test_unit_test_index_releases_strings_once_spilled(self):
+        # a str subclass can be referenced weakly, which tells whether anything holds the string
+        class Content(str):
+            pass
+
+        index = UnitTestIndex(False, memory_budget=100000)
+        contents = []
+        for i in range(2000):
+            content = index.intern(Content(f'stack trace {i}\n' * 20))
+            contents.append(weakref.ref(content))
+            index.add(UnitTestCase('result', None, None, index.intern('class'), f'test{i}', 'failure', index.intern('message'), content, None))
+            del content
+        gc.collect()
+
+        self.assertTrue(index.spilled)
+        # neither the intern nor the index hold strings of cases added before or after spilling
+        self.assertEqual(0, len(index.intern))
+        self.assertEqual([], [content() for content in contents if content() is not None])
+        self.assertEqual(2000, sum([len(states['failure']) for _, states in index.case_results.items()]))
+
+    def test_unit_test_index_removes_cases_of_invalid_files(self):
+        expected = parse_files(['files/node.tap']).with_commit('commit')
+
+        # perl.tap exceeds the limit of cases after some of its cases have been emitted to the index
+        for memory_budget in [None, 1000]:
+            with self.subTest(memory_budget=memory_budget):
+                index = UnitTestIndex(False, memory_budget=memory_budget)
+                parsed = parse_files(['files/perl.tap', 'files/node.tap'], limits=ParseLimits(max_cases=5),
+                                     emit=index.add, rollback=index.remove_result_file).with_commit('commit')
+                self.assertEqual(['File exceeds limit of 5 test cases.'], [error.message for error in parsed.errors])
+                self.assertEqual(memory_budget is not None, index.spilled)
+
+                actual = index.get_test_results(parsed)
+                self.assertEqual(list(get_test_results(expected, False).case_results.items()), list(actual.case_results.items()))
+                self.assertEqual((3, 1, 1), (actual.cases, actual.cases_failures, actual.cases_errors))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import unittest
+
+from publish.tap import parse_tap_files, is_tap_file, get_yaml_scalar, TapTestPoints
+from publish.unittestresults import ParsedUnitTestResults, UnitTestCase, ParseError, ParseLimits
+
+
+class TestTap(unittest.TestCase):
+
+    def test_is_tap_file(self):
+        for file, expected in [('file.tap', True), ('dir/file.TAP', True), ('file.xml', False), ('file', False)]:
+            with self.subTest(file=file):
+                self.assertEqual(expected, is_tap_file(file))
+
+    def test_parse_tap_files_with_perl_file(self):
+        self.assertEqual(
+            parse_tap_files(['files/perl.tap']),
+            ParsedUnitTestResults(
+                files=1,
+                errors=[],
+                suites=1,
+                suite_tests=6,
+                suite_skipped=2,
+                suite_failures=2,
+                suite_errors=0,
+                suite_time=1,
+                cases=[
+                    UnitTestCase(result_file='files/perl.tap', test_file=None, line=None, class_name='perl', test_name='Input file opened', result='success', message=None, content=None, time=None),
+                    UnitTestCase(result_file='files/perl.tap', test_file=None, line=None, class_name='perl', test_name='First line of the input valid', result='failure', message='First line invalid', content="message: 'First line invalid'\nseverity: fail\ndata:\n  got: 'Flirble'\n  expect: 'Fnible'", time=None),
+                    UnitTestCase(result_file='files/perl.tap', test_file=None, line=None, class_name='perl', test_name='Read the rest of the file', result='skipped', message='no file', content=None, time=None),
+                    UnitTestCase(result_file='files/perl.tap', test_file=None, line=None, class_name='perl', test_name='Summarized correctly', result='skipped', message='Not written yet', content=None, time=None),
+                    UnitTestCase(result_file='files/perl.tap', test_file=None, line=None, class_name='perl', test_name='test 5', result='success', message=None, content=None, time=None),
+                    UnitTestCase(result_file='files/perl.tap', test_file=None, line=None, class_name='perl', test_name='Multi-line message', result='failure', message='line one\nline two', content='message: |\n  line one\n  line two\nduration_ms: 1500', time=1.5),
+                ]
+            ))
+
+    def test_parse_tap_files_with_subtests_and_bail_out(self):
+        self.assertEqual(
+            parse_tap_files(['files/node.tap']),
+            ParsedUnitTestResults(
+                files=1,
+                errors=[],
+                suites=1,
+                suite_tests=3,
+                suite_skipped=0,
+                suite_failures=1,
+                suite_errors=1,
+                suite_time=0,
+                cases=[
+                    UnitTestCase(result_file='files/node.tap', test_file=None, line=None, class_name='node', test_name='arithmetic', result='failure', message=None, content='duration_ms: 12.5', time=0.0125),
+                    UnitTestCase(result_file='files/node.tap', test_file=None, line=None, class_name='node', test_name='strings', result='success', message=None, content=None, time=None),
+                    UnitTestCase(result_file='files/node.tap', test_file=None, line=None, class_name='node', test_name='Bail out!', result='error', message='database unavailable', content=None, time=None),
+                ]
+            ))
+
+    def test_parse_tap_files_with_non_tap_empty_and_non_existing_file(self):
+        self.assertEqual(
+            parse_tap_files(['files/non-tap.tap', 'files/empty.xml', 'files/does_not_exist.tap']),
+            ParsedUnitTestResults(
+                files=3,
+                errors=[
+                    ParseError('files/non-tap.tap', 'File is not a valid TAP file:\nno test points found', None, None),
+                    ParseError('files/empty.xml', 'File is empty.', None, None),
+                    ParseError('files/does_not_exist.tap', 'File does not exist.', None, None)
+                ],
+                suites=0,
+                suite_tests=0,
+                suite_skipped=0,
+                suite_failures=0,
+                suite_errors=0,
+                suite_time=0,
+                cases=[]
+            ))
+
+    def test_parse_tap_files_with_plans(self):
+        # a plan of 1..0 skips all tests
+        actual = parse_tap_files(['files/skip-all.tap'])
+        self.assertEqual(([], 1, []), (actual.errors, actual.suites, actual.cases))
+
+        # a bail out before any test point is reported as an error case
+        actual = parse_tap_files(['files/bail-out.tap'])
+        self.assertEqual([], actual.errors)
+        self.assertEqual([UnitTestCase('files/bail-out.tap', None, None, 'bail-out', 'Bail out!', 'error', 'cannot connect to database', None, None)],
+                         actual.cases)
+
+        # planned test points that are missing are reported as an error case
+        actual = parse_tap_files(['files/crashed.tap'])
+        self.assertEqual([], actual.errors)
+        self.assertEqual((3, 1), (actual.suite_tests, actual.suite_errors))
+        self.assertEqual(UnitTestCase('files/crashed.tap', None, None, 'crashed', 'Planned tests', 'error', 'Planned 6 tests, but found 2.', None, None),
+                         actual.cases[-1])
+
+        # a plan at the end of the file, or too many test points, are no different
+        cases = []
+        test_points = TapTestPoints('file.tap', cases.append)
+        for line in ['ok 1', 'ok 2', 'ok 3', '1..2']:
+            test_points.add(line)
+        test_points.close()
+        self.assertEqual(['test 1', 'test 2', 'test 3', 'Planned tests'], [case.test_name for case in cases])
+        self.assertEqual('Planned 2 tests, but found 3.', cases[-1].message)
+
+    def test_parse_tap_files_with_limits(self):
+        actual = parse_tap_files(['files/perl.tap'], limits=ParseLimits(max_file_size=100))
+        self.assertEqual([ParseError('files/perl.tap', 'File size of 424 bytes exceeds limit of 100 bytes.', None, None)], actual.errors)
+        self.assertEqual([], actual.cases)
+
+        actual = parse_tap_files(['files/perl.tap'], limits=ParseLimits(max_cases=2))
+        self.assertEqual([ParseError('files/perl.tap', 'File exceeds limit of 2 test cases.', None, None)], actual.errors)
+        # cases read before the limit was exceeded are discarded, as for JUnit files
+        self.assertEqual([], actual.cases)
+        self.assertEqual(0, actual.suites)
+
+        # cases of other files are kept
+        actual = parse_tap_files(['files/perl.tap', 'files/node.tap'], limits=ParseLimits(max_cases=4))
+        self.assertEqual([ParseError('files/perl.tap', 'File exceeds limit of 4 test cases.', None, None)], actual.errors)
+        self.assertEqual({'files/node.tap'}, {case.result_file for case in actual.cases})
+
+        # with emit, cases are passed on as they are read, the file is rolled back once it exceeds the limit
+        cases, rolled_back = [], []
+        actual = parse_tap_files(['files/perl.tap', 'files/node.tap'], limits=ParseLimits(max_cases=4),
+                                 emit=cases.append, rollback=rolled_back.append)
+        self.assertEqual(['files/perl.tap'], rolled_back)
+        self.assertEqual(['files/perl.tap'] * 4 + ['files/node.tap'] * 3, [case.result_file for case in cases])
+        self.assertEqual((1, 3, []), (actual.suites, actual.suite_tests, actual.cases))
+
+    def test_tap_test_points_emit_incrementally(self):
+        cases = []
+        test_points = TapTestPoints('dir/file.tap', cases.append)
+        test_points.add('1..3\n')
+        test_points.add('ok 1 - first\n')
+        # the test point waits for a possible YAML block
+        self.assertEqual([], cases)
+        test_points.add('ok 2 - second\n')
+        self.assertEqual(['first'], [case.test_name for case in cases])
+        test_points.add('not ok 3 - third\n')
+        test_points.add('  ---\n')
+        test_points.add('  message: "failed"\n')
+        self.assertEqual(['first', 'second'], [case.test_name for case in cases])
+        test_points.add('  ...\n')
+        self.assertEqual(['first', 'second', 'third'], [case.test_name for case in cases])
+        self.assertEqual(UnitTestCase('dir/file.tap', None, None, 'file', 'third', 'failure', 'failed', 'message: "failed"', None), cases[-1])
+        test_points.close()
+        self.assertEqual(3, len(cases))
+
+    def test_get_yaml_scalar(self):
+        lines = ["plain: value", "single: 'it''s'", 'double: "say \\"hi\\""', 'empty:',
+                 'literal: |', '  line one', '  line two', 'folded: >', '  one', '  two', 'last: 1']
+        self.assertEqual('value', get_yaml_scalar(lines, 'plain'))
+        self.assertEqual("it's", get_yaml_scalar(lines, 'single'))
+        self.assertEqual('say "hi"', get_yaml_scalar(lines, 'double'))
+        self.assertIsNone(get_yaml_scalar(lines, 'empty'))
+        self.assertEqual('line one\nline two', get_yaml_scalar(lines, 'literal'))
+        self.assertEqual('one two', get_yaml_scalar(lines, 'folded'))
+        self.assertEqual('1', get_yaml_scalar(lines, 'last'))
+        self.assertIsNone(get_yaml_scalar(lines, 'missing'))
+
+
+if __name__ == '__main__':
+    unittest.main()
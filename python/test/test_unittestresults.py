@@ -1,11 +1,29 @@
+import copy
+import dataclasses
+import glob
+import io
+import os
+import pickle
+import re
+import tempfile
+import time
 import unittest
+from typing import Optional
+from dataclasses import FrozenInstanceError
 from xml.etree.ElementTree import ParseError as XmlParseError
+from xml.sax.saxutils import quoteattr
+
+import mock
 
 from publish.unittestresults import get_test_results, get_stats, get_stats_delta, \
     ParsedUnitTestResults, ParsedUnitTestResultsWithCommit, \
     UnitTestCase, UnitTestResults, UnitTestCaseResults, \
-    UnitTestRunResults, UnitTestRunDeltaResults, ParseError
-from test import d, n
+    UnitTestRunResults, UnitTestRunDeltaResults, ParseError, UnitTestCaseFilter, ParseLimits, ParseLimitError, Interner, UnitTestIndex, \
+    UnitTestTree, sort_case_results, get_test_name, get_partition, \
+    BinaryResultsWriter, BinaryResultsReader, write_binary_results, read_binary_results, \
+    binary_results_magic, binary_results_block_size
+from publish_unit_test_results import parse_files
+from test import d, n, get_random_results
 
 errors = [ParseError('file', 'error', None, None)]
 
@@ -32,6 +50,84 @@ class TestUnitTestResults(unittest.TestCase):
         expected = ParseError('file', 'error', None, None)
         self.assertEqual(expected, actual)
 
+    def test_unit_test_case_filter_from_patterns(self):
+        self.assertIsNone(UnitTestCaseFilter.from_patterns(None, None))
+        self.assertIsNone(UnitTestCaseFilter.from_patterns('', ''))
+
+        case_filter = UnitTestCaseFilter.from_patterns('class', None)
+        self.assertEqual('class', case_filter.include.pattern)
+        self.assertIsNone(case_filter.exclude)
+
+    def test_unit_test_case_filter_matches(self):
+        include = UnitTestCaseFilter.from_patterns('integration\\.', None)
+        self.assertTrue(include.matches('integration.Class', 'test'))
+        self.assertTrue(include.matches('Class', 'integration.test'))
+        self.assertFalse(include.matches('unit.integration.Class', 'test'))
+        self.assertFalse(include.matches(None, None))
+
+        exclude = UnitTestCaseFilter.from_patterns(None, '.*Flaky')
+        self.assertTrue(exclude.matches('Class', 'test'))
+        self.assertTrue(exclude.matches(None, None))
+        self.assertFalse(exclude.matches('FlakyClass', 'test'))
+        self.assertFalse(exclude.matches('Class', 'testFlaky'))
+
+        both = UnitTestCaseFilter.from_patterns('integration', '.*Flaky')
+        self.assertTrue(both.matches('integration.Class', 'test'))
+        self.assertFalse(both.matches('integration.Class', 'testFlaky'))
+        self.assertFalse(both.matches('unit.Class', 'test'))
+
+    def test_parse_limits_count_cases(self):
+        cases = []
+        emit = ParseLimits(max_cases=2).count_cases(cases.append)
+        emit('case 1')
+        emit('case 2')
+        with self.assertRaises(ParseLimitError) as e:
+            emit('case 3')
+        self.assertEqual('File exceeds limit of 2 test cases.', str(e.exception))
+        self.assertEqual(['case 1', 'case 2'], cases)
+
+    def test_parse_limits_defaults(self):
+        # valid result files of any size are not limited
+        limits = ParseLimits()
+        self.assertIs(list.append, limits.count_cases(list.append))
+        limits.check_cases(100 * 1000 * 1000)
+        with mock.patch('os.stat', return_value=mock.Mock(st_size=100 * 1024 * 1024 * 1024)):
+            limits.check_file_size('file')
+            # text is not limited below the size of the file
+            self.assertEqual(100 * 1024 * 1024 * 1024, limits.get_max_text_size('file'))
+            self.assertEqual(100 * 1024 * 1024 * 1024, ParseLimits(max_text_size=100).get_max_text_size('file'))
+        with mock.patch('os.stat', return_value=mock.Mock(st_size=100)):
+            self.assertEqual(256 * 1024 * 1024, limits.get_max_text_size('file'))
+
+    def test_unit_test_case_and_parse_error_slots(self):
+        for instance in [UnitTestCase('result', 'test', 1, 'class', 'test', 'failure', 'message', 'content', 1.0),
+                         ParseError('file', 'message', 1, 2)]:
+            with self.subTest(instance=instance):
+                self.assertFalse(hasattr(instance, '__dict__'))
+                with self.assertRaises(FrozenInstanceError):
+                    instance.line = 3
+                self.assertEqual(instance, pickle.loads(pickle.dumps(instance)))
+                self.assertEqual(instance, copy.deepcopy(instance))
+                self.assertEqual(hash(instance), hash(copy.copy(instance)))
+
+    def test_interner(self):
+        intern = Interner()
+        self.assertIsNone(intern(None))
+
+        first = ''.join(['message'] * 3)
+        second = ''.join(['message'] * 3)
+        self.assertIsNot(first, second)
+        self.assertIs(first, intern(first))
+        self.assertIs(first, intern(second))
+        self.assertEqual('other', intern('other'))
+        self.assertEqual(2, len(intern))
+
+        # a released interner holds no strings
+        intern.release()
+        self.assertEqual(0, len(intern))
+        self.assertIs(second, intern(second))
+        self.assertEqual(0, len(intern))
+
     def test_parsed_unit_test_results_with_commit(self):
         self.assertEqual(
             ParsedUnitTestResultsWithCommit(
@@ -65,6 +161,26 @@ class TestUnitTestResults(unittest.TestCase):
             ).with_commit('commit sha')
         )
 
+    def test_results_share_errors_and_cases(self):
+        cases = [UnitTestCase(result_file='result', test_file='test', line=123, class_name='class1', test_name='test1', result='success', message='message1', content='content1', time=1)]
+        parsed = ParsedUnitTestResults(
+            files=1,
+            errors=errors,
+            suites=1, suite_tests=1, suite_skipped=0, suite_failures=0, suite_errors=0, suite_time=1,
+            cases=cases
+        )
+
+        with_commit = parsed.with_commit('commit sha')
+        self.assertIs(errors, with_commit.errors)
+        self.assertIs(cases, with_commit.cases)
+
+        results = get_test_results(with_commit, False)
+        self.assertIs(errors, results.errors)
+        self.assertIs(cases[0], results.case_results[(None, 'class1', 'test1')]['success'][0])
+
+        run_errors = [ParseError('file', 'other error', None, None)]
+        self.assertIs(run_errors, get_stats(results).with_errors(run_errors).errors)
+
     def test_unit_test_run_results_to_dict(self):
         actual = UnitTestRunResults(
             files=1, errors=errors, suites=2, duration=3,
@@ -287,6 +403,232 @@ class TestUnitTestResults(unittest.TestCase):
             commit='commit'
         ))
 
+    def test_unit_test_index(self):
+        index = UnitTestIndex(dedup_classes_by_file_name=False)
+        self.assertEqual(0, index.tests)
+
+        def case(test_name: str, result: str, time: float = 1.0) -> UnitTestCase:
+            return UnitTestCase(result_file='result', test_file='file', line=None, class_name='class',
+                                test_name=test_name, result=result, message=None, content=None, time=time)
+
+        # cases held in memory are counted only once all cases have been added
+        index.add(case('test1', 'skipped'))
+        self.assertEqual(0, index.tests)
+        index.count()
+        # cases of the last result file are counted apart until they cannot be removed any more
+        self.assertEqual(0, index.tests)
+        index.count_file()
+        self.assertEqual({(None, 'class', 'test1'): 'skipped'}, index.test_states)
+        self.assertEqual({'skipped': 1}, dict(index.tests_per_state))
+
+        # once counted, the test state is aggregated as cases come in
+        for result in ['success', 'skipped', 'failure', 'success', 'error', 'failure']:
+            index.add(case('test1', result))
+            index.count_file()
+            self.assertEqual(1, index.tests)
+            self.assertEqual(1, sum(index.tests_per_state.values()))
+
+        index.add(case('test2', 'success', None))
+        index.count_file()
+        self.assertEqual(2, index.tests)
+        self.assertEqual({(None, 'class', 'test1'): 'error', (None, 'class', 'test2'): 'success'}, index.test_states)
+        self.assertEqual({'error': 1, 'success': 1}, {state: count for state, count in index.tests_per_state.items() if count})
+        self.assertEqual({'skipped': 2, 'success': 3, 'failure': 2, 'error': 1}, dict(index.cases_per_state))
+        self.assertEqual(7.0, index.cases_time)
+        self.assertEqual(['skipped', 'success', 'failure', 'error'], list(index.case_results[(None, 'class', 'test1')].keys()))
+        self.assertEqual(2, len(index.case_results[(None, 'class', 'test1')]['skipped']))
+
+    def test_unit_test_index_remove_result_file(self):
+        def case(result_file: str, test_name: str, result: str) -> UnitTestCase:
+            return UnitTestCase(result_file=result_file, test_file=None, line=None, class_name='class',
+                                test_name=test_name, result=result, message=None, content=None, time=1.0)
+
+        for counted in [False, True]:
+            with self.subTest(counted=counted):
+                index = UnitTestIndex(dedup_classes_by_file_name=False, partition_by=re.compile('^[^/]+'), tree=True)
+                index.add(case('a/result', 'test1', 'success'))
+                if counted:
+                    index.count()
+                index.add(case('b/result', 'test1', 'failure'))
+                index.add(case('b/result', 'test2', 'error'))
+                # only cases of the last result file can be removed
+                index.remove_result_file('a/result')
+                index.remove_result_file('b/result')
+                index.add(case('c/result', 'test3', 'skipped'))
+
+                parsed = ParsedUnitTestResultsWithCommit(
+                    files=3, errors=[], suites=0, suite_tests=0, suite_skipped=0, suite_failures=0, suite_errors=0, suite_time=0,
+                    cases=[], commit='commit'
+                )
+                results = index.get_test_results(parsed)
+                self.assertEqual([(None, 'class', 'test1'), (None, 'class', 'test3')], list(results.case_results.keys()))
+                self.assertEqual({'success': 1, 'skipped': 1}, dict(index.cases_per_state))
+                self.assertEqual({(None, 'class', 'test1'): 'success', (None, 'class', 'test3'): 'skipped'}, index.test_states)
+                self.assertEqual((2, 0, 0, 2.0), (results.cases, results.cases_failures, results.cases_errors, results.cases_time))
+                self.assertEqual(['a', 'c'], sorted(results.partitions))
+                self.assertEqual({'success': 1, 'skipped': 1}, dict(results.tree.get('class').cases))
+
+    def test_sort_case_results(self):
+        def case(test_file: Optional[str], class_name: Optional[str], test_name: Optional[str]) -> UnitTestCase:
+            return UnitTestCase(result_file='result', test_file=test_file, line=None, class_name=class_name,
+                                test_name=test_name, result='success', message=None, content=None, time=None)
+
+        keys = [('file', 'class', 'test'), (None, 'class', 'test2'), (None, None, 'b test'), (None, 'class', 'test1'), (None, None, None)]
+        case_results = UnitTestCaseResults([(key, dict(success=[case(*key)])) for key in keys])
+        self.assertFalse(case_results.is_sorted)
+
+        actual = sort_case_results(case_results)
+        self.assertTrue(actual.is_sorted)
+        self.assertEqual(case_results, actual)
+        self.assertEqual([(None, None, None), (None, None, 'b test'), (None, 'class', 'test1'), (None, 'class', 'test2'), ('file', 'class', 'test')],
+                         list(actual.keys()))
+        names = [get_test_name(*key) for key in actual.keys()]
+        self.assertEqual(sorted(names), names)
+
+    def test_get_test_results_are_sorted(self):
+        cases = [UnitTestCase(result_file='result', test_file='file', line=None, class_name=f'class{index % 3}',
+                              test_name=f'test{index}', result='success', message=None, content=None, time=None)
+                 for index in [5, 3, 1, 4, 2, 0]]
+        parsed = ParsedUnitTestResultsWithCommit(
+            files=1, errors=[], suites=1, suite_tests=6, suite_skipped=0, suite_failures=0, suite_errors=0, suite_time=0,
+            cases=cases, commit='commit'
+        )
+        for dedup in [False, True]:
+            with self.subTest(dedup=dedup):
+                results = get_test_results(parsed, dedup)
+                self.assertTrue(results.case_results.is_sorted)
+                self.assertEqual(['class0 test0', 'class0 test3', 'class1 test1', 'class1 test4', 'class2 test2', 'class2 test5'],
+                                 [f'{class_name} {test_name}' for _, class_name, test_name in results.case_results.keys()])
+
+    def test_get_partition(self):
+        self.assertEqual('linux/py3.8', get_partition(re.compile(r'test-results-([^-/]+)-([^/]+)/'), 'artifacts/test-results-linux-py3.8/junit.xml'))
+        self.assertEqual('linux', get_partition(re.compile(r'test-results-(linux|windows)(-debug)?/'), 'artifacts/test-results-linux/junit.xml'))
+        self.assertEqual('packages/core', get_partition(re.compile(r'packages/[^/]+'), 'packages/core/build/junit.xml'))
+        self.assertIsNone(get_partition(re.compile(r'packages/[^/]+'), 'build/junit.xml'))
+
+    def test_get_test_results_with_partitions(self):
+        def case(result_file: str, test_name: str, result: str, time: float = 1.0) -> UnitTestCase:
+            return UnitTestCase(result_file=result_file, test_file=None, line=None, class_name='class',
+                                test_name=test_name, result=result, message=None, content=None, time=time)
+
+        parsed = ParsedUnitTestResultsWithCommit(
+            files=4,
+            errors=[ParseError('linux/broken.xml', 'error', None, None), ParseError('mac/broken.xml', 'error', None, None)],
+            suites=3, suite_tests=6, suite_skipped=1, suite_failures=1, suite_errors=0, suite_time=6,
+            cases=[
+                case('linux/a.xml', 'test1', 'success'),
+                case('linux/a.xml', 'test2', 'failure', 2.5),
+                case('linux/b.xml', 'test1', 'success'),
+                case('windows/a.xml', 'test1', 'success'),
+                case('windows/a.xml', 'test2', 'skipped'),
+                case('other.xml', 'test1', 'success'),
+            ],
+            commit='commit'
+        )
+
+        self.assertIsNone(get_test_results(parsed, False).partitions)
+
+        results = get_test_results(parsed, False, partition_by=re.compile('^([^/]+)/'))
+        self.assertEqual(['linux', 'mac', 'windows'], list(results.partitions.keys()))
+        self.assertEqual(UnitTestRunResults(
+            files=2, errors=[ParseError('linux/broken.xml', 'error', None, None)], suites=0, duration=4,
+            tests=2, tests_succ=1, tests_skip=0, tests_fail=1, tests_error=0,
+            runs=3, runs_succ=2, runs_skip=0, runs_fail=1, runs_error=0,
+            commit='commit'
+        ), results.partitions['linux'])
+        self.assertEqual(UnitTestRunResults(
+            files=0, errors=[ParseError('mac/broken.xml', 'error', None, None)], suites=0, duration=0,
+            tests=0, tests_succ=0, tests_skip=0, tests_fail=0, tests_error=0,
+            runs=0, runs_succ=0, runs_skip=0, runs_fail=0, runs_error=0,
+            commit='commit'
+        ), results.partitions['mac'])
+        self.assertEqual(UnitTestRunResults(
+            files=1, errors=[], suites=0, duration=2,
+            tests=2, tests_succ=1, tests_skip=1, tests_fail=0, tests_error=0,
+            runs=2, runs_succ=1, runs_skip=1, runs_fail=0, runs_error=0,
+            commit='commit'
+        ), results.partitions['windows'])
+        # partitions do not change totals
+        self.assertEqual(get_test_results(parsed, False), results)
+
+    def test_unit_test_tree(self):
+        def case(class_name: Optional[str], test_name: str, result: str, time: Optional[float] = 1.0) -> UnitTestCase:
+            return UnitTestCase(result_file='result', test_file='file', line=None, class_name=class_name,
+                                test_name=test_name, result=result, message=None, content=None, time=time)
+
+        results = get_test_results(ParsedUnitTestResultsWithCommit(
+            files=1,
+            errors=[],
+            suites=1, suite_tests=6, suite_skipped=0, suite_failures=0, suite_errors=0, suite_time=0,
+            cases=[
+                case('com.example.FooTest', 'test1', 'success'),
+                case('com.example.FooTest', 'test1', 'failure', 2.0),
+                case('com.example.FooTest', 'test2', 'disabled', None),
+                case('com.example.BarTest', 'test1', 'error', 0.5),
+                case('com.other.BazTest', 'test1', 'skipped'),
+                case(None, 'test1', 'success'),
+            ],
+            commit='commit'
+        ), False, tree=True)
+
+        tree = results.tree
+        self.assertEqual({'success': 2, 'failure': 1, 'skipped': 2, 'error': 1}, dict(tree.root.cases))
+        self.assertEqual(5.5, tree.root.time)
+        # the root holds the same numbers as the results
+        self.assertEqual(results.tests, sum(tree.root.tests.values()))
+        self.assertEqual((results.tests_skipped, results.tests_failures, results.tests_errors),
+                         (tree.root.tests['skipped'], tree.root.tests['failure'], tree.root.tests['error']))
+
+        example = tree.get('com.example')
+        self.assertEqual({'failure': 1, 'skipped': 1, 'error': 1}, {state: count for state, count in example.tests.items() if count})
+        self.assertEqual(4, sum(example.cases.values()))
+        self.assertEqual(3.5, example.time)
+        self.assertIs(tree.root, tree.get(None))
+        self.assertIsNone(tree.get('com.unknown'))
+
+        self.assertEqual({
+            'cases': {'success': 2, 'skipped': 2, 'failure': 1, 'error': 1},
+            'tests': {'success': 1, 'skipped': 2, 'failure': 1, 'error': 1},
+            'time': 5.5,
+            'children': {
+                'com': {
+                    'cases': {'success': 1, 'skipped': 2, 'failure': 1, 'error': 1},
+                    'tests': {'skipped': 2, 'failure': 1, 'error': 1},
+                    'time': 4.5,
+                    'children': {
+                        'example': {
+                            'cases': {'success': 1, 'skipped': 1, 'failure': 1, 'error': 1},
+                            'tests': {'skipped': 1, 'failure': 1, 'error': 1},
+                            'time': 3.5,
+                            'children': {
+                                'FooTest': {'cases': {'success': 1, 'skipped': 1, 'failure': 1}, 'tests': {'skipped': 1, 'failure': 1}, 'time': 3.0},
+                                'BarTest': {'cases': {'error': 1}, 'tests': {'error': 1}, 'time': 0.5}
+                            }
+                        },
+                        'other': {
+                            'cases': {'skipped': 1}, 'tests': {'skipped': 1}, 'time': 1.0,
+                            'children': {'BazTest': {'cases': {'skipped': 1}, 'tests': {'skipped': 1}, 'time': 1.0}}
+                        }
+                    }
+                }
+            }
+        }, tree.to_dict())
+
+    def test_unit_test_tree_only_when_requested(self):
+        parsed = get_random_results(100, 10)
+        self.assertIsNone(get_test_results(parsed, False).tree)
+        self.assertIsNotNone(get_test_results(parsed, False, tree=True).tree)
+        # the tree does not change the results
+        self.assertEqual(get_test_results(parsed, False), get_test_results(parsed, False, tree=True))
+
+    def test_unit_test_tree_add_class(self):
+        tree = UnitTestTree()
+        tree.add_class('package.Class', {'success': 3, 'failure': 1}, {'success': 2}, 1.5)
+        tree.add_class('package.Other', {'skipped': 1}, {'skipped': 1}, 0.0)
+        self.assertEqual({'success': 3, 'failure': 1, 'skipped': 1}, dict(tree.get('package').cases))
+        self.assertEqual({'success': 2, 'skipped': 1}, dict(tree.root.tests))
+        self.assertEqual(1.5, tree.root.time)
+
     def test_get_stats(self):
         self.assertEqual(get_stats(UnitTestResults(
             files=1,
@@ -394,3 +736,101 @@ class TestUnitTestResults(unittest.TestCase):
             reference_commit='ref',
             reference_type='type'
         ))
+
+    def test_binary_results_round_trip(self):
+        parsed = parse_files(sorted(glob.glob('files/*')))
+        self.assertGreater(len(parsed.cases), 0)
+        self.assertGreater(len(parsed.errors), 0)
+        for compress_text in [True, False]:
+            for block_size in [1, 7, binary_results_block_size]:
+                with self.subTest(compress_text=compress_text, block_size=block_size):
+                    stream = io.BytesIO()
+                    writer = BinaryResultsWriter(stream, compress_text, block_size)
+                    for case in parsed.cases:
+                        writer.add(case)
+                    writer.finish(parsed)
+
+                    actual = read_binary_results(io.BytesIO(stream.getvalue()))
+                    self.assertEqual(parsed, actual)
+
+        # equal strings are read as one instance
+        stream = io.BytesIO()
+        write_binary_results(stream, parsed)
+        actual = read_binary_results(io.BytesIO(stream.getvalue()))
+        self.assertEqual(1, len({id(case.result) for case in actual.cases if case.result == 'success'}))
+
+    def test_binary_results_values(self):
+        cases = [
+            UnitTestCase(result_file=None, test_file=None, line=None, class_name=None, test_name=None,
+                         result=None, message=None, content=None, time=None),
+            UnitTestCase(result_file='résult', test_file='file', line=-1, class_name='class', test_name='test 🙂',
+                         result='failure', message='message', content='content\n' * 100, time=-0.5),
+            UnitTestCase(result_file='résult', test_file='file', line=2 ** 40, class_name='class', test_name='test',
+                         result='success', message='', content='', time=1e-9),
+        ]
+        parsed = ParsedUnitTestResults(files=1, errors=[ParseError('file', 'error', -1, None)], suites=2 ** 33,
+                                       suite_tests=3, suite_skipped=0, suite_failures=1, suite_errors=0, suite_time=0,
+                                       cases=cases)
+        stream = io.BytesIO()
+        write_binary_results(stream, parsed)
+        self.assertEqual(parsed, read_binary_results(io.BytesIO(stream.getvalue())))
+
+    def test_binary_results_reader_streams(self):
+        parsed = parse_files(['files/junit.fail.xml', 'files/perl.tap'])
+        stream = io.BytesIO()
+        writer = BinaryResultsWriter(stream, block_size=2)
+        for case in parsed.cases:
+            writer.add(case)
+        writer.finish(parsed)
+        stream.seek(0)
+
+        reader = BinaryResultsReader(stream)
+        cases = iter(reader)
+        self.assertEqual(parsed.cases[0], next(cases))
+        # statistics are known once all cases have been read
+        self.assertIsNone(reader.results)
+        self.assertEqual(parsed.cases[1:], list(cases))
+        self.assertEqual(dataclasses.replace(parsed, cases=[]), reader.results)
+
+    def test_binary_results_invalid(self):
+        parsed = parse_files(['files/junit.fail.xml'])
+        stream = io.BytesIO()
+        write_binary_results(stream, parsed)
+        data = stream.getvalue()
+
+        for content, expected in [(b'<?xml version="1.0"?>', 'Not binary results'),
+                                  (binary_results_magic + b'\x02\x00', 'Unsupported version of binary results: 2'),
+                                  (data[:len(data) // 2], 'Binary results are truncated'),
+                                  (data[:-1], 'Binary results are truncated')]:
+            with self.subTest(content=content[:8]):
+                with self.assertRaises(ValueError) as e:
+                    read_binary_results(io.BytesIO(content))
+                self.assertEqual(expected, str(e.exception))
+
+    def test_binary_results_throughput(self):
+        # binary results are smaller and faster to read than the equivalent JUnit XML file
+        cases = get_random_results(20000, 2000).cases
+        with tempfile.TemporaryDirectory() as path:
+            filename = os.path.join(path, 'results.xml')
+            with open(filename, 'wt', encoding='utf-8') as w:
+                w.write('<testsuite>')
+                for case in cases:
+                    w.write(f'<testcase classname={quoteattr(case.class_name)} name={quoteattr(case.test_name)} '
+                            f'file={quoteattr(case.test_file)} time="{case.time or 0}"/>')
+                w.write('</testsuite>')
+
+            start = time.perf_counter()
+            parsed = parse_files([filename])
+            parse_seconds = time.perf_counter() - start
+
+            stream = io.BytesIO()
+            write_binary_results(stream, parsed)
+            data = stream.getvalue()
+
+            start = time.perf_counter()
+            actual = read_binary_results(io.BytesIO(data))
+            read_seconds = time.perf_counter() - start
+
+            self.assertEqual(parsed, actual)
+            self.assertLess(len(data), os.path.getsize(filename) / 2)
+            self.assertLess(read_seconds, parse_seconds)